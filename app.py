@@ -1,9 +1,11 @@
-from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify, flash, send_file
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, send_file, abort, make_response, Response, g
+import base64
+import json
 import os
+import threading
+from datetime import date
 from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from typing import Optional
 USE_SHEETS = os.environ.get('SHEETS_ENABLED', '0') == '1'
 if USE_SHEETS:
     from sheets_db import (
@@ -27,13 +29,11 @@ else:
         get_user_by_roll,
         upsert_user_with_auth,
         list_students,
+        list_faculties,
         create_session,
-        list_sessions,
-        list_sessions_for_faculty,
         get_session,
         session_attendance_roster,
         mark_session_attendance,
-        unmark_session_attendance,
         student_attendance_summary,
         set_user_password,
         delete_all_sessions,
@@ -42,14 +42,31 @@ else:
         student_subject_summary,
         list_faculty_subjects,
         count_sessions_for,
+        list_students_with_sessions_on,
+        page_sessions,
+        page_students,
+        set_session_attendance,
+        UnknownStudents,
+        toggle_session_attendance,
     )
-from qr_generator import generate_qr_for_user
+from qr_payload import ROTATE_SECONDS, check_scan, encode_payload, encode_token, replay_stats
+import qr_cache
+import reports
+from scan_batcher import batcher
+import metrics
+import passwords
+from passwords import VerifyBusy, hash_password, verify_password
+from live_events import BUSY_RETRY_MS, HEARTBEAT_SECONDS, LIVE_MAX_STREAMS, hub as live_hub
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-change')
 
-# Ensure folders
-os.makedirs('qrcodes', exist_ok=True)
+# Browser cache lifetime for QR images; ETags revalidate after that
+QR_MAX_AGE = int(os.environ.get('QR_MAX_AGE', '300'))
+# Show the rotating token QR on the student dashboard instead of the static code
+QR_ROTATING = os.environ.get('QR_ROTATING', '1') == '1'
+# Processes rendering a bulk report ZIP (0 = one per CPU)
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '0')) or None
 
 # Initialize DB once per process (avoids repeated writes during login)
 @app.before_first_request
@@ -58,13 +75,28 @@ def _setup_db_once():
         init_db()
     except Exception:
         pass
+    # Optionally render today's enrolled students' QR codes in the background
+    if os.environ.get('QR_PREWARM', '0') == '1':
+        threading.Thread(target=prewarm_qr_cache, daemon=True).start()
+
+
+def prewarm_qr_cache() -> int:
+    try:
+        return qr_cache.prewarm(list_students_with_sessions_on(date.today().isoformat()))
+    except Exception:
+        return 0
 
 
 def current_user():
     uid = session.get('user_id')
     if not uid:
         return None
+    # require_role, is_admin and the view all ask; look the row up once per request
+    cached = g.get('current_user')
+    if cached is not None and cached[0] == uid:
+        return cached[1]
     row = get_user_auth(uid)
+    g.current_user = (uid, row)
     return row
 
 def is_admin() -> bool:
@@ -87,6 +119,29 @@ def require_role(role):
     return decorator
 
 
+def _page_after() -> Optional[tuple]:
+    """Decode the ?after= keyset token of a paginated listing (None: first page)."""
+    token = request.args.get('after', '')
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode() + b'=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    return tuple(key) if isinstance(key, list) and len(key) == 2 else None
+
+
+def _page_links(next_key) -> dict:
+    """next_url/first_url for _pager.html, keeping the listing's other query parameters."""
+    args = {k: v for k, v in request.args.items() if k != 'after'}
+    next_url = None
+    if next_key:
+        token = base64.urlsafe_b64encode(json.dumps(list(next_key)).encode()).rstrip(b'=').decode()
+        next_url = url_for(request.endpoint, **request.view_args, **args, after=token)
+    first_url = url_for(request.endpoint, **request.view_args, **args) if 'after' in request.args else None
+    return {'next_url': next_url, 'first_url': first_url}
+
+
 @app.route('/')
 def index():
     user = current_user()
@@ -120,9 +175,16 @@ def login():
 
         if row:
             pw_hash = row[5]
-            if pw_hash and check_password_hash(pw_hash, password):
+            try:
+                ok = verify_password(pw_hash, password)
+            except VerifyBusy:
+                return render_template('login.html', error='Too many sign-ins right now, please retry in a moment'), 503
+            if ok:
                 session['user_id'] = row[0]
                 role = row[4]
+                if not USE_SHEETS and passwords.needs_rehash(pw_hash):
+                    # Hash parameters changed since this one was made; upgrade it off the request
+                    passwords.rehash_in_background(row[0], password, set_user_password)
                 return redirect(url_for('faculty_dashboard' if role == 'faculty' else 'student_dashboard'))
         error = 'Invalid username/roll or password'
     return render_template('login.html', error=error)
@@ -149,13 +211,10 @@ def student_dashboard():
     except Exception:
         pass
     summaries = student_subject_summary(uid)
-    # Ensure QR exists for this student
-    payload = f"{{'id':'{uid}','name':'{name}','roll':'{roll}','email':'{email}'}}"
-    qr_path = os.path.join('qrcodes', f'{uid}.png')
-    if not os.path.exists(qr_path):
-        generate_qr_for_user(uid, payload)
+    # The QR image itself is served by qr_live (rotating) or qrcodes_static (cached)
     return render_template('student_dashboard.html', user={"id": uid, "name": name, "roll": roll, "email": email},
-                           attended=attended, total=total, percentage=percentage, summaries=summaries)
+                           attended=attended, total=total, percentage=percentage, summaries=summaries,
+                           qr_rotating=QR_ROTATING, rotate_seconds=ROTATE_SECONDS)
 
 
 @app.route('/student/subjects')
@@ -169,47 +228,22 @@ def student_subjects():
 @app.route('/student/report.pdf')
 @require_role('student')
 def student_report_pdf():
-    u = current_user()
-    uid, name = u[0], u[1]
-    overall_attended, overall_total = student_attendance_summary(uid)
-    summaries = student_subject_summary(uid)
-    buf = BytesIO()
-    pdf = canvas.Canvas(buf, pagesize=A4)
-    width, height = A4
-    y = height - 50
-    pdf.setFont('Helvetica-Bold', 14)
-    pdf.drawString(40, y, 'Attendance Report')
-    pdf.setFont('Helvetica', 10)
-    y -= 18
-    pdf.drawString(40, y, f'Name: {name}   ID: {uid}')
-    y -= 16
-    pct = (overall_attended / overall_total * 100.0) if overall_total > 0 else 0.0
-    pdf.drawString(40, y, f'Overall: {overall_attended}/{overall_total} ({pct:.1f}%)')
-    y -= 24
-    pdf.setFont('Helvetica-Bold', 11)
-    pdf.drawString(40, y, 'Subject')
-    pdf.drawString(300, y, 'Attended/Total')
-    pdf.drawString(460, y, 'Percent')
-    y -= 14
-    pdf.setFont('Helvetica', 10)
-    for subject, attended, total, percent in summaries:
-        if y < 60:
-            pdf.showPage()
-            y = height - 50
-            pdf.setFont('Helvetica-Bold', 11)
-            pdf.drawString(40, y, 'Subject')
-            pdf.drawString(300, y, 'Attended/Total')
-            pdf.drawString(460, y, 'Percent')
-            y -= 14
-            pdf.setFont('Helvetica', 10)
-        pdf.drawString(40, y, str(subject))
-        pdf.drawString(300, y, f'{attended}/{total}')
-        pdf.drawString(460, y, f'{percent:.1f}%')
-        y -= 14
-    pdf.showPage()
-    pdf.save()
-    buf.seek(0)
-    return send_file(buf, mimetype='application/pdf', as_attachment=True, download_name=f'{uid}_attendance_report.pdf')
+    uid = current_user()[0]
+    # The stamp alone answers a revalidation; rendering only happens when it moved
+    etag = reports.report_etag(uid)
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+        resp.set_etag(etag)
+        return resp
+    body, etag = reports.get_report(uid)
+    if body is None:
+        abort(404)
+    resp = send_file(BytesIO(body), mimetype='application/pdf', as_attachment=True,
+                     download_name=reports.report_filename(uid), etag=False)
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
 
 
 @app.route('/student/reset-password', methods=['GET','POST'])
@@ -225,14 +259,18 @@ def student_reset_password():
         confirm_pw = request.form.get('confirm_password','')
         # Verify current
         row = get_user_auth(uid)
-        if not row or not row[5] or not check_password_hash(row[5], current_pw):
+        try:
+            current_ok = bool(row) and verify_password(row[5], current_pw)
+        except VerifyBusy:
+            return render_template('student_reset_password.html', error='Server busy, please retry in a moment'), 503
+        if not current_ok:
             error = 'Current password is incorrect'
         elif len(new_pw) < 6:
             error = 'New password must be at least 6 characters'
         elif new_pw != confirm_pw:
             error = 'New password and confirm do not match'
         else:
-            set_user_password(uid, generate_password_hash(new_pw))
+            set_user_password(uid, hash_password(new_pw))
             flash('Password updated successfully','success')
             return redirect(url_for('student_dashboard'))
     return render_template('student_reset_password.html', error=error)
@@ -241,7 +279,63 @@ def student_reset_password():
 @app.route('/qrcodes/<path:filename>')
 @require_role('student')
 def qrcodes_static(filename):
-    return send_from_directory('qrcodes', filename)
+    # <uid>.png or <uid>.svg, rendered from the user's payload via the in-memory LRU
+    uid, _, fmt = filename.rpartition('.')
+    if fmt not in qr_cache.MIMETYPES or not uid:
+        abort(404)
+    # A signed static code marks its holder present, so students only get their own
+    if uid != current_user()[0] and not is_admin():
+        abort(403)
+    if not get_user_auth(uid):
+        abort(404)
+    body, etag = qr_cache.get_qr(encode_payload(uid), fmt)
+    resp = make_response(body)
+    resp.mimetype = qr_cache.MIMETYPES[fmt]
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = QR_MAX_AGE
+    return resp.make_conditional(request)
+
+
+@app.route('/qr/live.png')
+@require_role('student')
+def qr_live():
+    # Current time-window token; never cached since it changes every ROTATE_SECONDS
+    resp = make_response(qr_cache.render_qr(encode_token(current_user()[0]), 'png'))
+    resp.mimetype = 'image/png'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@app.route('/admin/qr_cache', methods=['GET', 'POST'])
+@require_role(None)
+def admin_qr_cache():
+    """QR cache hit/miss metrics; POST pre-warms today's enrolled students."""
+    if not is_admin():
+        return redirect(url_for('index'))
+    warmed = prewarm_qr_cache() if request.method == 'POST' else None
+    return jsonify({'ok': True, 'warmed': warmed, 'stats': qr_cache.stats(), 'replay_cache': replay_stats()})
+
+
+@app.route('/admin/stats')
+@require_role(None)
+def admin_stats():
+    """Cache hit rates and queue/pool counters for this worker process."""
+    if not is_admin():
+        return redirect(url_for('index'))
+    stats = {
+        'qr_cache': qr_cache.stats(),
+        'replay_cache': replay_stats(),
+        'live': live_hub.stats(),
+        'scan_batcher': batcher.stats(),
+        'passwords': passwords.stats(),
+        'reports': reports.stats(),
+    }
+    if not USE_SHEETS:
+        from db import pool_stats, user_cache_stats
+        stats['user_cache'] = user_cache_stats()
+        stats['db_pool'] = pool_stats()
+    return jsonify({'ok': True, 'pid': os.getpid(), 'stats': stats})
 
 
 @app.route('/faculty')
@@ -249,8 +343,9 @@ def qrcodes_static(filename):
 def faculty_dashboard():
     u = current_user()
     faculty_id = u[0]
-    sessions = list_sessions_for_faculty(faculty_id)
-    return render_template('faculty_dashboard.html', sessions=sessions)
+    q = request.args.get('q', '').strip()
+    sessions, next_key = page_sessions(faculty_id, _page_after(), search=q or None)
+    return render_template('faculty_dashboard.html', sessions=sessions, q=q, **_page_links(next_key))
 
 
 @app.route('/faculty/session/new', methods=['GET'])
@@ -281,6 +376,71 @@ def session_detail(session_id: int):
     return render_template('session_detail.html', sess=sess, roster=roster)
 
 
+def roster_json(session_id: int) -> dict:
+    return {
+        'session_id': session_id,
+        'roster': [{'id': r[0], 'name': r[1], 'roll': r[2], 'marked': bool(r[3])}
+                   for r in session_attendance_roster(session_id)],
+    }
+
+
+@app.route('/api/session/<int:session_id>/roster')
+@require_role('faculty')
+def api_session_roster(session_id: int):
+    sess = get_session(session_id)
+    if not sess:
+        return jsonify({'ok': False, 'error': 'not_found'}), 404
+    u = current_user()
+    if not is_admin() and sess[4] and sess[4] != u[0]:
+        return jsonify({'ok': False, 'error': 'forbidden'}), 403
+    return jsonify({'ok': True, **roster_json(session_id)})
+
+
+def _sse(event: str, data) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+@app.route('/faculty/session/<int:session_id>/events')
+@require_role('faculty')
+def session_events(session_id: int):
+    """Server-sent events: a snapshot of marked ids, then mark/unmark deltas as they happen."""
+    sess = get_session(session_id)
+    if not sess:
+        abort(404)
+    u = current_user()
+    if not is_admin() and sess[4] and sess[4] != u[0]:
+        abort(403)
+    sub = live_hub.subscribe(session_id, limit=LIVE_MAX_STREAMS)
+    if sub is None:
+        # Every stream holds a request thread, so past the cap the page falls back to
+        # manual refresh: a one-shot answer that has EventSource reconnect much later
+        resp = Response(f'retry: {BUSY_RETRY_MS}\n' + _sse('busy', {'retry_ms': BUSY_RETRY_MS}),
+                        mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+
+    def stream():
+        try:
+            yield 'retry: 3000\n' + _sse('snapshot', {'marked': live_hub.snapshot(session_id)})
+            while True:
+                event = sub.get(HEARTBEAT_SECONDS)
+                if sub.overflowed:
+                    sub.overflowed = False
+                    sub.drain()
+                    yield _sse('snapshot', {'marked': live_hub.snapshot(session_id)})
+                elif event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield _sse(event['type'], event)
+        finally:
+            live_hub.unsubscribe(sub)
+
+    resp = Response(stream(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy hold events back
+    return resp
+
+
 @app.route('/faculty/session/<int:session_id>/delete', methods=['POST'])
 @require_role('faculty')
 def faculty_delete_session(session_id: int):
@@ -296,14 +456,70 @@ def faculty_delete_session(session_id: int):
     return redirect(url_for('faculty_dashboard'))
 
 
+@app.route('/faculty/export')
+@require_role('faculty')
+def faculty_export():
+    """Stream attendance as a download: ?format=csv|csv.gz|parquet|arrow&from=&to=&subject=[&faculty=&source=].
+
+    Faculty get their own sessions only; the admin may pick any faculty (or
+    none) and the webcam scanner's attendance table (source=attendance).
+    """
+    if USE_SHEETS:
+        abort(404)
+    from export import FORMATS, stream_export
+    args = request.args
+    fmt = args.get('format', 'csv')
+    source = args.get('source', 'sessions')
+    faculty_id = (args.get('faculty') or None) if is_admin() else current_user()[0]
+    if source != 'sessions' and not is_admin():
+        abort(403)
+    try:
+        chunks = stream_export(fmt, source, date_from=args.get('from') or None, date_to=args.get('to') or None,
+                               faculty_id=faculty_id, subject=args.get('subject') or None)
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 501
+    mimetype, ext = FORMATS[fmt]
+    resp = Response(chunks, mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename=attendance-{date.today().isoformat()}{ext}'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+@app.route('/faculty/reports.zip')
+@require_role('faculty')
+def faculty_reports_zip():
+    """Every enrolled student's report PDF in one streamed ZIP: ?subject= (and ?faculty= for the admin)."""
+    if USE_SHEETS:
+        abort(404)
+    from db import list_enrolled_students
+    subject = request.args.get('subject') or None
+    if is_admin():
+        faculty_id = request.args.get('faculty') or None
+        students = list_enrolled_students(faculty_id, subject) if faculty_id else list_students()
+    else:
+        faculty_id = current_user()[0]
+        students = list_enrolled_students(faculty_id, subject)
+    label = '-'.join(p.replace(' ', '_') for p in (faculty_id or 'all', subject) if p)
+    resp = Response(reports.stream_zip(reports.bulk_reports([s[0] for s in students], REPORT_WORKERS)),
+                    mimetype='application/zip')
+    resp.headers['Content-Disposition'] = f'attachment; filename=reports-{label}.zip'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
 # Admin-only routes
 @app.route('/admin/sessions')
 @require_role(None)
 def admin_sessions():
     if not is_admin():
         return redirect(url_for('faculty_dashboard'))
-    sessions = list_sessions()
-    return render_template('admin_sessions.html', sessions=sessions)
+    q = request.args.get('q', '').strip()
+    faculty_id = request.args.get('faculty', '').strip()
+    sessions, next_key = page_sessions(faculty_id or None, _page_after(), search=q or None)
+    return render_template('admin_sessions.html', sessions=sessions, q=q, faculty=faculty_id,
+                           **_page_links(next_key))
 
 
 @app.route('/admin/sessions/delete_all', methods=['POST'])
@@ -333,18 +549,12 @@ def admin_reassign_session(session_id: int):
 def admin_users():
     if not is_admin():
         return redirect(url_for('index'))
-    # list all faculty and students
-    fac = [u for u in list_students() if False]  # placeholder to keep import usage consistent
-    # Build separate queries using get_user_auth + list_students existing
-    # We will reuse the DB directly via helper list_students and a small inline query
-    from db import get_conn
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, email FROM users WHERE role='faculty' ORDER BY id")
-    faculties = cur.fetchall()
-    conn.close()
-    students = list_students()
-    return render_template('admin_users.html', faculties=faculties, students=students)
+    # Faculties are few; students are paged by roll
+    q = request.args.get('q', '').strip()
+    faculties = list_faculties()
+    students, next_key = page_students(_page_after(), search=q or None)
+    return render_template('admin_users.html', faculties=faculties, students=students, q=q,
+                           **_page_links(next_key))
 
 
 @app.route('/faculty/session/<int:session_id>/mark', methods=['POST'])
@@ -359,12 +569,52 @@ def session_mark(session_id: int):
 @app.route('/faculty/session/<int:session_id>/toggle/<user_id>', methods=['POST'])
 @require_role('faculty')
 def session_toggle(session_id: int, user_id: str):
-    # Toggle mark
-    if not mark_session_attendance(session_id, user_id):
-        unmark_session_attendance(session_id, user_id)
+    # Toggle mark (one transaction); kept for the no-JavaScript form fallback
+    marked = toggle_session_attendance(session_id, user_id)
+    if request.accept_mimetypes.best == 'application/json':
+        # fetch() from session_detail: the live roster updates the row, no reload
+        return jsonify({'ok': True, 'user_id': user_id, 'marked': marked})
     return redirect(url_for('session_detail', session_id=session_id))
 
 
+# Most ids one set-attendance request may carry
+ATTENDANCE_SET_LIMIT = 5000
+
+
+@app.route('/faculty/session/<int:session_id>/attendance', methods=['POST'])
+@require_role('faculty')
+def session_set_attendance(session_id: int):
+    """Bulk roster update in one transaction.
+
+    Body: {"present": [ids]} to make that the whole marked set, or
+    {"mark": [ids], "unmark": [ids]} to apply a diff. Ids must be students
+    on the session's roster (400 unknown_ids lists the rest). Returns the
+    ids whose state changed so the page can update in place.
+    """
+    sess = get_session(session_id)
+    if not sess:
+        return jsonify({'ok': False, 'error': 'not_found'}), 404
+    u = current_user()
+    if not is_admin() and sess[4] and sess[4] != u[0]:
+        return jsonify({'ok': False, 'error': 'forbidden'}), 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'ok': False, 'error': 'missing'}), 400
+    lists = {key: data.get(key) for key in ('present', 'mark', 'unmark') if data.get(key) is not None}
+    if not lists or ('present' in lists and len(lists) > 1):
+        return jsonify({'ok': False, 'error': 'missing'}), 400
+    if any(not isinstance(v, list) or not all(isinstance(x, str) and x for x in v) for v in lists.values()):
+        return jsonify({'ok': False, 'error': 'bad_ids'}), 400
+    if sum(len(v) for v in lists.values()) > ATTENDANCE_SET_LIMIT:
+        return jsonify({'ok': False, 'error': 'too_many'}), 413
+    try:
+        marked, unmarked = set_session_attendance(session_id, lists.get('present'),
+                                                  lists.get('mark', []), lists.get('unmark', []))
+    except UnknownStudents as exc:
+        return jsonify({'ok': False, 'error': 'unknown_ids', 'ids': exc.ids}), 400
+    return jsonify({'ok': True, 'session_id': session_id, 'marked': marked, 'unmarked': unmarked})
+
+
 @app.route('/faculty/students', methods=['GET', 'POST'])
 @require_role('faculty')
 def students_page():
@@ -375,11 +625,12 @@ def students_page():
         email = request.form.get('email', '').strip()
         role = request.form.get('role', 'student')
         password = request.form.get('password', '').strip() or 'pass123'
-        upsert_user_with_auth(user_id, name, roll, email, role, generate_password_hash(password))
+        upsert_user_with_auth(user_id, name, roll, email, role, hash_password(password))
         flash('User saved', 'success')
         return redirect(url_for('students_page'))
-    students = list_students()
-    return render_template('students.html', students=students)
+    q = request.args.get('q', '').strip()
+    students, next_key = page_students(_page_after(), search=q or None)
+    return render_template('students.html', students=students, q=q, **_page_links(next_key))
 
 
 # QR scan page for faculty using camera
@@ -392,14 +643,64 @@ def scan_page(session_id: int):
     return render_template('scan.html', sess=sess)
 
 
-def extract_id_from_payload(payload: str):
+# Upper bound on payloads accepted by one batch request
+SCAN_BATCH_LIMIT = 1000
+
+# HTTP status for each resolve_scan error
+SCAN_ERROR_STATUS = {'missing': 400, 'bad_payload': 400, 'static_disabled': 403, 'replayed': 409}
+
+
+def resolve_scan(payload, session_id):
+    """Validate one scanned item. Returns (session_id, user_id, error); error is None when valid.
+
+    Pure CPU (no database), shared by the Flask routes and asgi.py.
+    """
     try:
-        token = "'id':'"
-        start = payload.index(token) + len(token)
-        end = payload.index("'", start)
-        return payload[start:end]
-    except Exception:
-        return None
+        session_id = int(session_id)
+    except (TypeError, ValueError):
+        session_id = None
+    if not session_id:
+        return None, None, 'missing'
+    if not isinstance(payload, str) or not payload:
+        return session_id, None, 'bad_payload'
+    user_id, error = check_scan(payload, session_id)
+    return session_id, user_id, error
+
+
+def split_scan_batch(data: dict):
+    """Validate a scan_mark_batch body.
+
+    Returns (error, results, marks, slots): error is a (code, status) pair
+    for a rejected request, else results holds the per-item failures and
+    marks/slots the valid (session_id, user_id) pairs and their positions.
+    """
+    items = data.get('payloads') or []
+    default_session = data.get('session_id')
+    if not isinstance(items, list) or not items:
+        return ('missing', 400), None, None, None
+    if len(items) > SCAN_BATCH_LIMIT:
+        return ('too_many', 413), None, None, None
+    results = [None] * len(items)
+    marks = []
+    slots = []
+    for i, item in enumerate(items):
+        if isinstance(item, dict):
+            payload, session_id = item.get('payload', ''), item.get('session_id', default_session)
+        else:
+            payload, session_id = item, default_session
+        session_id, user_id, error = resolve_scan(payload, session_id)
+        if error:
+            results[i] = {'ok': False, 'error': error}
+        else:
+            marks.append((session_id, user_id))
+            slots.append(i)
+    return None, results, marks, slots
+
+
+def fill_scan_batch(results, marks, slots, marked):
+    for i, (session_id, user_id), ok in zip(slots, marks, marked):
+        results[i] = {'ok': True, 'marked': ok, 'user_id': user_id, 'session_id': session_id}
+    return results
 
 
 @app.post('/api/scan_mark')
@@ -407,16 +708,43 @@ def extract_id_from_payload(payload: str):
 def api_scan_mark():
     data = request.get_json(silent=True) or {}
     payload = data.get('payload', '')
-    session_id = data.get('session_id')
-    if not payload or not session_id:
+    if not payload:
         return jsonify({'ok': False, 'error': 'missing'}), 400
-    user_id = extract_id_from_payload(payload)
-    if not user_id:
-        return jsonify({'ok': False, 'error': 'bad_payload'}), 400
-    ok = mark_session_attendance(int(session_id), user_id)
+    session_id, user_id, error = resolve_scan(payload, data.get('session_id'))
+    if error:
+        return jsonify({'ok': False, 'error': error}), SCAN_ERROR_STATUS[error]
+    try:
+        ok = batcher.mark(session_id, user_id)
+    except Exception:
+        return jsonify({'ok': False, 'error': 'busy'}), 503
     return jsonify({'ok': True, 'marked': ok, 'user_id': user_id})
 
 
+@app.post('/api/scan_mark_batch')
+@require_role('faculty')
+def api_scan_mark_batch():
+    """Mark many scanned payloads at once.
+
+    Body: {"session_id": 1, "payloads": ["...", ...]}; items may also be
+    objects {"payload": "...", "session_id": 2} to override the session.
+    Returns one result per payload, in order.
+    """
+    error, results, marks, slots = split_scan_batch(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'ok': False, 'error': error[0]}), error[1]
+    if marks:
+        try:
+            marked = batcher.mark_many(marks)
+        except Exception:
+            return jsonify({'ok': False, 'error': 'busy'}), 503
+        fill_scan_batch(results, marks, slots, marked)
+    return jsonify({'ok': True, 'results': results})
+
+
+# Opt-in (METRICS_ENABLED=1): request timing, SQL accounting and /metrics; last so every route is covered
+metrics.install(app, authorize=is_admin)
+
+
 if __name__ == '__main__':
     init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,305 @@
+"""ASGI entry point: the hot scan/roster/live endpoints run on asyncio, the rest is Flask.
+
+    uvicorn asgi:app --workers 2 --host 0.0.0.0 --port $PORT
+
+/api/scan_mark, /api/scan_mark_batch, /api/session/<id>/roster and the
+live roster stream (/faculty/session/<id>/events) are served natively
+here, so a slow request (PDF report, CSV export) no longer ties up the
+threads scanners depend on. Blocking SQLite calls run on a dedicated,
+bounded thread pool (ASGI_DB_THREADS); marks are awaited on the scan
+batcher's futures without holding any thread. Every other route is passed
+through to the unchanged Flask app via asgiref's WsgiToAsgi.
+
+Authentication reads the same signed Flask session cookie, so both apps
+share logins and behave identically (redirects included).
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.cookies import SimpleCookie
+from typing import Optional
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+from app import (
+    SCAN_ERROR_STATUS, app as flask_app, fill_scan_batch, resolve_scan, roster_json, split_scan_batch,
+)
+from db import get_session, get_user_auth, init_db
+from live_events import HEARTBEAT_SECONDS, SUBSCRIBER_QUEUE_SIZE, Subscriber, hub as live_hub
+import metrics
+from scan_batcher import RESULT_TIMEOUT, batcher
+
+ASGI_DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '8'))
+MAX_BODY_BYTES = 1024 * 1024  # scan bodies are small; SCAN_BATCH_LIMIT payloads fit easily
+
+db_executor = ThreadPoolExecutor(max_workers=ASGI_DB_THREADS, thread_name_prefix='sqlite')
+flask_asgi = WsgiToAsgi(flask_app)
+_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+_session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+_ROSTER = re.compile(r'^/api/session/(\d+)/roster$')
+_EVENTS = re.compile(r'^/faculty/session/(\d+)/events$')
+
+
+async def run_db(fn, *args):
+    """Run a blocking db.py call on the SQLite executor."""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(fn, *args))
+
+
+class AsyncSubscriber(Subscriber):
+    """Live hub subscriber that hands events to an asyncio queue on the server's loop."""
+
+    def __init__(self, session_id: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(session_id)
+        self.loop = loop
+        self.aqueue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, event: dict):
+        # Called from whichever thread committed the mark
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _put(self, event: dict):
+        try:
+            self.aqueue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def drain(self):
+        while not self.aqueue.empty():
+            self.aqueue.get_nowait()
+
+
+async def _send(send, status: int, body: bytes, content_type: bytes = b'application/json', headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _json(send, data: dict, status: int = 200):
+    await _send(send, status, json.dumps(data).encode())
+
+
+async def _redirect(send, location: str):
+    await _send(send, 302, b'', b'text/html; charset=utf-8', [(b'location', location.encode())])
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _session_user_id(scope) -> Optional[str]:
+    """Decode the signed Flask session cookie and return its user_id (no DB access)."""
+    name = flask_app.config['SESSION_COOKIE_NAME']
+    for key, value in scope.get('headers', ()):
+        if key == b'cookie':
+            morsel = SimpleCookie(value.decode('latin-1')).get(name)
+            if morsel is None:
+                continue
+            try:
+                data = _serializer.loads(morsel.value, max_age=_session_max_age)
+            except BadSignature:
+                return None
+            return data.get('user_id')
+    return None
+
+
+async def _faculty(scope, send):
+    """Return the signed-in faculty/admin user row, or send the same redirect Flask's require_role would."""
+    uid = _session_user_id(scope)
+    user = await run_db(get_user_auth, uid) if uid else None
+    if not user:
+        await _redirect(send, '/login')
+        return None
+    if user[4] != 'faculty' and user[0] != 'jaga':
+        await _redirect(send, '/')
+        return None
+    return user
+
+
+async def _owned_session(user, session_id: int, send):
+    sess = await run_db(get_session, session_id)
+    if not sess:
+        await _json(send, {'ok': False, 'error': 'not_found'}, 404)
+        return None
+    if user[0] != 'jaga' and sess[4] and sess[4] != user[0]:
+        await _json(send, {'ok': False, 'error': 'forbidden'}, 403)
+        return None
+    return sess
+
+
+async def _body_json(receive, send) -> Optional[dict]:
+    body = await _read_body(receive)
+    if body is None:
+        await _json(send, {'ok': False, 'error': 'too_large'}, 413)
+        return None
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        data = {}
+    return data if isinstance(data, dict) else {}
+
+
+async def wait_marks(futures, timeout: float = RESULT_TIMEOUT) -> list:
+    """Await the batcher's futures without letting a timeout cancel them under the writer thread."""
+    return await asyncio.wait_for(asyncio.shield(asyncio.gather(*map(asyncio.wrap_future, futures))), timeout)
+
+
+async def scan_mark(scope, receive, send):
+    data = await _body_json(receive, send)
+    if data is None or not await _faculty(scope, send):
+        return
+    payload = data.get('payload', '')
+    if not payload:
+        return await _json(send, {'ok': False, 'error': 'missing'}, 400)
+    session_id, user_id, error = resolve_scan(payload, data.get('session_id'))
+    if error:
+        return await _json(send, {'ok': False, 'error': error}, SCAN_ERROR_STATUS[error])
+    try:
+        ok, = await wait_marks(batcher.submit_many([(session_id, user_id)]))
+    except Exception:
+        return await _json(send, {'ok': False, 'error': 'busy'}, 503)
+    await _json(send, {'ok': True, 'marked': ok, 'user_id': user_id})
+
+
+async def scan_mark_batch(scope, receive, send):
+    data = await _body_json(receive, send)
+    if data is None or not await _faculty(scope, send):
+        return
+    error, results, marks, slots = split_scan_batch(data)
+    if error:
+        return await _json(send, {'ok': False, 'error': error[0]}, error[1])
+    if marks:
+        try:
+            marked = await wait_marks(batcher.submit_many(marks))
+        except Exception:
+            return await _json(send, {'ok': False, 'error': 'busy'}, 503)
+        fill_scan_batch(results, marks, slots, marked)
+    await _json(send, {'ok': True, 'results': results})
+
+
+async def session_roster(scope, receive, send, session_id: int):
+    user = await _faculty(scope, send)
+    if user and await _owned_session(user, session_id, send):
+        await _json(send, {'ok': True, **(await run_db(roster_json, session_id))})
+
+
+def _sse(event: str, data) -> bytes:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def session_events(scope, receive, send, session_id: int):
+    """Async twin of app.session_events: one coroutine per viewer instead of one thread."""
+    user = await _faculty(scope, send)
+    if not user or not await _owned_session(user, session_id, send):
+        return
+    sub = AsyncSubscriber(session_id, asyncio.get_running_loop())
+    await run_db(live_hub.subscribe, session_id, sub)
+
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': b'retry: 3000\n' + _sse('snapshot', {'marked': live_hub.snapshot(session_id)})})
+        while not disconnected.done():
+            getter = asyncio.ensure_future(sub.aqueue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            if sub.overflowed:
+                sub.overflowed = False
+                sub.drain()
+                chunk = _sse('snapshot', {'marked': live_hub.snapshot(session_id)})
+            else:
+                event = getter.result()
+                chunk = _sse(event['type'], event)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        live_hub.unsubscribe(sub)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await run_db(init_db)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _timed(endpoint: str, handler, scope, receive, send, *args):
+    """Run a native handler, recording its latency and status like metrics does for Flask routes."""
+    if not metrics.ENABLED:
+        return await handler(scope, receive, send, *args)
+    status = 0
+
+    async def send_status(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    started = time.perf_counter()
+    try:
+        await handler(scope, receive, send_status, *args)
+    finally:
+        metrics.registry.observe_request(endpoint, scope['method'], status, time.perf_counter() - started)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    if scope['type'] == 'http':
+        path, method = scope['path'], scope['method']
+        if method == 'POST' and path == '/api/scan_mark':
+            return await _timed(path, scan_mark, scope, receive, send)
+        if method == 'POST' and path == '/api/scan_mark_batch':
+            return await _timed(path, scan_mark_batch, scope, receive, send)
+        if method == 'GET':
+            m = _ROSTER.match(path)
+            if m:
+                return await _timed('/api/session/<int:session_id>/roster', session_roster,
+                                    scope, receive, send, int(m.group(1)))
+            m = _EVENTS.match(path)
+            if m:
+                return await session_events(scope, receive, send, int(m.group(1)))
+    await flask_asgi(scope, receive, send)
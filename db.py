@@ -1,32 +1,421 @@
+import csv
+import os
 import sqlite3
-from typing import Optional, List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
 
 DB_PATH = 'attendance.db'
+# Size of sqlite3's per-connection prepared statement cache
+STATEMENT_CACHE_SIZE = 256
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False)
+_local = threading.local()
+_stats_lock = threading.Lock()
+_pool_stats = {'opened': 0, 'reused': 0, 'closed': 0, 'transactions': 0, 'rollbacks': 0}
+
+# Called as fn(session_id, user_id, marked) after a session mark/unmark changes a row
+_attendance_listeners: List[Callable[[int, str, bool], None]] = []
+
+def add_attendance_listener(fn: Callable[[int, str, bool], None]) -> None:
+    if fn not in _attendance_listeners:
+        _attendance_listeners.append(fn)
+
+def _notify_attendance(session_id: int, user_id: str, marked: bool) -> None:
+    for fn in _attendance_listeners:
+        try:
+            fn(session_id, user_id, marked)
+        except Exception:
+            pass
+
+def _bump(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _pool_stats[key] += n
+
+def _open_conn():
+    # isolation_level=None: reads run in autocommit mode, writes go through transaction()
+    conn = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False,
+                           isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
     try:
         cur = conn.cursor()
-        # Improve concurrency and reduce lock contention
+        # Improve concurrency and reduce lock contention (once per connection)
         cur.execute("PRAGMA journal_mode=WAL;")
         cur.execute("PRAGMA busy_timeout=5000;")
         cur.execute("PRAGMA synchronous=NORMAL;")
         cur.close()
     except Exception:
         pass
+    _bump('opened')
     return conn
 
-def init_db():
+def get_conn():
+    """Return this thread's pooled connection, opening it on first use.
+
+    The connection is shared by every helper running on the thread, so callers
+    must not close it; use close_conn() to release it explicitly.
+    """
+    conn = getattr(_local, 'conn', None)
+    # Reopen after a fork (gunicorn workers) or when DB_PATH was switched
+    if conn is not None and (_local.pid != os.getpid() or _local.path != DB_PATH):
+        close_conn()
+        conn = None
+    if conn is None:
+        conn = _open_conn()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+    else:
+        _bump('reused')
+    return conn
+
+def close_conn() -> None:
+    """Close and forget the current thread's pooled connection."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    _local.conn = None
+    try:
+        if _local.pid == os.getpid():
+            conn.close()
+    except Exception:
+        pass
+    _bump('closed')
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """Run a write transaction on the pooled connection and yield a cursor.
+
+    Commits on success and rolls back on error. Nested use joins the outer
+    transaction. immediate=True takes the write lock up front (BEGIN IMMEDIATE).
+    """
     conn = get_conn()
     cur = conn.cursor()
+    if conn.in_transaction:
+        yield cur
+        return
+    cur.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    _bump('transactions')
+    try:
+        yield cur
+    except BaseException:
+        conn.rollback()
+        _bump('rollbacks')
+        raise
+    else:
+        conn.commit()
+    finally:
+        cur.close()
+
+def _fetchone(sql: str, params=()):
+    return get_conn().execute(sql, params).fetchone()
+
+def _fetchall(sql: str, params=()):
+    return get_conn().execute(sql, params).fetchall()
+
+def pool_stats() -> dict:
+    """Return connection pool counters for this process."""
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    stats['open'] = stats['opened'] - stats['closed']
+    stats['statement_cache_size'] = STATEMENT_CACHE_SIZE
+    return stats
+
+# Process-wide cache of get_user_auth rows. Writes through this module invalidate it;
+# changes made by other processes become visible after at most USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '20000'))
+
+class _TTLCache:
+    """Thread-safe LRU of values that expire ttl seconds after being stored.
+
+    A generation counter, bumped by every invalidation, keeps a lookup that
+    raced with a write from storing the row it read before the write.
+    """
+    MISSING = object()
+
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return self.MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation or self.ttl <= 0:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys=None) -> None:
+        """Drop the given keys, or everything when keys is None."""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            if keys is None:
+                self._data.clear()
+            else:
+                for key in keys:
+                    self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._data),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+_user_cache = _TTLCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+def invalidate_user_cache(user_ids=None) -> None:
+    """Forget cached user rows (all of them when user_ids is None)."""
+    _user_cache.invalidate(None if user_ids is None else [(DB_PATH, uid) for uid in user_ids])
+
+def user_cache_stats() -> dict:
+    return _user_cache.stats()
+
+def init_db():
+    """Bring the schema up to date by applying pending MIGRATIONS.
+
+    With an up-to-date database this is a single read of schema_version.
+    Demo data is no longer loaded here; see seed_demo_data().
+    """
+    if schema_version() >= MIGRATIONS[-1][0]:
+        return
+    with transaction(immediate=True) as cur:
+        apply_migrations(cur)
+    invalidate_user_cache()
+
+def schema_version() -> int:
+    """Return the highest applied migration version, or -1 for an unversioned database."""
+    try:
+        return _fetchone('SELECT COALESCE(MAX(version), -1) FROM schema_version')[0]
+    except sqlite3.OperationalError:
+        return -1
+
+def seed_demo_data(force: bool = False, **counts) -> bool:
+    """Load the demo dataset (sample users, 7 faculties, 70 students, enrollments, sessions).
+
+    Keyword counts (faculties, students, subjects, sessions_per_subject,
+    marked_sessions) are passed to seed_dataset() to build larger fixtures.
+    Without counts it is a no-op (returns False, no hashing, passwords left
+    alone) once the database has users besides the admin, so start commands
+    can run it on every boot; force=True re-applies the defaults.
+    """
+    init_db()
+    if not counts and not force and _fetchone("SELECT 1 FROM users WHERE id != 'jaga' LIMIT 1"):
+        return False
+    with transaction() as cur:
+        # Seed minimal data if nothing but the admin account exists
+        cur.execute("SELECT COUNT(*) FROM users WHERE id != 'jaga'")
+        if cur.fetchone()[0] == 0:
+            seed_sample_data(cur)
+        # Ensure admin exists and set default passwords for students lacking one
+        ensure_admin_and_defaults(cur)
+        # Faculties, students, subjects, enrollments and baseline sessions (7x70 by default)
+        seed_dataset(cur, **counts)
+    invalidate_user_cache()
+    return True
+
+def ensure_attendance_counters(cur):
+    """Create the materialized per-subject counters and the triggers that maintain them.
+
+    session_totals holds the number of sessions per (faculty, subject) and
+    attendance_counters the number attended per (student, faculty, subject).
+    Triggers on sessions/session_attendance keep both in step with every
+    insert, delete and faculty/subject reassignment. The counters are
+    rebuilt from scratch the first time the tables are created.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='attendance_counters'")
+    existed = cur.fetchone() is not None
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS session_totals (
+        faculty_id TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (faculty_id, subject)
+    ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_counters (
+        student_id TEXT NOT NULL,
+        faculty_id TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        attended INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, faculty_id, subject)
+    ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_insert AFTER INSERT ON sessions
+    WHEN NEW.faculty_id IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO session_totals (faculty_id, subject, total) VALUES (NEW.faculty_id, NEW.subject, 0);
+        UPDATE session_totals SET total = total + 1 WHERE faculty_id = NEW.faculty_id AND subject = NEW.subject;
+    END
+    ''')
+    # Drop a session's marks before the session itself so their counters are decremented
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_delete BEFORE DELETE ON sessions
+    BEGIN
+        DELETE FROM session_attendance WHERE session_id = OLD.id;
+        UPDATE session_totals SET total = total - 1 WHERE faculty_id = OLD.faculty_id AND subject = OLD.subject;
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_reassign AFTER UPDATE OF faculty_id, subject ON sessions
+    WHEN OLD.faculty_id IS NOT NEW.faculty_id OR OLD.subject IS NOT NEW.subject
+    BEGIN
+        UPDATE session_totals SET total = total - 1 WHERE faculty_id = OLD.faculty_id AND subject = OLD.subject;
+        INSERT OR IGNORE INTO session_totals (faculty_id, subject, total)
+            SELECT NEW.faculty_id, NEW.subject, 0 WHERE NEW.faculty_id IS NOT NULL;
+        UPDATE session_totals SET total = total + 1 WHERE faculty_id = NEW.faculty_id AND subject = NEW.subject;
+        UPDATE attendance_counters SET attended = attended - 1
+            WHERE faculty_id = OLD.faculty_id AND subject = OLD.subject
+              AND student_id IN (SELECT user_id FROM session_attendance WHERE session_id = NEW.id);
+        INSERT OR IGNORE INTO attendance_counters (student_id, faculty_id, subject, attended)
+            SELECT user_id, NEW.faculty_id, NEW.subject, 0 FROM session_attendance
+            WHERE session_id = NEW.id AND NEW.faculty_id IS NOT NULL;
+        UPDATE attendance_counters SET attended = attended + 1
+            WHERE faculty_id = NEW.faculty_id AND subject = NEW.subject
+              AND student_id IN (SELECT user_id FROM session_attendance WHERE session_id = NEW.id);
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_session_attendance_insert AFTER INSERT ON session_attendance
+    BEGIN
+        INSERT OR IGNORE INTO attendance_counters (student_id, faculty_id, subject, attended)
+            SELECT NEW.user_id, faculty_id, subject, 0 FROM sessions
+            WHERE id = NEW.session_id AND faculty_id IS NOT NULL;
+        UPDATE attendance_counters SET attended = attended + 1
+            WHERE student_id = NEW.user_id
+              AND (faculty_id, subject) = (SELECT faculty_id, subject FROM sessions WHERE id = NEW.session_id);
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_session_attendance_delete AFTER DELETE ON session_attendance
+    BEGIN
+        UPDATE attendance_counters SET attended = attended - 1
+            WHERE student_id = OLD.user_id
+              AND (faculty_id, subject) = (SELECT faculty_id, subject FROM sessions WHERE id = OLD.session_id);
+    END
+    ''')
+    if not existed:
+        rebuild_attendance_counters(cur)
+
+def rebuild_attendance_counters(cur):
+    """Recompute session_totals and attendance_counters from the base tables."""
+    cur.execute('DELETE FROM session_totals')
+    cur.execute('''
+        INSERT INTO session_totals (faculty_id, subject, total)
+        SELECT faculty_id, subject, COUNT(*) FROM sessions
+        WHERE faculty_id IS NOT NULL
+        GROUP BY faculty_id, subject
+    ''')
+    cur.execute('DELETE FROM attendance_counters')
+    cur.execute('''
+        INSERT INTO attendance_counters (student_id, faculty_id, subject, attended)
+        SELECT sa.user_id, s.faculty_id, s.subject, COUNT(*)
+        FROM session_attendance sa
+        JOIN sessions s ON s.id = sa.session_id
+        WHERE s.faculty_id IS NOT NULL
+        GROUP BY sa.user_id, s.faculty_id, s.subject
+    ''')
+
+def ensure_attendance_versions(cur):
+    """Create the version stamps that tell cached reports when their inputs changed.
+
+    attendance_versions is bumped whenever a student's marks, enrollments or
+    name change; class_versions whenever a (faculty, subject) session total
+    changes. Both only ever go up, so attendance_version() changes exactly
+    when a student's report could differ.
+    """
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_versions (
+        student_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS class_versions (
+        faculty_id TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (faculty_id, subject)
+    ) WITHOUT ROWID
+    ''')
+    for name, event, ref in [
+        ('trg_versions_mark', 'AFTER INSERT ON session_attendance', 'NEW.user_id'),
+        ('trg_versions_unmark', 'AFTER DELETE ON session_attendance', 'OLD.user_id'),
+        ('trg_versions_enroll', 'AFTER INSERT ON enrollments', 'NEW.student_id'),
+        ('trg_versions_unenroll', 'AFTER DELETE ON enrollments', 'OLD.student_id'),
+        ('trg_versions_rename', 'AFTER UPDATE OF name ON users', 'NEW.id'),
+        # add_user's INSERT OR REPLACE renames through an insert
+        ('trg_versions_user', 'AFTER INSERT ON users', 'NEW.id'),
+    ]:
+        cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name} {event}
+        BEGIN
+            INSERT INTO attendance_versions (student_id, version) VALUES ({ref}, 1)
+                ON CONFLICT(student_id) DO UPDATE SET version = version + 1;
+        END
+        ''')
+    # Session inserts, deletes and reassignments all move session_totals.total
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_versions_class AFTER UPDATE OF total ON session_totals
+    BEGIN
+        INSERT INTO class_versions (faculty_id, subject, version) VALUES (NEW.faculty_id, NEW.subject, 1)
+            ON CONFLICT(faculty_id, subject) DO UPDATE SET version = version + 1;
+    END
+    ''')
+
+def bump_attendance_versions(cur):
+    """Invalidate every student's stamp, e.g. after a bulk load that bypassed the triggers."""
+    cur.execute('''
+        INSERT INTO attendance_versions (student_id, version)
+        SELECT id, 1 FROM users WHERE role = 'student'
+        ON CONFLICT(student_id) DO UPDATE SET version = version + 1
+    ''')
+
+def _add_missing_columns(cur, table: str, columns: List[Tuple[str, str]]):
+    cur.execute(f"PRAGMA table_info('{table}')")
+    existing = {r[1] for r in cur.fetchall()}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+def _migrate_base_schema(cur):
+    # Also upgrades databases created before schema_version existed
     cur.execute('''
     CREATE TABLE IF NOT EXISTS users (
         id TEXT PRIMARY KEY,
         name TEXT NOT NULL,
         roll TEXT,
-        email TEXT
+        email TEXT,
+        role TEXT DEFAULT 'student',
+        password_hash TEXT
     )
     ''')
+    _add_missing_columns(cur, 'users', [('role', "TEXT DEFAULT 'student'"), ('password_hash', 'TEXT')])
     cur.execute('''
     CREATE TABLE IF NOT EXISTS attendance (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,40 +424,20 @@ def init_db():
         date TEXT DEFAULT (date('now'))
     )
     ''')
-    # Migration: ensure 'date' column exists on existing DBs
-    cur.execute("PRAGMA table_info('attendance')")
-    att_cols = [r[1] for r in cur.fetchall()]
-    if 'date' not in att_cols:
-        cur.execute("ALTER TABLE attendance ADD COLUMN date TEXT DEFAULT (date('now'))")
+    _add_missing_columns(cur, 'attendance', [('date', "TEXT DEFAULT (date('now'))")])
     # Ensure unique index on (user_id, date)
     cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_att_unique ON attendance(user_id, date)")
-    # Migrations: add columns to users if not present
-    cur.execute("PRAGMA table_info('users')")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'role' not in cols:
-        cur.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'student'")
-    cur.execute("PRAGMA table_info('users')")
-    cols = [r[1] for r in cur.fetchall()]
-    if 'password_hash' not in cols:
-        cur.execute("ALTER TABLE users ADD COLUMN password_hash TEXT")
-
-    # New tables for session-based attendance
+    # Session-based attendance
     cur.execute('''
     CREATE TABLE IF NOT EXISTS sessions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
-        date TEXT NOT NULL DEFAULT (date('now'))
+        date TEXT NOT NULL DEFAULT (date('now')),
+        subject TEXT DEFAULT '',
+        faculty_id TEXT
     )
     ''')
-    # Migration: add subject and faculty_id to sessions
-    cur.execute("PRAGMA table_info('sessions')")
-    sess_cols = [r[1] for r in cur.fetchall()]
-    if 'subject' not in sess_cols:
-        cur.execute("ALTER TABLE sessions ADD COLUMN subject TEXT DEFAULT ''")
-    cur.execute("PRAGMA table_info('sessions')")
-    sess_cols = [r[1] for r in cur.fetchall()]
-    if 'faculty_id' not in sess_cols:
-        cur.execute("ALTER TABLE sessions ADD COLUMN faculty_id TEXT")
+    _add_missing_columns(cur, 'sessions', [('subject', "TEXT DEFAULT ''"), ('faculty_id', 'TEXT')])
     cur.execute('''
     CREATE TABLE IF NOT EXISTS session_attendance (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -94,267 +463,491 @@ def init_db():
         name TEXT PRIMARY KEY
     )
     ''')
-    conn.commit()
-    # Seed minimal data if empty
-    cur.execute('SELECT COUNT(*) FROM users')
-    total_users = cur.fetchone()[0]
-    if total_users == 0:
-        seed_sample_data(cur)
-    # Always ensure admin exists and set default passwords for students lacking one
-    ensure_admin_and_defaults(cur)
-    # Ensure extended dataset: 7 faculties, 70 students, 7 subjects, enrollments and baseline sessions
-    ensure_extended_dataset(cur)
-    conn.commit()
-    conn.close()
+    ensure_attendance_counters(cur)
+
+def _migrate_covering_indexes(cur):
+    # get_user_by_roll / list_students filter on role and sort by roll
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_role_roll ON users(role, roll)')
+    # count_sessions_for and per-subject lookups
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sessions_faculty_subject_date ON sessions(faculty_id, subject, date)')
+    # list_sessions_for_faculty: ORDER BY date DESC, id DESC walks this index backwards
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sessions_faculty_date ON sessions(faculty_id, date, id)')
+    # session_attendance_roster / list_faculty_subjects; covers student_id for the join
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_faculty_subject ON enrollments(faculty_id, subject, student_id)')
+    # Per-student mark lookups
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_session_attendance_user ON session_attendance(user_id, session_id)')
+
+def _migrate_default_admin(cur):
+    from passwords import hash_password
+    # Create the admin account once; seed_demo_data() resets its password when it loads data
+    cur.execute('''
+        INSERT INTO users (id, name, roll, email, role, password_hash)
+        VALUES ('jaga','Admin','','admin@example.com','faculty',?)
+        ON CONFLICT(id) DO NOTHING
+    ''', (hash_password('212006'),))
+
+def _migrate_sessions_date_index(cur):
+    # Sessions by date: today's sessions for QR pre-warming, date-ordered listings
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(date, id)')
+
+def _migrate_attendance_versions(cur):
+    ensure_attendance_versions(cur)
+
+def _migrate_keyset_indexes(cur):
+    # page_students walks (roll, id) in order; id breaks ties between equal rolls.
+    # Sessions keysets use idx_sessions_date / idx_sessions_faculty_date, which already end in id.
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_role_roll_id ON users(role, roll, id)')
+    cur.execute('DROP INDEX IF EXISTS idx_users_role_roll')
+
+def _migrate_keyset_null_rolls(cur):
+    # roll may be NULL, and NULL never compares greater in a row-value keyset,
+    # so page_students walks COALESCE(roll, '') instead; the expression must match this index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_role_rollkey_id ON users(role, COALESCE(roll, ''), id)")
+
+def _migrate_users_role_id_index(cur):
+    # list_faculties reads one role in id order; without this it walks the whole primary key index
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_role_id ON users(role, id)')
+
+# Ordered schema migrations: (version, description, function). Append only,
+# never renumber; each one runs exactly once per database.
+MIGRATIONS = [
+    (0, 'base schema', _migrate_base_schema),
+    (1, 'covering indexes for hot queries', _migrate_covering_indexes),
+    (2, 'default admin account', _migrate_default_admin),
+    (3, 'sessions date index', _migrate_sessions_date_index),
+    (4, 'attendance version stamps for cached reports', _migrate_attendance_versions),
+    (5, 'keyset pagination indexes', _migrate_keyset_indexes),
+    (6, 'NULL-safe student keyset index', _migrate_keyset_null_rolls),
+    (7, 'users by role and id index', _migrate_users_role_id_index),
+]
+
+def apply_migrations(cur) -> int:
+    """Apply pending MIGRATIONS in order and return the resulting schema version."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cur.execute('SELECT COALESCE(MAX(version), -1) FROM schema_version')
+    current = cur.fetchone()[0]
+    for version, name, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(cur)
+        cur.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+        current = version
+    return current
 
 def add_user(user_id: str, name: str, roll: str = '', email: str = ''):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('INSERT OR REPLACE INTO users (id, name, roll, email) VALUES (?, ?, ?, ?)', (user_id, name, roll, email))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('INSERT OR REPLACE INTO users (id, name, roll, email) VALUES (?, ?, ?, ?)', (user_id, name, roll, email))
+    invalidate_user_cache([user_id])
 
 def add_users_from_list(rows: List[Tuple[str,str,str,str]]):
-    for r in rows:
-        add_user(r[0], r[1], r[2], r[3])
+    bulk_add_users([(r[0], r[1], r[2], r[3]) for r in rows])
 
 def get_user(user_id: str) -> Optional[Tuple[str,str,str,str]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, roll, email FROM users WHERE id = ?', (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return _fetchone('SELECT id, name, roll, email FROM users WHERE id = ?', (user_id,))
 
 def delete_session(session_id: int) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM session_attendance WHERE session_id = ?', (session_id,))
-    cur.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('DELETE FROM session_attendance WHERE session_id = ?', (session_id,))
+        cur.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
 
 def delete_all_sessions() -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM session_attendance')
-    cur.execute('DELETE FROM sessions')
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('DELETE FROM session_attendance')
+        cur.execute('DELETE FROM sessions')
 
 def reassign_session_faculty(session_id: int, faculty_id: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('UPDATE sessions SET faculty_id = ? WHERE id = ?', (faculty_id, session_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('UPDATE sessions SET faculty_id = ? WHERE id = ?', (faculty_id, session_id))
 
 def student_subject_summary(user_id: str) -> List[Tuple[str, int, int, float]]:
-    """Return list of (subject, attended, total, percent) for subjects the student is enrolled in."""
-    conn = get_conn()
-    cur = conn.cursor()
-    # subjects the student is enrolled in
-    cur.execute('SELECT DISTINCT subject, faculty_id FROM enrollments WHERE student_id = ?', (user_id,))
-    subs = cur.fetchall()
+    """Return list of (subject, attended, total, percent) for subjects the student is enrolled in.
+
+    Served in one query from the counters maintained by ensure_attendance_counters().
+    """
+    rows = _fetchall('''
+        SELECT e.subject, COALESCE(c.attended, 0), COALESCE(t.total, 0)
+        FROM enrollments e
+        LEFT JOIN session_totals t
+            ON t.faculty_id = e.faculty_id AND t.subject = e.subject
+        LEFT JOIN attendance_counters c
+            ON c.student_id = e.student_id AND c.faculty_id = e.faculty_id AND c.subject = e.subject
+        WHERE e.student_id = ?
+        ORDER BY e.id
+    ''', (user_id,))
     results: List[Tuple[str,int,int,float]] = []
-    for subject, faculty_id in subs:
-        # total sessions for that faculty+subject
-        cur.execute('SELECT COUNT(*) FROM sessions WHERE subject = ? AND faculty_id = ?', (subject, faculty_id))
-        total = cur.fetchone()[0]
-        # attended sessions for this student within those sessions
-        cur.execute('''
-            SELECT COUNT(*)
-            FROM session_attendance sa
-            JOIN sessions s ON s.id = sa.session_id
-            WHERE sa.user_id = ? AND s.subject = ? AND s.faculty_id = ?
-        ''', (user_id, subject, faculty_id))
-        attended = cur.fetchone()[0]
+    for subject, attended, total in rows:
         percent = (attended / total * 100.0) if total > 0 else 0.0
         results.append((subject, attended, total, percent))
-    conn.close()
     return results
 
 def list_faculty_subjects(faculty_id: str) -> List[str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT DISTINCT subject FROM enrollments WHERE faculty_id = ? ORDER BY subject', (faculty_id,))
-    subs = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return subs
+    rows = _fetchall('SELECT DISTINCT subject FROM enrollments WHERE faculty_id = ? ORDER BY subject', (faculty_id,))
+    return [r[0] for r in rows]
 
 def count_sessions_for(faculty_id: str, subject: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) FROM sessions WHERE faculty_id = ? AND subject = ?', (faculty_id, subject))
-    n = cur.fetchone()[0]
-    conn.close()
-    return n
+    return _fetchone('SELECT COUNT(*) FROM sessions WHERE faculty_id = ? AND subject = ?', (faculty_id, subject))[0]
 
 def list_subjects() -> List[str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT name FROM subjects ORDER BY name')
-    names = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return names
+    return [r[0] for r in _fetchall('SELECT name FROM subjects ORDER BY name')]
 
 def upsert_subject(name: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('INSERT OR IGNORE INTO subjects (name) VALUES (?)', (name.strip(),))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('INSERT OR IGNORE INTO subjects (name) VALUES (?)', (name.strip(),))
 
 def delete_subject(name: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM subjects WHERE name = ?', (name.strip(),))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('DELETE FROM subjects WHERE name = ?', (name.strip(),))
 
 def set_user_password(user_id: str, password_hash: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+    invalidate_user_cache([user_id])
 
 def mark_attendance(user_id: str) -> bool:
     """Marks attendance for user_id. Returns True if newly inserted, False if already present today."""
-    conn = get_conn()
-    cur = conn.cursor()
+    with transaction() as cur:
+        # unique (user_id, date) index makes a repeat scan a no-op
+        cur.execute('INSERT OR IGNORE INTO attendance (user_id) VALUES (?)', (user_id,))
+        return cur.rowcount > 0
+
+# Rows pulled from SQLite per fetchmany() while streaming an export
+EXPORT_BATCH = 5000
+
+def _iter_cursor(sql: str, params, batch: int):
+    # SQLite steps the statement lazily, so only `batch` rows are in memory at a time
+    cur = get_conn().execute(sql, params)
     try:
-        cur.execute('INSERT INTO attendance (user_id) VALUES (?)', (user_id,))
-        conn.commit()
-        inserted = cur.rowcount > 0
-    except sqlite3.IntegrityError:
-        # unique constraint violated (already marked today)
-        inserted = False
-    conn.close()
-    return inserted
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cur.close()
 
-def export_attendance_csv(out_path: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('''
-    SELECT a.id, a.user_id, u.name, u.roll, a.timestamp
-    FROM attendance a LEFT JOIN users u ON a.user_id = u.id
-    ORDER BY a.timestamp
-    ''')
-    rows = cur.fetchall()
-    conn.close()
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.write('att_id,user_id,name,roll,timestamp\n')
-        for r in rows:
-            f.write(','.join([str(x) for x in r]) + '\n')
+def iter_attendance_rows(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                         batch: int = EXPORT_BATCH) -> Iterator[Tuple[int, str, str, str, str]]:
+    """Yield webcam-scanner marks as (att_id, user_id, name, roll, timestamp), oldest first."""
+    where, params = [], []
+    if date_from:
+        where.append('a.date >= ?'); params.append(date_from)
+    if date_to:
+        where.append('a.date <= ?'); params.append(date_to)
+    # Rowid order is insertion order, so no sort step is needed to stream
+    return _iter_cursor(f'''
+        SELECT a.id, a.user_id, u.name, u.roll, a.timestamp
+        FROM attendance a LEFT JOIN users u ON a.user_id = u.id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY a.id
+    ''', params, batch)
+
+def iter_session_marks(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       faculty_id: Optional[str] = None, subject: Optional[str] = None,
+                       batch: int = EXPORT_BATCH) -> Iterator[tuple]:
+    """Yield session marks as (mark_id, session_id, session, date, subject, faculty_id, user_id, name, roll, marked_at).
+
+    Ordered by session date and id; filters are optional and combine with AND.
+    """
+    where, params = [], []
+    if faculty_id:
+        where.append('s.faculty_id = ?'); params.append(faculty_id)
+    if subject:
+        where.append('s.subject = ?'); params.append(subject)
+    if date_from:
+        where.append('s.date >= ?'); params.append(date_from)
+    if date_to:
+        where.append('s.date <= ?'); params.append(date_to)
+    return _iter_cursor(f'''
+        SELECT sa.id, s.id, s.name, s.date, s.subject, s.faculty_id, sa.user_id, u.name, u.roll, sa.marked_at
+        FROM sessions s
+        JOIN session_attendance sa ON sa.session_id = s.id
+        LEFT JOIN users u ON u.id = sa.user_id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY s.date, s.id, sa.id
+    ''', params, batch)
+
+def export_attendance_csv(out_path: str) -> int:
+    """Write the scanner attendance table to out_path as CSV; returns the row count."""
+    count = 0
+    with open(out_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['att_id', 'user_id', 'name', 'roll', 'timestamp'])
+        for row in iter_attendance_rows():
+            writer.writerow(row)
+            count += 1
+    return count
 
 # New helpers for web app
 def upsert_user_with_auth(user_id: str, name: str, roll: str, email: str, role: str, password_hash: Optional[str]):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO users (id, name, roll, email, role, password_hash)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-            name=excluded.name,
-            roll=excluded.roll,
-            email=excluded.email,
-            role=excluded.role,
-            password_hash=COALESCE(excluded.password_hash, users.password_hash)
-    ''', (user_id, name, roll, email, role, password_hash))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+            INSERT INTO users (id, name, roll, email, role, password_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name=excluded.name,
+                roll=excluded.roll,
+                email=excluded.email,
+                role=excluded.role,
+                password_hash=COALESCE(excluded.password_hash, users.password_hash)
+        ''', (user_id, name, roll, email, role, password_hash))
+    invalidate_user_cache([user_id])
+
+def bulk_upsert_users(rows: List[Tuple[str, str, str, str, str, Optional[str]]]) -> None:
+    """Upsert many (id, name, roll, email, role, password_hash) rows in one transaction.
+
+    Same conflict rules as upsert_user_with_auth: a None hash keeps the stored one.
+    """
+    with transaction() as cur:
+        cur.executemany('''
+            INSERT INTO users (id, name, roll, email, role, password_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name=excluded.name,
+                roll=excluded.roll,
+                email=excluded.email,
+                role=excluded.role,
+                password_hash=COALESCE(excluded.password_hash, users.password_hash)
+        ''', rows)
+    invalidate_user_cache([r[0] for r in rows])
+
+def bulk_add_users(rows: List[Tuple[str, str, str, str]]) -> None:
+    """Insert or replace many (id, name, roll, email) rows in one transaction, like add_user."""
+    with transaction() as cur:
+        cur.executemany('INSERT OR REPLACE INTO users (id, name, roll, email) VALUES (?, ?, ?, ?)', rows)
+    invalidate_user_cache([r[0] for r in rows])
+
+def bulk_upsert_enrollments(rows: List[Tuple[str, str, str]]) -> None:
+    """Insert many (student_id, faculty_id, subject) enrollments in one transaction, ignoring duplicates."""
+    with transaction() as cur:
+        cur.executemany('''
+            INSERT INTO enrollments (student_id, faculty_id, subject)
+            VALUES (?, ?, ?)
+            ON CONFLICT(student_id, faculty_id, subject) DO NOTHING
+        ''', rows)
+
+def list_user_rows() -> List[Tuple[str, str, str, str, str]]:
+    """Return (id, name, roll, email, role) for every user, for building in-memory lookups."""
+    return _fetchall('SELECT id, name, roll, email, role FROM users')
 
 def get_user_auth(user_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, roll, email, role, password_hash FROM users WHERE id = ?', (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    """(id, name, roll, email, role, password_hash) or None, served from the user cache when fresh."""
+    key = (DB_PATH, user_id)  # never serve a row cached from a previously opened database
+    row = _user_cache.get(key)
+    if row is _TTLCache.MISSING:
+        generation = _user_cache.generation
+        row = _fetchone('SELECT id, name, roll, email, role, password_hash FROM users WHERE id = ?', (user_id,))
+        _user_cache.put(key, row, generation)
     return row
 
 def get_user_by_roll(roll: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, roll, email, role, password_hash FROM users WHERE role='student' AND roll = ?", (roll,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return _fetchone("SELECT id, name, roll, email, role, password_hash FROM users WHERE role='student' AND roll = ?", (roll,))
 
 def list_students() -> List[Tuple[str,str,str,str]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, roll, email FROM users WHERE role='student' ORDER BY roll")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall("SELECT id, name, roll, email FROM users WHERE role='student' ORDER BY roll")
+
+def list_faculties() -> List[Tuple[str,str,str]]:
+    return _fetchall("SELECT id, name, email FROM users WHERE role='faculty' ORDER BY id")
 
 def create_session(name: str, date: Optional[str] = None, subject: str = '', faculty_id: Optional[str] = None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    if date:
-        cur.execute('INSERT INTO sessions (name, date, subject, faculty_id) VALUES (?, ?, ?, ?)', (name, date, subject, faculty_id))
-    else:
-        cur.execute('INSERT INTO sessions (name, subject, faculty_id) VALUES (?, ?, ?)', (name, subject, faculty_id))
-    conn.commit()
-    sid = cur.lastrowid
-    conn.close()
-    return sid
+    with transaction() as cur:
+        if date:
+            cur.execute('INSERT INTO sessions (name, date, subject, faculty_id) VALUES (?, ?, ?, ?)', (name, date, subject, faculty_id))
+        else:
+            cur.execute('INSERT INTO sessions (name, subject, faculty_id) VALUES (?, ?, ?)', (name, subject, faculty_id))
+        return cur.lastrowid
 
 def list_sessions() -> List[Tuple[int,str,str,str,Optional[str]]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, date, subject, faculty_id FROM sessions ORDER BY date DESC, id DESC')
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall('SELECT id, name, date, subject, faculty_id FROM sessions ORDER BY date DESC, id DESC')
 
 def list_sessions_for_faculty(faculty_id: str) -> List[Tuple[int,str,str,str,Optional[str]]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, date, subject, faculty_id FROM sessions WHERE faculty_id = ? ORDER BY date DESC, id DESC', (faculty_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return _fetchall('SELECT id, name, date, subject, faculty_id FROM sessions WHERE faculty_id = ? ORDER BY date DESC, id DESC', (faculty_id,))
+
+# Rows per page for the paginated listings
+PAGE_SIZE = 50
+
+def _like_pattern(term: str) -> str:
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def page_sessions(faculty_id: Optional[str] = None, after: Optional[Tuple[str, int]] = None,
+                  limit: int = PAGE_SIZE, search: Optional[str] = None, subject: Optional[str] = None
+                  ) -> Tuple[List[Tuple[int,str,str,str,Optional[str]]], Optional[Tuple[str, int]]]:
+    """One page of sessions, newest first (date DESC, id DESC), and the key of the next page.
+
+    Pass the returned key back as `after` to continue; it is None on the last
+    page. search matches name or subject; every filter is optional.
+    """
+    where, params = [], []
+    if faculty_id:
+        where.append('faculty_id = ?'); params.append(faculty_id)
+    if subject:
+        where.append('subject = ?'); params.append(subject)
+    if search:
+        pattern = _like_pattern(search)
+        where.append("(name LIKE ? ESCAPE '\\' OR subject LIKE ? ESCAPE '\\')"); params += [pattern, pattern]
+    if after:
+        where.append('(date, id) < (?, ?)'); params += [after[0], after[1]]
+    rows = _fetchall(f'''
+        SELECT id, name, date, subject, faculty_id FROM sessions
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY date DESC, id DESC LIMIT ?
+    ''', params + [limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], (rows[limit - 1][2], rows[limit - 1][0])
+    return rows, None
+
+def page_students(after: Optional[Tuple[str, str]] = None, limit: int = PAGE_SIZE,
+                  search: Optional[str] = None) -> Tuple[List[Tuple[str,str,str,str]], Optional[Tuple[str, str]]]:
+    """One page of students as (id, name, roll, email) by roll, and the key of the next page (see page_sessions).
+
+    search matches id, name or roll. Students without a roll sort first, as if it were ''.
+    """
+    where, params = ["role = 'student'"], []
+    if search:
+        pattern = _like_pattern(search)
+        where.append("(roll LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' OR id LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern, pattern]
+    if after:
+        where.append("(COALESCE(roll, ''), id) > (?, ?)"); params += [after[0], after[1]]
+    rows = _fetchall(f'''
+        SELECT id, name, roll, email FROM users
+        WHERE {' AND '.join(where)}
+        ORDER BY COALESCE(roll, ''), id LIMIT ?
+    ''', params + [limit + 1])
+    if len(rows) > limit:
+        return rows[:limit], (rows[limit - 1][2] or '', rows[limit - 1][0])
+    return rows, None
+
+def list_students_with_sessions_on(date: str) -> List[Tuple[str,str,str,str]]:
+    """Return (id, name, roll, email) of students enrolled in any session held on date."""
+    return _fetchall('''
+        SELECT DISTINCT u.id, u.name, u.roll, u.email
+        FROM sessions s
+        JOIN enrollments e ON e.faculty_id = s.faculty_id AND e.subject = s.subject
+        JOIN users u ON u.id = e.student_id AND u.role = 'student'
+        WHERE s.date = ?
+    ''', (date,))
 
 def get_session(session_id: int) -> Optional[Tuple[int,str,str,str,Optional[str]]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, date, subject, faculty_id FROM sessions WHERE id = ?', (session_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    return _fetchone('SELECT id, name, date, subject, faculty_id FROM sessions WHERE id = ?', (session_id,))
 
 def mark_session_attendance(session_id: int, user_id: str) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute('INSERT INTO session_attendance (session_id, user_id) VALUES (?, ?)', (session_id, user_id))
-        conn.commit()
-        ok = cur.rowcount > 0
-    except sqlite3.IntegrityError:
-        ok = False
-    conn.close()
-    return ok
+    with transaction() as cur:
+        # UNIQUE(session_id, user_id) turns a repeat mark into a no-op
+        cur.execute('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', (session_id, user_id))
+        inserted = cur.rowcount > 0
+    if inserted:
+        _notify_attendance(session_id, user_id, True)
+    return inserted
 
-def unmark_session_attendance(session_id: int, user_id: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM session_attendance WHERE session_id = ? AND user_id = ?', (session_id, user_id))
-    conn.commit()
-    conn.close()
+def mark_session_attendance_many(marks: List[Tuple[int, str]]) -> List[bool]:
+    """Mark many (session_id, user_id) pairs in one transaction.
+
+    Returns one flag per input pair, True where the mark was newly inserted.
+    """
+    results: List[bool] = []
+    with transaction(immediate=True) as cur:
+        for session_id, user_id in marks:
+            cur.execute('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', (session_id, user_id))
+            results.append(cur.rowcount > 0)
+    for (session_id, user_id), inserted in zip(marks, results):
+        if inserted:
+            _notify_attendance(session_id, user_id, True)
+    return results
+
+def unmark_session_attendance(session_id: int, user_id: str) -> bool:
+    with transaction() as cur:
+        cur.execute('DELETE FROM session_attendance WHERE session_id = ? AND user_id = ?', (session_id, user_id))
+        removed = cur.rowcount > 0
+    if removed:
+        _notify_attendance(session_id, user_id, False)
+    return removed
+
+def toggle_session_attendance(session_id: int, user_id: str) -> bool:
+    """Flip one student's mark in a single transaction; returns the new state (True = present)."""
+    with transaction(immediate=True) as cur:
+        cur.execute('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', (session_id, user_id))
+        marked = cur.rowcount > 0
+        if not marked:
+            cur.execute('DELETE FROM session_attendance WHERE session_id = ? AND user_id = ?', (session_id, user_id))
+    _notify_attendance(session_id, user_id, marked)
+    return marked
+
+class UnknownStudents(ValueError):
+    """Raised by set_session_attendance for ids that are not on the session's roster."""
+
+    def __init__(self, ids: List[str]):
+        super().__init__(f'not on the session roster: {", ".join(ids)}')
+        self.ids = ids
+
+def _roster_ids(cur, session_id: int) -> set:
+    # Same membership as session_attendance_roster: the class's enrolled students, else every student
+    cur.execute('SELECT subject, faculty_id FROM sessions WHERE id = ?', (session_id,))
+    sess = cur.fetchone()
+    if sess and sess[0] and sess[1]:
+        cur.execute('''
+            SELECT s.id FROM enrollments e
+            JOIN users s ON s.id = e.student_id AND s.role='student'
+            WHERE e.subject = ? AND e.faculty_id = ?
+        ''', (sess[0], sess[1]))
+    else:
+        cur.execute("SELECT id FROM users WHERE role='student'")
+    return {r[0] for r in cur.fetchall()}
+
+def set_session_attendance(session_id: int, present: Optional[List[str]] = None,
+                           mark: List[str] = (), unmark: List[str] = ()) -> Tuple[List[str], List[str]]:
+    """Apply a whole present-set, or a diff of ids to mark/unmark, in one transaction.
+
+    With present, everyone in it ends up marked and every other roster
+    student unmarked; otherwise mark and unmark are applied as given. Ids
+    must be on the session's roster (unmark also takes anyone currently
+    marked), else UnknownStudents is raised and nothing changes. Returns
+    (marked, unmarked): the ids whose state actually changed.
+    """
+    marked: List[str] = []
+    unmarked: List[str] = []
+    with transaction(immediate=True) as cur:
+        roster = _roster_ids(cur, session_id)
+        cur.execute('SELECT user_id FROM session_attendance WHERE session_id = ?', (session_id,))
+        current = {r[0] for r in cur.fetchall()}
+        unknown = ((set(present or ()) | set(mark)) - roster) | (set(unmark) - roster - current)
+        if unknown:
+            raise UnknownStudents(sorted(unknown))
+        if present is not None:
+            wanted = set(present)
+            mark, unmark = sorted(wanted - current), sorted((current & roster) - wanted)
+        for user_id in mark:
+            cur.execute('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', (session_id, user_id))
+            if cur.rowcount > 0:
+                marked.append(user_id)
+        for user_id in unmark:
+            cur.execute('DELETE FROM session_attendance WHERE session_id = ? AND user_id = ?', (session_id, user_id))
+            if cur.rowcount > 0:
+                unmarked.append(user_id)
+    for user_id in marked:
+        _notify_attendance(session_id, user_id, True)
+    for user_id in unmarked:
+        _notify_attendance(session_id, user_id, False)
+    return marked, unmarked
+
+def list_session_marks(session_id: int) -> List[str]:
+    """Return the ids of everyone marked in a session (from the UNIQUE(session_id, user_id) index)."""
+    return [r[0] for r in _fetchall('SELECT user_id FROM session_attendance WHERE session_id = ?', (session_id,))]
 
 def session_attendance_roster(session_id: int) -> List[Tuple[str, str, str, int]]:
     """Return [(id, name, roll, marked_flag)] for students enrolled under the session's subject and faculty."""
     conn = get_conn()
-    cur = conn.cursor()
     # Fetch session subject and faculty_id
-    cur.execute('SELECT subject, faculty_id FROM sessions WHERE id = ?', (session_id,))
-    sess = cur.fetchone()
+    sess = conn.execute('SELECT subject, faculty_id FROM sessions WHERE id = ?', (session_id,)).fetchone()
     subject = sess[0] if sess else ''
     faculty_id = sess[1] if sess else None
     if subject and faculty_id:
-        cur.execute('''
+        return conn.execute('''
             SELECT s.id, s.name, s.roll,
                    CASE WHEN sa.id IS NULL THEN 0 ELSE 1 END AS marked
             FROM enrollments e
@@ -363,84 +956,147 @@ def session_attendance_roster(session_id: int) -> List[Tuple[str, str, str, int]
                 ON sa.user_id = s.id AND sa.session_id = ?
             WHERE e.subject = ? AND e.faculty_id = ?
             ORDER BY s.roll
-        ''', (session_id, subject, faculty_id))
-    else:
-        # Fallback: list all students
-        cur.execute('''
-            SELECT s.id, s.name, s.roll,
-                   CASE WHEN sa.id IS NULL THEN 0 ELSE 1 END AS marked
-            FROM users s
-            LEFT JOIN session_attendance sa
-                ON sa.user_id = s.id AND sa.session_id = ?
-            WHERE s.role='student'
-            ORDER BY s.roll
-        ''', (session_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+        ''', (session_id, subject, faculty_id)).fetchall()
+    # Fallback: list all students
+    return conn.execute('''
+        SELECT s.id, s.name, s.roll,
+               CASE WHEN sa.id IS NULL THEN 0 ELSE 1 END AS marked
+        FROM users s
+        LEFT JOIN session_attendance sa
+            ON sa.user_id = s.id AND sa.session_id = ?
+        WHERE s.role='student'
+        ORDER BY s.roll
+    ''', (session_id,)).fetchall()
 
 def upsert_enrollment(student_id: str, faculty_id: str, subject: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO enrollments (student_id, faculty_id, subject)
-        VALUES (?, ?, ?)
-        ON CONFLICT(student_id, faculty_id, subject) DO NOTHING
-    ''', (student_id, faculty_id, subject))
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute('''
+            INSERT INTO enrollments (student_id, faculty_id, subject)
+            VALUES (?, ?, ?)
+            ON CONFLICT(student_id, faculty_id, subject) DO NOTHING
+        ''', (student_id, faculty_id, subject))
 
 def student_attendance_summary(user_id: str) -> Tuple[int, int]:
-    """Return (attended_count, total_sessions)."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) FROM sessions')
-    total = cur.fetchone()[0]
-    cur.execute('SELECT COUNT(*) FROM session_attendance WHERE user_id = ?', (user_id,))
-    attended = cur.fetchone()[0]
-    conn.close()
-    return attended, total
+    """Return (attended, total) over the sessions of the student's enrolled (subject, faculty) pairs.
+
+    Sums the counters behind student_subject_summary(), so the cost depends on
+    the student's enrollments only, not on how many sessions exist.
+    """
+    row = _fetchone('''
+        SELECT COALESCE(SUM(c.attended), 0), COALESCE(SUM(t.total), 0)
+        FROM enrollments e
+        LEFT JOIN session_totals t
+            ON t.faculty_id = e.faculty_id AND t.subject = e.subject
+        LEFT JOIN attendance_counters c
+            ON c.student_id = e.student_id AND c.faculty_id = e.faculty_id AND c.subject = e.subject
+        WHERE e.student_id = ?
+    ''', (user_id,))
+    return row[0], row[1]
+
+def attendance_version(user_id: str) -> str:
+    """Stamp that changes whenever anything on user_id's attendance report may have changed."""
+    row = _fetchone('''
+        SELECT COALESCE((SELECT version FROM attendance_versions WHERE student_id = ?), 0),
+               (SELECT COALESCE(SUM(v.version), 0) FROM enrollments e
+                JOIN class_versions v ON v.faculty_id = e.faculty_id AND v.subject = e.subject
+                WHERE e.student_id = ?)
+    ''', (user_id, user_id))
+    return '.'.join(str(x) for x in row)
+
+REPORT_BATCH = 500  # ids per report_rows query, under SQLite's bound-parameter limit
+
+def report_rows(user_ids: List[str]) -> Dict[str, Tuple[str, str, List[Tuple[str, int, int]]]]:
+    """{user_id: (name, attendance_version stamp, [(subject, attended, total)])} for many users.
+
+    One query per REPORT_BATCH ids, so a bulk report run does not issue
+    three lookups per student; unknown ids are left out. Subjects come in
+    student_subject_summary() order and the stamp equals attendance_version().
+    """
+    out: Dict[str, Tuple[str, str, List[Tuple[str, int, int]]]] = {}
+    ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(ids), REPORT_BATCH):
+        chunk = ids[start:start + REPORT_BATCH]
+        rows = _fetchall(f'''
+            SELECT u.id, u.name, COALESCE(av.version, 0), e.subject,
+                   COALESCE(c.attended, 0), COALESCE(t.total, 0), COALESCE(v.version, 0)
+            FROM users u
+            LEFT JOIN attendance_versions av ON av.student_id = u.id
+            LEFT JOIN enrollments e ON e.student_id = u.id
+            LEFT JOIN session_totals t
+                ON t.faculty_id = e.faculty_id AND t.subject = e.subject
+            LEFT JOIN attendance_counters c
+                ON c.student_id = e.student_id AND c.faculty_id = e.faculty_id AND c.subject = e.subject
+            LEFT JOIN class_versions v ON v.faculty_id = e.faculty_id AND v.subject = e.subject
+            WHERE u.id IN ({', '.join('?' * len(chunk))})
+            ORDER BY u.id, e.id
+        ''', chunk)
+        class_versions: Dict[str, int] = {}
+        for uid, name, version, subject, attended, total, class_version in rows:
+            if uid not in out:
+                out[uid] = (name, version, [])
+            if subject is not None:
+                out[uid][2].append((subject, attended, total))
+                class_versions[uid] = class_versions.get(uid, 0) + class_version
+        for uid in {r[0] for r in rows}:
+            name, version, subjects = out[uid]
+            out[uid] = (name, f'{version}.{class_versions.get(uid, 0)}', subjects)
+    return out
+
+def list_enrolled_students(faculty_id: str, subject: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """(id, name, roll) of students enrolled with faculty_id (in subject, if given), by roll."""
+    if subject:
+        return _fetchall('''
+            SELECT u.id, u.name, u.roll FROM enrollments e JOIN users u ON u.id = e.student_id
+            WHERE e.faculty_id = ? AND e.subject = ? ORDER BY u.roll
+        ''', (faculty_id, subject))
+    return _fetchall('''
+        SELECT DISTINCT u.id, u.name, u.roll FROM enrollments e JOIN users u ON u.id = e.student_id
+        WHERE e.faculty_id = ? ORDER BY u.roll
+    ''', (faculty_id,))
+
+# Above this many marks, bulk loads rebuild the counters instead of updating them per row
+BULK_COUNTER_THRESHOLD = 50000
+
+# Subject names used by the demo dataset; larger fixtures continue with "Subject 8", ...
+DEMO_SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'Computer Science', 'History']
 
 def seed_sample_data(cur):
-    from werkzeug.security import generate_password_hash
+    from passwords import hash_password
     # Create admin (faculty) with requested credentials
     cur.execute('''
         INSERT INTO users (id, name, roll, email, role, password_hash)
         VALUES ('jaga','Admin','','admin@example.com','faculty',?)
         ON CONFLICT(id) DO UPDATE SET password_hash=excluded.password_hash
-    ''', (generate_password_hash('212006'),))
+    ''', (hash_password('212006'),))
     # Create one sample faculty (for demo)
     cur.execute('''
         INSERT INTO users (id, name, roll, email, role, password_hash)
         VALUES ('F001','Faculty Admin','','faculty@example.com','faculty',?)
         ON CONFLICT(id) DO NOTHING
-    ''', (generate_password_hash('admin123'),))
-    # 25 students
-    for i in range(1, 26):
-        sid = f"S{i:03d}"
-        name = f"Student {i}"
-        roll = f"23MID{280 + i:04d}"
-        email = f"student{i}@example.com"
-        cur.execute('''
-            INSERT INTO users (id, name, roll, email, role, password_hash)
-            VALUES (?, ?, ?, ?, 'student', ?)
-            ON CONFLICT(id) DO NOTHING
-        ''', (sid, name, roll, email, generate_password_hash('pass123')))
+    ''', (hash_password('admin123'),))
+    # 25 students sharing one precomputed default-password hash
+    student_hash = hash_password('pass123')
+    cur.executemany('''
+        INSERT INTO users (id, name, roll, email, role, password_hash)
+        VALUES (?, ?, ?, ?, 'student', ?)
+        ON CONFLICT(id) DO NOTHING
+    ''', ((f"S{i:03d}", f"Student {i}", f"23MID{280 + i:04d}", f"student{i}@example.com", student_hash)
+          for i in range(1, 26)))
 
 def ensure_admin_and_defaults(cur):
-    from werkzeug.security import generate_password_hash
+    from passwords import hash_password
     # Ensure admin 'jaga' exists with password '212006'
     cur.execute('''
         INSERT INTO users (id, name, roll, email, role, password_hash)
         VALUES ('jaga','Admin','','admin@example.com','faculty',?)
         ON CONFLICT(id) DO UPDATE SET password_hash=excluded.password_hash
-    ''', (generate_password_hash('212006'),))
+    ''', (hash_password('212006'),))
     # Set default password for students with NULL password_hash
     cur.execute("SELECT COUNT(*) FROM users WHERE role='student' AND (password_hash IS NULL OR password_hash='')")
     missing = cur.fetchone()[0]
     if missing:
         cur.execute("UPDATE users SET password_hash=? WHERE role='student' AND (password_hash IS NULL OR password_hash='')",
-                    (generate_password_hash('pass123'),))
+                    (hash_password('pass123'),))
 
 def ensure_extended_dataset(cur):
     """Ensure there are:
@@ -450,81 +1106,84 @@ def ensure_extended_dataset(cur):
     - Baseline sessions per subject and some attendance marks for demo
     Idempotent via INSERT OR IGNORE / ON CONFLICT DO NOTHING.
     """
-    from werkzeug.security import generate_password_hash
-    # Define 7 subjects and faculty mapping
-    subjects = [
-        'Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'Computer Science', 'History'
-    ]
-    faculties = [f"F{i:03d}" for i in range(1, 8)]
-    faculty_names = [
-        'Faculty 1','Faculty 2','Faculty 3','Faculty 4','Faculty 5','Faculty 6','Faculty 7'
-    ]
-
-    # Create faculties with password 'admin123'
-    for fid, fname in zip(faculties, faculty_names):
-        cur.execute('''
-            INSERT INTO users (id, name, roll, email, role, password_hash)
-            VALUES (?, ?, '', ?, 'faculty', ?)
-            ON CONFLICT(id) DO NOTHING
-        ''', (fid, fname, f"{fid.lower()}@example.com", generate_password_hash('admin123')))
-
-    # Ensure subjects table has 7 subjects
-    for s in subjects:
-        cur.execute('INSERT OR IGNORE INTO subjects (name) VALUES (?)', (s,))
-
-    # Create 70 students S001..S070 with rolls 23MID0281..23MID0350
-    # Keep consistent with any existing S001..S025; this will extend up to S070
-    for i, roll_num in enumerate(range(281, 351), start=1):
-        sid = f"S{i:03d}"
-        name = f"Student {i}"
-        roll = f"23MID{roll_num:04d}"
-        email = f"student{i}@example.com"
-        cur.execute('''
-            INSERT INTO users (id, name, roll, email, role, password_hash)
-            VALUES (?, ?, ?, ?, 'student', ?)
-            ON CONFLICT(id) DO NOTHING
-        ''', (sid, name, roll, email, generate_password_hash('pass123')))
+    seed_dataset(cur)
+
+def seed_dataset(cur, faculties: int = 7, students: int = 70, subjects: int = 7,
+                 sessions_per_subject: int = 5, marked_sessions: int = 2):
+    """Bulk-create a demo or load-test dataset; the defaults give the 7x70 demo.
+
+    - faculties F001.., password 'admin123'; subject i is taught by faculty i mod faculties
+    - students S001.. with rolls 23MID0281.., password 'pass123'
+    - every student enrolled in every subject
+    - sessions_per_subject sessions per subject, and every other student
+      marked present in the first marked_sessions of each
+    Each default password is hashed once and shared, and rows are written
+    with executemany. Idempotent via INSERT OR IGNORE / ON CONFLICT DO NOTHING.
+    Raises ValueError for counts below 1 (below 0 for marked_sessions).
+    """
+    for name, value, least in [('faculties', faculties, 1), ('students', students, 1), ('subjects', subjects, 1),
+                               ('sessions_per_subject', sessions_per_subject, 1),
+                               ('marked_sessions', marked_sessions, 0)]:
+        if not isinstance(value, int) or value < least:
+            raise ValueError(f'{name} must be an integer >= {least}, got {value!r}')
+    from passwords import hash_password
+    faculty_ids = [f"F{i:03d}" for i in range(1, faculties + 1)]
+    subject_names = (DEMO_SUBJECTS + [f"Subject {i}" for i in range(len(DEMO_SUBJECTS) + 1, subjects + 1)])[:subjects]
+    subj_fac = [(subject, faculty_ids[i % faculties]) for i, subject in enumerate(subject_names)]
+
+    faculty_hash = hash_password('admin123')
+    cur.executemany('''
+        INSERT INTO users (id, name, roll, email, role, password_hash)
+        VALUES (?, ?, '', ?, 'faculty', ?)
+        ON CONFLICT(id) DO NOTHING
+    ''', ((fid, f"Faculty {i}", f"{fid.lower()}@example.com", faculty_hash)
+          for i, fid in enumerate(faculty_ids, start=1)))
+    cur.executemany('INSERT OR IGNORE INTO subjects (name) VALUES (?)', ((s,) for s in subject_names))
 
-    # Map each subject to a faculty (1:1)
-    subj_fac = list(zip(subjects, faculties))
+    # Keep consistent with any existing S001..S025; this extends up to the requested count
+    student_hash = hash_password('pass123')
+    cur.executemany('''
+        INSERT INTO users (id, name, roll, email, role, password_hash)
+        VALUES (?, ?, ?, ?, 'student', ?)
+        ON CONFLICT(id) DO NOTHING
+    ''', ((f"S{i:03d}", f"Student {i}", f"23MID{280 + i:04d}", f"student{i}@example.com", student_hash)
+          for i in range(1, students + 1)))
 
-    # Enroll every student into all 7 subjects under the mapped faculty
+    # Enroll every student into every subject under the mapped faculty
     cur.execute("SELECT id FROM users WHERE role='student' ORDER BY id")
     student_ids = [r[0] for r in cur.fetchall()]
-    for student_id in student_ids:
-        for subject, fid in subj_fac:
-            cur.execute('''
-                INSERT INTO enrollments (student_id, faculty_id, subject)
-                VALUES (?, ?, ?)
-                ON CONFLICT(student_id, faculty_id, subject) DO NOTHING
-            ''', (student_id, fid, subject))
-
-    # Create baseline sessions per subject (5 each) for totals
-    # Use existing helper list/count via direct SQL
+    cur.executemany('''
+        INSERT INTO enrollments (student_id, faculty_id, subject)
+        VALUES (?, ?, ?)
+        ON CONFLICT(student_id, faculty_id, subject) DO NOTHING
+    ''', ((student_id, fid, subject) for student_id in student_ids for subject, fid in subj_fac))
+
+    # Top up baseline sessions per subject for totals
+    new_sessions = []
     for subject, fid in subj_fac:
-        # Count existing sessions for this mapping
-        cur.execute('SELECT COUNT(*) FROM sessions WHERE subject=? AND faculty_id=?', (subject, fid))
+        cur.execute('SELECT COUNT(*) FROM sessions WHERE faculty_id=? AND subject=?', (fid, subject))
         existing = cur.fetchone()[0]
-        to_create = max(0, 5 - existing)
-        for j in range(to_create):
-            cur.execute('INSERT INTO sessions (name, subject, faculty_id) VALUES (?, ?, ?)',
-                        (f"Class {existing + j + 1}", subject, fid))
+        new_sessions.extend((f"Class {n}", subject, fid) for n in range(existing + 1, sessions_per_subject + 1))
+    cur.executemany('INSERT INTO sessions (name, subject, faculty_id) VALUES (?, ?, ?)', new_sessions)
 
-    # Mark some attendance for demonstration: for first 2 sessions of each subject, mark ~50% students
-    # Get session ids per subject/faculty
+    # Mark every other student present in the first sessions of each subject/faculty
     cur.execute('SELECT id, subject, faculty_id FROM sessions ORDER BY id')
-    sessions = cur.fetchall()
-    # Build quick map subject->session_ids
     from collections import defaultdict
     sess_map = defaultdict(list)
-    for sid, subj, fid in sessions:
+    for sid, subj, fid in cur.fetchall():
         sess_map[(subj, fid)].append(sid)
-    # For determinism, mark attendance for every other student in first 2 sessions per subject
-    for (subj, fid), sids in sess_map.items():
-        for sid in sids[:2]:
-            for idx, student_id in enumerate(student_ids):
-                if idx % 2 == 0:  # roughly 50%
-                    try:
-                        cur.execute('INSERT INTO session_attendance (session_id, user_id) VALUES (?, ?)', (sid, student_id))
-                    except sqlite3.IntegrityError:
-                        pass
+    present = student_ids[::2]
+    marks = ((sid, student_id) for sids in sess_map.values() for sid in sids[:marked_sessions] for student_id in present)
+    n_marks = sum(len(sids[:marked_sessions]) for sids in sess_map.values()) * len(present)
+    if n_marks < BULK_COUNTER_THRESHOLD:
+        cur.executemany('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', marks)
+    else:
+        # Per-row counter triggers dominate large loads: suspend them and rebuild the counters once
+        cur.execute('DROP TRIGGER IF EXISTS trg_session_attendance_insert')
+        cur.execute('DROP TRIGGER IF EXISTS trg_versions_mark')
+        cur.executemany('INSERT OR IGNORE INTO session_attendance (session_id, user_id) VALUES (?, ?)', marks)
+        ensure_attendance_counters(cur)
+        rebuild_attendance_counters(cur)
+        ensure_attendance_versions(cur)
+        bump_attendance_versions(cur)
+
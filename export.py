@@ -0,0 +1,169 @@
+"""Streaming attendance export to CSV, gzip'd CSV, Parquet or Arrow.
+
+Rows come from db.py's cursor iterators (fetchmany batches, never
+fetchall), are encoded CHUNK_ROWS at a time and handed on as bytes, so a
+multi-million-row export runs in constant memory whether it is written to
+a file by the CLI or streamed to a browser by the Flask route.
+
+Two sources:
+  sessions    session_attendance joined with sessions and users (what the
+              web app and scan endpoints record); filterable by date range,
+              faculty and subject
+  attendance  the webcam scanner's daily table; filterable by date range
+
+Parquet and Arrow output need the optional pyarrow package.
+"""
+import csv
+import io
+import zlib
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from db import iter_attendance_rows, iter_session_marks
+
+CHUNK_ROWS = 5000  # rows encoded per output chunk (and per Parquet row group batch)
+
+# (column, is_integer) per source, in the order the db iterators yield them
+SESSION_COLUMNS = [
+    ('mark_id', True), ('session_id', True), ('session', False), ('date', False), ('subject', False),
+    ('faculty_id', False), ('user_id', False), ('name', False), ('roll', False), ('marked_at', False),
+]
+ATTENDANCE_COLUMNS = [('att_id', True), ('user_id', False), ('name', False), ('roll', False), ('timestamp', False)]
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', '.csv'),
+    'csv.gz': ('application/gzip', '.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrow'),
+}
+SOURCES = ('sessions', 'attendance')
+
+
+def format_for_path(path: str) -> str:
+    """Pick the output format from a file name (defaults to csv)."""
+    lower = path.lower()
+    for fmt, (_, ext) in sorted(FORMATS.items(), key=lambda f: -len(f[1][1])):
+        if lower.endswith(ext):
+            return fmt
+    return 'csv'
+
+
+def select_rows(source: str = 'sessions', date_from: Optional[str] = None, date_to: Optional[str] = None,
+                faculty_id: Optional[str] = None, subject: Optional[str] = None) -> Tuple[list, Iterator[tuple]]:
+    """Return (columns, row iterator) for source with the given filters."""
+    if source == 'sessions':
+        return SESSION_COLUMNS, iter_session_marks(date_from, date_to, faculty_id, subject)
+    if source == 'attendance':
+        if faculty_id or subject:
+            raise ValueError('the attendance source has no faculty or subject to filter on')
+        return ATTENDANCE_COLUMNS, iter_attendance_rows(date_from, date_to)
+    raise ValueError(f'unknown export source {source!r} (expected one of {", ".join(SOURCES)})')
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _csv_chunks(columns, rows) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    yield buf.getvalue().encode('utf-8')
+    for batch in _batches(rows, CHUNK_ROWS):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(batch)
+        yield buf.getvalue().encode('utf-8')
+
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # wbits=31 writes a gzip header/trailer, so the stream is a plain .gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes until the caller takes them."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _require_pyarrow(fmt: str):
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError(f'{fmt} export needs pyarrow: pip install pyarrow')
+    return pyarrow
+
+
+def _arrow_chunks(pa, columns, rows, fmt: str) -> Iterator[bytes]:
+    schema = pa.schema([(name, pa.int64() if is_int else pa.string()) for name, is_int in columns])
+    sink = ChunkSink()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    for batch in _batches(rows, CHUNK_ROWS):
+        values = list(zip(*batch))
+        write(pa.record_batch([pa.array(values[i], type=schema.field(i).type) for i in range(len(columns))],
+                              schema=schema))
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    yield sink.take()
+
+
+def stream_export(fmt: str = 'csv', source: str = 'sessions', **filters) -> Iterator[bytes]:
+    """Return an iterator of encoded byte chunks; filters are those of select_rows()."""
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown export format {fmt!r} (expected one of {", ".join(FORMATS)})')
+    columns, rows = select_rows(source, **filters)
+    if fmt == 'csv':
+        return _csv_chunks(columns, rows)
+    if fmt == 'csv.gz':
+        return _gzip_chunks(_csv_chunks(columns, rows))
+    # Fail before the first byte is sent rather than halfway through a download
+    pa = _require_pyarrow(fmt)
+    return _arrow_chunks(pa, columns, rows, fmt)
+
+
+def export_to_file(out_path: str, fmt: Optional[str] = None, source: str = 'sessions', **filters) -> int:
+    """Stream an export into out_path (format from its extension unless given); returns bytes written."""
+    written = 0
+    with open(out_path, 'wb') as f:
+        for chunk in stream_export(fmt or format_for_path(out_path), source, **filters):
+            f.write(chunk)
+            written += len(chunk)
+    return written
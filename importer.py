@@ -0,0 +1,172 @@
+"""Streaming CSV importers behind main.py add_users / apply_credentials / apply_enrollments.
+
+CSV files are read in chunks, faculty/roll lookups are answered from an
+in-memory index built once from the users table, and each chunk is written
+with executemany in a single transaction. Password hashing for credential
+files fans out over a process pool.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from db import bulk_add_users, bulk_upsert_enrollments, bulk_upsert_users, list_user_rows
+from passwords import hash_password
+
+CHUNK_SIZE = 5000
+# Below this many passwords a process pool costs more than it saves
+POOL_MIN_ROWS = 64
+
+
+def iter_chunks(csv_path: str, size: int = CHUNK_SIZE) -> Iterator[List[dict]]:
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = list(islice(reader, size))
+            if not chunk:
+                return
+            yield chunk
+
+
+class Progress:
+    """Prints rows processed and throughput after each chunk."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def advance(self, n: int):
+        self.rows += n
+        print(f'{self.label}: {self.rows} rows ({self.rate():.0f} rows/s)', flush=True)
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def done(self):
+        print(f'{self.label}: finished {self.rows} rows in {time.perf_counter() - self.started:.1f}s '
+              f'({self.rate():.0f} rows/s)')
+
+
+class UserIndex:
+    """In-memory view of the users table: id -> row and student roll -> id."""
+
+    def __init__(self):
+        self.by_id: Dict[str, Tuple[str, str, str, str, str]] = {}
+        self.student_by_roll: Dict[str, str] = {}
+        for row in list_user_rows():
+            self.put(row)
+
+    def put(self, row: Tuple[str, str, str, str, str]):
+        self.by_id[row[0]] = row
+        if row[4] == 'student' and row[2]:
+            self.student_by_roll.setdefault(row[2], row[0])
+
+    def get(self, user_id: str) -> Optional[Tuple[str, str, str, str, str]]:
+        return self.by_id.get(user_id)
+
+    def get_student_by_roll(self, roll: str) -> Optional[Tuple[str, str, str, str, str]]:
+        uid = self.student_by_roll.get(roll)
+        row = self.by_id.get(uid) if uid else None
+        return row if row and row[4] == 'student' else None
+
+
+def hash_passwords(passwords: List[str], pool: Optional[ProcessPoolExecutor], workers: int = 1) -> List[str]:
+    if pool is None or len(passwords) < POOL_MIN_ROWS:
+        return [hash_password(p) for p in passwords]
+    return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def import_users(csv_path: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """Add/replace users from an id,name,roll,email CSV. Returns the number of rows written."""
+    progress = Progress('add_users')
+    for chunk in iter_chunks(csv_path, chunk_size):
+        rows = []
+        for r in chunk:
+            uid = r.get('id') or r.get('ID') or r.get('user_id')
+            rows.append((uid, r.get('name') or '', r.get('roll') or '', r.get('email') or ''))
+        bulk_add_users(rows)
+        progress.advance(len(rows))
+    progress.done()
+    return progress.rows
+
+
+def import_credentials(csv_path: str, chunk_size: int = CHUNK_SIZE, workers: Optional[int] = None) -> Tuple[int, int]:
+    """Apply a username,password,role,description CSV. Returns (updated, created).
+
+    Faculty usernames are user ids; student usernames are registration numbers
+    (rolls), and unknown students are created with id == roll.
+    """
+    index = UserIndex()
+    updated = created = 0
+    progress = Progress('apply_credentials')
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for chunk in iter_chunks(csv_path, chunk_size):
+            valid = []
+            for r in chunk:
+                username = (r.get('username') or '').strip()
+                password = (r.get('password') or '').strip()
+                role = (r.get('role') or '').strip().lower()
+                if username and password and role in ('faculty', 'student'):
+                    valid.append((username, password, role, r.get('description')))
+            hashes = hash_passwords([v[1] for v in valid], pool, workers)
+            rows = []
+            for (username, _, role, description), pw_hash in zip(valid, hashes):
+                if role == 'faculty':
+                    existing = index.get(username)
+                    name = description or username
+                    if existing:
+                        row = (username, existing[1] or name, existing[2] or '', existing[3] or '', 'faculty')
+                        updated += 1
+                    else:
+                        row = (username, name, '', '', 'faculty')
+                        created += 1
+                else:
+                    existing = index.get_student_by_roll(username)
+                    if existing:
+                        row = (existing[0], existing[1], existing[2], existing[3], 'student')
+                        updated += 1
+                    else:
+                        # create with id same as roll
+                        row = (username, description or username, username, '', 'student')
+                        created += 1
+                index.put(row)
+                rows.append(row + (pw_hash,))
+            bulk_upsert_users(rows)
+            progress.advance(len(chunk))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    progress.done()
+    return updated, created
+
+
+def import_enrollments(csv_path: str, chunk_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+    """Apply a subject,faculty_id,student_roll CSV. Returns (applied, skipped)."""
+    index = UserIndex()
+    applied = skipped = 0
+    progress = Progress('apply_enrollments')
+    for chunk in iter_chunks(csv_path, chunk_size):
+        rows = []
+        for r in chunk:
+            subject = (r.get('subject') or '').strip()
+            faculty_id = (r.get('faculty_id') or '').strip()
+            student_roll = (r.get('student_roll') or '').strip()
+            if not subject or not faculty_id or not student_roll:
+                skipped += 1
+                continue
+            fac = index.get(faculty_id)
+            stu = index.get_student_by_roll(student_roll)
+            if not fac or fac[4] != 'faculty' or not stu:
+                skipped += 1
+                continue
+            rows.append((stu[0], faculty_id, subject))
+        bulk_upsert_enrollments(rows)
+        applied += len(rows)
+        progress.advance(len(chunk))
+    progress.done()
+    return applied, skipped
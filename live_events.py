@@ -0,0 +1,187 @@
+"""In-process fan-out of session attendance changes to live roster viewers.
+
+db.py reports every mark/unmark made in this process through
+add_attendance_listener(); the hub turns those into per-session events and
+copies each one to every subscriber's queue, so any number of open
+session_detail pages share one event stream instead of each re-running
+session_attendance_roster.
+
+Marks made by other worker processes never reach this process's listener,
+so while a session has viewers a single poller thread per process re-reads
+its marked set (one indexed query per watched session per POLL_SECONDS)
+and publishes the difference.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from db import add_attendance_listener, list_session_marks
+
+POLL_SECONDS = float(os.environ.get('LIVE_POLL_SECONDS', '2'))
+SUBSCRIBER_QUEUE_SIZE = 256  # events buffered per viewer before it is resynced with a snapshot
+HEARTBEAT_SECONDS = 15.0  # idle SSE connections get a comment this often
+# Streams one threaded (WSGI) worker may hold open; each pins a request thread for as long as the page is open
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', '2'))
+BUSY_RETRY_MS = 30000  # past the cap, browsers are told to try the stream again this much later
+
+
+class Subscriber:
+    """One viewer's queue of pending events for a session."""
+
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.events = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def push(self, event: dict):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # Slow client: drop its backlog and let it re-read the full state
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        while True:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+class _Channel:
+    def __init__(self, marked: Set[str]):
+        self.marked = marked
+        self.subscribers: Set[Subscriber] = set()
+        self.seq = 0  # bumped on every event, so the poller can spot local changes mid-query
+
+
+class LiveHub:
+    """Per-session fan-out of {'type': 'mark'|'unmark', 'user_id', 'seq'} events."""
+
+    def __init__(self, poll_seconds: float = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._channels: Dict[int, _Channel] = {}
+        self._poller = None
+        self._pid = None
+        self.published = 0
+        self.polls = 0
+
+    def subscribe(self, session_id: int, sub: Subscriber = None, limit: Optional[int] = None) -> Optional[Subscriber]:
+        """Start delivering session_id's events to sub (a new blocking Subscriber by default).
+
+        With limit, returns None instead when this hub already has that many subscribers.
+        """
+        sub = sub or Subscriber(session_id)
+        # Look up and join the channel under one lock hold: an unsubscribe in
+        # between could drop the channel and strand sub on an orphan
+        with self._lock:
+            if limit is not None and self._subscriber_count() >= limit:
+                return None
+            channel = self._channels.get(session_id)
+            if channel is not None:
+                channel.subscribers.add(sub)
+                self._ensure_poller()
+                return sub
+        marked = set(list_session_marks(session_id))  # outside the lock; it is a query
+        with self._lock:
+            if limit is not None and self._subscriber_count() >= limit:
+                return None
+            channel = self._channels.setdefault(session_id, _Channel(marked))
+            channel.subscribers.add(sub)
+            self._ensure_poller()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            channel = self._channels.get(sub.session_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(sub)
+            if not channel.subscribers:
+                del self._channels[sub.session_id]
+
+    def snapshot(self, session_id: int) -> List[str]:
+        """Marked user ids for a watched session, as this hub currently knows them."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            return sorted(channel.marked) if channel else []
+
+    def publish(self, session_id: int, user_id: str, marked: bool):
+        """Record a change; fans out only if someone is watching and it is news to the hub."""
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None or (user_id in channel.marked) == marked:
+                return
+            if marked:
+                channel.marked.add(user_id)
+            else:
+                channel.marked.discard(user_id)
+            channel.seq += 1
+            event = {'type': 'mark' if marked else 'unmark', 'user_id': user_id, 'seq': channel.seq}
+            subscribers = list(channel.subscribers)
+            self.published += 1
+        for sub in subscribers:
+            sub.push(event)
+
+    def _subscriber_count(self) -> int:
+        # Caller holds self._lock
+        return sum(len(c.subscribers) for c in self._channels.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._channels),
+                'subscribers': self._subscriber_count(),
+                'published': self.published,
+                'polls': self.polls,
+            }
+
+    def _ensure_poller(self):
+        # Caller holds self._lock; a forked worker needs its own thread
+        if self._poller is not None and self._pid == os.getpid() and self._poller.is_alive():
+            return
+        self._pid = os.getpid()
+        self._poller = threading.Thread(target=self._poll_loop, name='live-hub-poller', daemon=True)
+        self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                watched = [(sid, c.seq) for sid, c in self._channels.items()]
+            if not watched:
+                with self._lock:
+                    if not self._channels:
+                        self._poller = None
+                        return
+                continue
+            for session_id, seq in watched:
+                try:
+                    current = set(list_session_marks(session_id))
+                except Exception:
+                    continue
+                with self._lock:
+                    channel = self._channels.get(session_id)
+                    self.polls += 1
+                    # A local event landed while we were querying; the next poll will catch up
+                    if channel is None or channel.seq != seq:
+                        continue
+                    added = current - channel.marked
+                    removed = channel.marked - current
+                for user_id in added:
+                    self.publish(session_id, user_id, True)
+                for user_id in removed:
+                    self.publish(session_id, user_id, False)
+
+
+hub = LiveHub()
+add_attendance_listener(hub.publish)
@@ -0,0 +1,126 @@
+"""Concurrent-scanner load test for /api/scan_mark.
+
+Opens one keep-alive connection per simulated scanner and has each post
+scans back to back for a fixed duration, then prints throughput and
+p50/p95/p99 latency. Point it at the WSGI (gunicorn) and ASGI (uvicorn)
+servers in turn to compare them:
+
+    python main.py load_test http://127.0.0.1:8000 500 20
+
+The server must use the same attendance.db and SECRET_KEY as this
+process: the test creates a throwaway session, signs a session cookie
+for the admin account locally and scans the existing students' codes.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from db import create_session, list_students
+from qr_payload import encode_payload
+
+
+def _session_cookie(user_id: str) -> str:
+    from app import app
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': user_id})}"
+
+
+async def _read_response(reader) -> int:
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).strip() or b'0', 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status if headers.get('connection') != 'close' else -status
+
+
+async def _scanner(host: str, port: int, cookie: str, payloads: List[str], session_id: int,
+                   deadline: float, latencies: List[float], statuses: Dict[int, int]):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                statuses[0] = statuses.get(0, 0) + 1
+                await asyncio.sleep(0.05)
+                continue
+        body = json.dumps({'payload': random.choice(payloads), 'session_id': session_id}).encode()
+        request = (f'POST /api/scan_mark HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n'
+                   f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n').encode() + body
+        t0 = time.perf_counter()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status = await _read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            statuses[0] = statuses.get(0, 0) + 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - t0)
+        statuses[abs(status)] = statuses.get(abs(status), 0) + 1
+        if status < 0:  # server closed the keep-alive connection
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+async def _run(base_url: str, scanners: int, seconds: float, session_id: int, user_id: str) -> dict:
+    url = urlsplit(base_url)
+    host, port = url.hostname or '127.0.0.1', url.port or 80
+    payloads = [encode_payload(s[0]) for s in list_students()]
+    if not payloads:
+        raise SystemExit('No students in the database; run python main.py seed_demo first')
+    cookie = _session_cookie(user_id)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    started = time.perf_counter()
+    deadline = started + seconds
+    await asyncio.gather(*[_scanner(host, port, cookie, payloads, session_id, deadline, latencies, statuses)
+                           for _ in range(scanners)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] * 1000) if latencies else 0.0,
+        'statuses': statuses,
+    }
+
+
+def run(base_url: str, scanners: int = 500, seconds: float = 20.0, session_id: int = None,
+        user_id: str = 'jaga') -> dict:
+    """Hammer base_url/api/scan_mark from `scanners` concurrent connections and print latency percentiles."""
+    if session_id is None:
+        session_id = create_session('Load test', subject='Load test', faculty_id=user_id)
+    report = asyncio.run(_run(base_url, scanners, seconds, session_id, user_id))
+    print(f"{scanners} scanners for {seconds:.0f}s against {base_url} (session {session_id}): "
+          f"{report['requests']} requests, {report['rps']:.0f} req/s, "
+          f"p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms, "
+          f"max {report['max_ms']:.1f} ms; statuses {report['statuses']}")
+    return report
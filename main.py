@@ -1,105 +1,165 @@
-import sys, csv, os
-from db import init_db, add_users_from_list, export_attendance_csv, get_user_auth, get_user_by_roll, upsert_user_with_auth, upsert_enrollment
-from werkzeug.security import generate_password_hash
+import sys, csv, os, time
+from db import init_db, seed_demo_data, get_session
+from importer import import_users, import_credentials, import_enrollments
 from qr_generator import generate_qr_from_db
-from scanner import run_scanner
 
 def cmd_init_db():
     init_db()
     print('Database initialized (attendance.db)')
 
+def cmd_seed_demo(args):
+    # Optional counts: --faculties N --students N --subjects N --sessions N --marked N; --force re-seeds
+    names = {'--faculties': 'faculties', '--students': 'students', '--subjects': 'subjects',
+             '--sessions': 'sessions_per_subject', '--marked': 'marked_sessions'}
+    force = '--force' in args
+    args = [a for a in args if a != '--force']
+    if len(args) % 2:
+        print('Missing value for', args[-1]); return
+    counts = {}
+    for flag, value in zip(args[::2], args[1::2]):
+        if flag not in names:
+            print('Unknown option:', flag); return
+        least = 0 if flag == '--marked' else 1
+        if not value.isascii() or not value.isdigit() or int(value) < least:
+            print(f'{flag} needs a whole number >= {least}, got {value!r}'); return
+        counts[names[flag]] = int(value)
+    t0 = time.perf_counter()
+    if not seed_demo_data(force=force, **counts):
+        print('Data already present; nothing seeded (use --force to reload the demo defaults)')
+        return
+    elapsed = time.perf_counter() - t0
+    print(f'Demo data loaded in {elapsed:.1f}s', counts or '(7 faculties, 70 students, 7 subjects)')
+
 def cmd_add_users(csv_path):
     if not os.path.exists(csv_path):
         print('CSV not found:', csv_path); return
-    rows = []
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            uid = r.get('id') or r.get('ID') or r.get('user_id')
-            name = r.get('name') or ''
-            roll = r.get('roll') or ''
-            email = r.get('email') or ''
-            rows.append((uid, name, roll, email))
-    add_users_from_list(rows)
-    print(f'Added/updated {len(rows)} users from', csv_path)
-
-def cmd_gen_qr():
-    created = generate_qr_from_db()
+    init_db()
+    count = import_users(csv_path)
+    print(f'Added/updated {count} users from', csv_path)
+
+def cmd_gen_qr(args):
+    # --full re-renders every user; --workers N sizes the process pool
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+    created = generate_qr_from_db(incremental='--full' not in args, workers=workers)
     print('Generated', len(created), 'QR images in qrcodes/')
 
 def cmd_scan():
+    # OpenCV is only needed for the webcam scanner
+    from scanner import run_scanner
     run_scanner()
 
-def cmd_export(out_path):
-    export_attendance_csv(out_path)
-    print('Exported attendance to', out_path)
+def cmd_bench_scan(video_path, modes=None):
+    from scanner import bench_scan
+    if not os.path.exists(video_path):
+        print('Video not found:', video_path); return
+    bench_scan(video_path, tuple(modes.split(',')) if modes else ('single', 'multi', 'roi'))
+
+def cmd_scan_file(path, session_id, workers=None):
+    from scanner import scan_file
+    if not os.path.exists(path):
+        print('File or directory not found:', path); return
+    init_db()
+    if not get_session(int(session_id)):
+        print('Session not found:', session_id); return
+    scan_file(path, int(session_id), int(workers) if workers else None)
+
+def cmd_bench_payload(count=200, module_px=3):
+    from qr_payload import bench_payload
+    bench_payload(int(count), int(module_px))
+
+def cmd_load_test(base_url, scanners=500, seconds=20, session_id=None):
+    from loadtest import run
+    init_db()
+    run(base_url, int(scanners), float(seconds), int(session_id) if session_id else None)
+
+def cmd_bench_login(method=None, seconds=5, threads=None):
+    from passwords import bench_login
+    bench_login(method or None, float(seconds), int(threads) if threads else None)
+
+def cmd_export(out_path, args):
+    # Optional: --source sessions|attendance --from DATE --to DATE --faculty ID --subject NAME --format FMT
+    from export import export_to_file
+    names = {'--source': 'source', '--from': 'date_from', '--to': 'date_to', '--faculty': 'faculty_id',
+             '--subject': 'subject', '--format': 'fmt'}
+    options = {}
+    for flag, value in zip(args[::2], args[1::2]):
+        if flag not in names:
+            print('Unknown option:', flag); return
+        options[names[flag]] = value
+    init_db()
+    t0 = time.perf_counter()
+    try:
+        written = export_to_file(out_path, **options)
+    except (ValueError, RuntimeError) as e:
+        print('Export failed:', e); return
+    print(f'Exported attendance to {out_path} ({written / 1e6:.1f} MB in {time.perf_counter() - t0:.1f}s)')
+
+def cmd_reports(out_path, args):
+    # Optional: --faculty ID --subject NAME --workers N (default: every student)
+    from reports import write_zip
+    from db import list_enrolled_students, list_students
+    names = {'--faculty': 'faculty', '--subject': 'subject', '--workers': 'workers'}
+    options = {}
+    for flag, value in zip(args[::2], args[1::2]):
+        if flag not in names:
+            print('Unknown option:', flag); return
+        options[names[flag]] = value
+    init_db()
+    if options.get('faculty'):
+        students = list_enrolled_students(options['faculty'], options.get('subject'))
+    elif options.get('subject'):
+        print('--subject needs --faculty'); return
+    else:
+        students = list_students()
+    t0 = time.perf_counter()
+    count = write_zip(out_path, [s[0] for s in students], int(options['workers']) if 'workers' in options else None)
+    elapsed = time.perf_counter() - t0
+    print(f'Wrote {count} reports to {out_path} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s)')
 
-def cmd_apply_credentials(csv_path):
+def cmd_apply_credentials(csv_path, workers=None):
     if not os.path.exists(csv_path):
         print('CSV not found:', csv_path); return
     init_db()
-    updated = 0
-    created = 0
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            username = (r.get('username') or '').strip()
-            password = (r.get('password') or '').strip()
-            role = (r.get('role') or '').strip().lower()
-            if not username or not password or not role:
-                continue
-            pw_hash = generate_password_hash(password)
-            if role == 'faculty':
-                existing = get_user_auth(username)
-                name = r.get('description') or username
-                if existing:
-                    upsert_user_with_auth(username, existing[1] or name, existing[2] or '', existing[3] or '', 'faculty', pw_hash)
-                    updated += 1
-                else:
-                    upsert_user_with_auth(username, name, '', '', 'faculty', pw_hash)
-                    created += 1
-            elif role == 'student':
-                # username is the registration number (roll)
-                existing = get_user_by_roll(username)
-                if existing:
-                    upsert_user_with_auth(existing[0], existing[1], existing[2], existing[3], 'student', pw_hash)
-                    updated += 1
-                else:
-                    # create with id same as roll
-                    upsert_user_with_auth(username, r.get('description') or username, username, '', 'student', pw_hash)
-                    created += 1
+    updated, created = import_credentials(csv_path, workers=int(workers) if workers else None)
     print(f'Credentials applied. Updated={updated}, Created={created}')
 
 def cmd_apply_enrollments(csv_path):
     if not os.path.exists(csv_path):
         print('CSV not found:', csv_path); return
     init_db()
-    applied = 0
-    skipped = 0
-    with open(csv_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            subject = (r.get('subject') or '').strip()
-            faculty_id = (r.get('faculty_id') or '').strip()
-            student_roll = (r.get('student_roll') or '').strip()
-            if not subject or not faculty_id or not student_roll:
-                skipped += 1; continue
-            fac = get_user_auth(faculty_id)
-            stu = get_user_by_roll(student_roll)
-            if not fac or fac[4] != 'faculty' or not stu:
-                skipped += 1; continue
-            upsert_enrollment(stu[0], faculty_id, subject)
-            applied += 1
+    applied, skipped = import_enrollments(csv_path)
     print(f'Enrollments applied. Applied={applied}, Skipped={skipped}')
 
+def cmd_check_plans(students=50000, marks=1000000):
+    from query_plans import run
+    if not run(int(students), int(marks)):
+        sys.exit(1)
+
+def cmd_bench_summary(sessions=10000, students=20000):
+    from query_plans import bench_summary
+    bench_summary(int(sessions), int(students))
+
 def print_help():
     print('Usage: python main.py <command> [args]')
     print('Commands:')
     print('  init_db                Initialize the SQLite database')
+    print('  seed_demo [--faculties N --students N --subjects N --sessions N --marked N] [--force]')
+    print('                         Load demo users, enrollments and sessions (skipped if users exist)')
     print('  add_users <csv_path>   Add users from CSV (id,name,roll,email)')
-    print('  gen_qr                 Generate QR PNG files for users from DB')
+    print('  gen_qr [--full] [--workers N]  Generate QR PNGs for new/changed users (all with --full)')
     print('  scan                   Start webcam scanner to mark attendance')
-    print('  export <out.csv>       Export attendance records to CSV')
+    print('  scan_file <video|dir> <session_id> [workers]  Mark a session from a recording or photo folder')
+    print('  bench_scan <video> [modes]  Compare QR decode modes (single,multi,roi) on a recording')
+    print('  bench_payload [count] [px]  Compare legacy vs compact QR payloads (version, parse, decode)')
+    print('  load_test <base_url> [scanners] [seconds] [session_id]  p50/p99 of concurrent /api/scan_mark')
+    print('  bench_login [method] [seconds] [threads]  Password verifies per second (and per core)')
+    print('  export <out> [--source sessions|attendance --from DATE --to DATE --faculty ID --subject NAME]')
+    print('                         Stream attendance to .csv, .csv.gz, .parquet or .arrow (by extension or --format)')
+    print('  reports <out.zip> [--faculty ID --subject NAME --workers N]  Bulk student report PDFs as a ZIP')
+    print('  apply_credentials <csv> [workers]  Bulk-apply username,password,role CSV (parallel hashing)')
+    print('  apply_enrollments <csv>            Bulk-apply subject,faculty_id,student_roll CSV')
+    print('  check_plans [students] [marks]  Fail on full table scans in db.py queries (synthetic DB)')
+    print('  bench_summary [sessions] [students]  Time the student dashboard summaries on a synthetic DB')
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
@@ -107,17 +167,35 @@ if __name__ == '__main__':
     cmd = sys.argv[1]
     if cmd == 'init_db':
         cmd_init_db()
+    elif cmd == 'seed_demo':
+        cmd_seed_demo(sys.argv[2:])
     elif cmd == 'add_users' and len(sys.argv) >= 3:
         cmd_add_users(sys.argv[2])
     elif cmd == 'gen_qr':
-        cmd_gen_qr()
+        cmd_gen_qr(sys.argv[2:])
     elif cmd == 'scan':
         cmd_scan()
+    elif cmd == 'scan_file' and len(sys.argv) >= 4:
+        cmd_scan_file(*sys.argv[2:5])
+    elif cmd == 'bench_scan' and len(sys.argv) >= 3:
+        cmd_bench_scan(*sys.argv[2:4])
+    elif cmd == 'bench_payload':
+        cmd_bench_payload(*sys.argv[2:4])
+    elif cmd == 'load_test' and len(sys.argv) >= 3:
+        cmd_load_test(*sys.argv[2:6])
+    elif cmd == 'bench_login':
+        cmd_bench_login(*sys.argv[2:5])
     elif cmd == 'export' and len(sys.argv) >= 3:
-        cmd_export(sys.argv[2])
+        cmd_export(sys.argv[2], sys.argv[3:])
+    elif cmd == 'reports' and len(sys.argv) >= 3:
+        cmd_reports(sys.argv[2], sys.argv[3:])
     elif cmd == 'apply_credentials' and len(sys.argv) >= 3:
-        cmd_apply_credentials(sys.argv[2])
+        cmd_apply_credentials(*sys.argv[2:4])
     elif cmd == 'apply_enrollments' and len(sys.argv) >= 3:
         cmd_apply_enrollments(sys.argv[2])
+    elif cmd == 'check_plans':
+        cmd_check_plans(*sys.argv[2:4])
+    elif cmd == 'bench_summary':
+        cmd_bench_summary(*sys.argv[2:4])
     else:
         print_help()
@@ -0,0 +1,315 @@
+"""Opt-in request timing, SQL accounting and sampled profiling (METRICS_ENABLED=1).
+
+When enabled, install(app) wraps:
+  - every Flask request: latency per endpoint (URL rule) and status, plus
+    the SQL statements issued and time spent in db.py helpers while serving it
+  - every db.py query helper (the public functions query_plans does not list
+    as plumbing): calls, time and SQL statements, counted with a sqlite3
+    trace callback on each pooled connection
+  - the known CPU hot spots: password hashing (PBKDF2), report rendering
+    (reportlab) and QR rendering (qrcode)
+
+/metrics serves it all in Prometheus text format, latency as summaries with
+p50/p95/p99 over the last METRICS_RESERVOIR observations per series. Set
+METRICS_TOKEN to let a scraper in with "Authorization: Bearer <token>";
+without it only the admin session may read it. Figures are per worker
+process, like /admin/stats.
+
+Set PROFILE_SAMPLE (0..1) to run cProfile on that fraction of requests; a
+sampled request slower than PROFILE_SLOW_MS is dumped to PROFILE_DIR as a
+.prof file (read it with python -m pstats), keeping the newest PROFILE_KEEP.
+
+Streaming responses (exports, report ZIPs, live events) are timed until
+their first byte; the body is produced after the request hooks have run.
+Reports that bulk_reports() renders on its process pool are not counted in
+the reportlab section (the workers keep their own registries).
+"""
+import cProfile
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+RESERVOIR_SIZE = int(os.environ.get('METRICS_RESERVOIR', '2048'))
+PROFILE_SAMPLE = float(os.environ.get('PROFILE_SAMPLE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = 'attendance'
+
+# (module, function, section label) for the non-SQL hot spots
+SECTIONS = [
+    ('passwords', 'verify_password', 'pbkdf2'),
+    ('passwords', 'hash_password', 'pbkdf2'),
+    ('reports', 'render_report', 'reportlab'),
+    ('qr_cache', 'render_qr', 'qrcode'),
+]
+
+_local = threading.local()
+
+
+class _Series:
+    """Count and sum of every observation, plus a ring of recent ones for quantiles."""
+
+    __slots__ = ('count', 'total', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def quantiles(self) -> Dict[float, float]:
+        values = sorted(self.recent)
+        if not values:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: values[min(len(values) - 1, int(len(values) * q))] for q in QUANTILES}
+
+
+class Registry:
+    """Per-process metric store; every method is thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str], _Series] = {}
+        self.statuses: Dict[Tuple[str, str, int], int] = {}
+        self.request_sql: Dict[str, list] = {}  # endpoint -> [statements, db seconds]
+        self.helpers: Dict[str, _Series] = {}
+        self.helper_statements: Dict[str, int] = {}
+        self.sections: Dict[str, _Series] = {}
+        self.profiles_written = 0
+
+    def observe_request(self, endpoint: str, method: str, status: int, seconds: float,
+                        statements: int = 0, db_seconds: float = 0.0):
+        with self._lock:
+            self.requests.setdefault((endpoint, method), _Series()).observe(seconds)
+            key = (endpoint, method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            sql = self.request_sql.setdefault(endpoint, [0, 0.0])
+            sql[0] += statements
+            sql[1] += db_seconds
+
+    def observe_helper(self, name: str, seconds: float, statements: int):
+        with self._lock:
+            self.helpers.setdefault(name, _Series()).observe(seconds)
+            self.helper_statements[name] = self.helper_statements.get(name, 0) + statements
+
+    def observe_section(self, name: str, seconds: float):
+        with self._lock:
+            self.sections.setdefault(name, _Series()).observe(seconds)
+
+    def note_profile(self):
+        with self._lock:
+            self.profiles_written += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        out = []
+
+        def summary(name, help_text, series: Dict[tuple, _Series], labels):
+            out.append(f'# HELP {PREFIX}_{name} {help_text}')
+            out.append(f'# TYPE {PREFIX}_{name} summary')
+            for key, s in sorted(series.items()):
+                base = ','.join(f'{l}="{_escape(v)}"' for l, v in zip(labels, key))
+                for q, v in s.quantiles().items():
+                    out.append(f'{PREFIX}_{name}{{{base},quantile="{q}"}} {v:.6f}')
+                out.append(f'{PREFIX}_{name}_sum{{{base}}} {s.total:.6f}')
+                out.append(f'{PREFIX}_{name}_count{{{base}}} {s.count}')
+
+        def counter(name, help_text, values: Dict[tuple, float], labels):
+            out.append(f'# HELP {PREFIX}_{name} {help_text}')
+            out.append(f'# TYPE {PREFIX}_{name} counter')
+            for key, v in sorted(values.items()):
+                base = ','.join(f'{l}="{_escape(str(x))}"' for l, x in zip(labels, key))
+                out.append(f'{PREFIX}_{name}{{{base}}} {v:g}' if base else f'{PREFIX}_{name} {v:g}')
+
+        with self._lock:
+            summary('request_duration_seconds', 'Request latency by endpoint.', self.requests, ('endpoint', 'method'))
+            counter('requests_total', 'Requests by endpoint and status.', self.statuses,
+                    ('endpoint', 'method', 'status'))
+            counter('request_sql_statements_total', 'SQL statements issued while serving requests.',
+                    {(e,): v[0] for e, v in self.request_sql.items()}, ('endpoint',))
+            counter('request_db_seconds_total', 'Time spent in db.py helpers while serving requests.',
+                    {(e,): round(v[1], 6) for e, v in self.request_sql.items()}, ('endpoint',))
+            summary('db_helper_duration_seconds', 'db.py helper call latency.',
+                    {(k,): s for k, s in self.helpers.items()}, ('helper',))
+            counter('db_helper_sql_statements_total', 'SQL statements issued by each db.py helper.',
+                    {(k,): v for k, v in self.helper_statements.items()}, ('helper',))
+            summary('section_duration_seconds', 'Time in CPU-heavy sections (pbkdf2, reportlab, qrcode).',
+                    {(k,): s for k, s in self.sections.items()}, ('section',))
+            counter('profiles_written_total', 'Slow-request cProfile dumps written.', {(): self.profiles_written}, ())
+        return '\n'.join(out) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def _statements() -> int:
+    return getattr(_local, 'statements', 0)
+
+
+def _count_statement(_sql):
+    _local.statements = getattr(_local, 'statements', 0) + 1
+
+
+def _wrap_helper(name: str, fn: Callable) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Helpers calling helpers are charged to the outermost one only
+        if getattr(_local, 'in_helper', False):
+            return fn(*args, **kwargs)
+        _local.in_helper = True
+        before = _statements()
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.in_helper = False
+            _local.db_seconds = getattr(_local, 'db_seconds', 0.0) + elapsed
+            registry.observe_helper(name, elapsed, _statements() - before)
+    return wrapper
+
+
+def _wrap_section(label: str, fn: Callable) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            registry.observe_section(label, time.perf_counter() - started)
+    return wrapper
+
+
+def _rebind(replacements: Dict[int, Callable]):
+    """Point every project module's references to a wrapped function at its wrapper."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None) or ''
+        if not os.path.abspath(path).startswith(root):
+            continue
+        for attr, value in list(vars(module).items()):
+            wrapper = replacements.get(id(value))
+            if wrapper is not None and wrapper is not value:
+                setattr(module, attr, wrapper)
+
+
+def instrument():
+    """Wrap the db.py query helpers and hot sections in every loaded project module. Idempotent."""
+    if getattr(instrument, 'done', False):
+        return
+    instrument.done = True
+    import db
+    import passwords, qr_cache, reports  # noqa: F401  (loaded so their sections can be wrapped)
+    from query_plans import NOT_QUERIES
+    replacements: Dict[int, Callable] = {}
+    for name, fn in inspect.getmembers(db, inspect.isfunction):
+        if (fn.__module__ != db.__name__ or name.startswith('_') or name in NOT_QUERIES
+                or inspect.isgeneratorfunction(fn)):
+            continue
+        replacements[id(fn)] = _wrap_helper(name, fn)
+    for module_name, attr, label in SECTIONS:
+        fn = getattr(sys.modules[module_name], attr)
+        replacements[id(fn)] = _wrap_section(label, fn)
+    _rebind(replacements)
+    # Count statements on every pooled connection opened from now on
+    open_conn = db._open_conn
+
+    def traced_open_conn():
+        conn = open_conn()
+        conn.set_trace_callback(_count_statement)
+        return conn
+
+    db._open_conn = traced_open_conn
+    db.close_conn()
+
+
+def _dump_profile(profile: cProfile.Profile, endpoint: str, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = ''.join(c if c.isalnum() else '_' for c in endpoint).strip('_') or 'root'
+    path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{slug}-{elapsed * 1000:.0f}ms.prof')
+    profile.dump_stats(path)
+    registry.note_profile()
+    dumps = sorted((os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')),
+                   key=os.path.getmtime)
+    for old in dumps[:-PROFILE_KEEP]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def install(app, authorize: Optional[Callable[[], bool]] = None):
+    """Instrument app (no-op unless METRICS_ENABLED=1) and serve /metrics."""
+    if not ENABLED:
+        return
+    from flask import Response, abort, g, request
+
+    instrument()
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = _statements()
+        _local.db_seconds = 0.0
+        g.metrics_profile = None
+        if PROFILE_SAMPLE and random.random() < PROFILE_SAMPLE:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return  # another profiler is active on this interpreter
+            g.metrics_profile = profile
+
+    @app.after_request
+    def _metrics_finish(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        profile = g.pop('metrics_profile', None)
+        if profile is not None:
+            profile.disable()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                _dump_profile(profile, endpoint, elapsed)
+        if endpoint != '/metrics':
+            registry.observe_request(endpoint, request.method, response.status_code, elapsed,
+                                     _statements() - g.pop('metrics_statements', 0),
+                                     getattr(_local, 'db_seconds', 0.0))
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(_exc):
+        # after_request is skipped when a response could not be built
+        profile = g.pop('metrics_profile', None)
+        if profile is not None:
+            profile.disable()
+
+    def metrics_view():
+        if METRICS_TOKEN:
+            if request.headers.get('Authorization', '') != f'Bearer {METRICS_TOKEN}':
+                abort(401)
+        elif authorize is None or not authorize():
+            abort(403)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
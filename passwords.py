@@ -0,0 +1,167 @@
+"""Password hashing policy and bounded, off-request verification.
+
+PASSWORD_METHOD selects the werkzeug hash method (e.g. pbkdf2:sha256:260000)
+for every new hash. Stored hashes made with other parameters keep working;
+needs_rehash() spots them so login can upgrade them transparently.
+
+Verification runs on a small thread pool (hashlib releases the GIL while
+hashing). VERIFY_WORKERS defaults to at most two threads, half the cores,
+so a login burst can never take every core from scan traffic; raise it on
+boxes that do little else. At most VERIFY_MAX_PENDING checks may be
+running or queued per process; a login that cannot get a slot within
+VERIFY_WAIT seconds fails fast with VerifyBusy instead of tying up a web
+thread that scan requests need.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from typing import Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_METHOD = os.environ.get('PASSWORD_METHOD', 'pbkdf2:sha256:260000')
+SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+
+
+def _default_workers(cpus: Optional[int] = None) -> int:
+    """Half the cores, capped at two: PBKDF2 must leave CPU for scans."""
+    return max(1, min(2, (cpus or os.cpu_count() or 1) // 2))
+
+
+VERIFY_WORKERS = int(os.environ.get('VERIFY_WORKERS', '0')) or _default_workers()
+VERIFY_MAX_PENDING = int(os.environ.get('VERIFY_MAX_PENDING', str(VERIFY_WORKERS * 2)))
+VERIFY_WAIT = float(os.environ.get('VERIFY_WAIT', '0.5'))  # seconds a web thread may wait for a free slot
+VERIFY_TIMEOUT = 10.0  # seconds to wait for the hash itself
+
+
+class VerifyBusy(Exception):
+    """Raised when the verification pool is saturated; callers should answer 503."""
+
+
+def hash_password(password: str) -> str:
+    """Hash password with the configured policy."""
+    return generate_password_hash(password, method=PASSWORD_METHOD, salt_length=SALT_LENGTH)
+
+
+@lru_cache(maxsize=1)
+def _policy_prefix() -> str:
+    # werkzeug fills in defaults (e.g. the iteration count), so read them off a real hash
+    return generate_password_hash('', method=PASSWORD_METHOD, salt_length=SALT_LENGTH).split('$', 1)[0]
+
+
+def needs_rehash(pw_hash: str) -> bool:
+    """True when pw_hash was made with parameters other than the current policy."""
+    return pw_hash.split('$', 1)[0] != _policy_prefix()
+
+
+class _VerifyPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.verified = self.rejected = self.rehashed = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Threads don't survive a fork; gunicorn workers build their own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pw-verify')
+                self._pid = os.getpid()
+            return self._executor
+
+    def count(self, name: str):
+        # Bumped from request and pool threads alike; += on an attribute is not atomic
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def counts(self) -> dict:
+        with self._lock:
+            return {'verified': self.verified, 'rejected': self.rejected, 'rehashed': self.rehashed}
+
+    def submit(self, fn, *args, wait: float = VERIFY_WAIT):
+        if not self._slots.acquire(timeout=wait):
+            self.count('rejected')
+            raise VerifyBusy()
+        try:
+            fut = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+
+_pool = _VerifyPool(VERIFY_WORKERS, VERIFY_MAX_PENDING)
+
+
+def verify_password(pw_hash: Optional[str], password: str) -> bool:
+    """Check password against pw_hash on the verify pool. Raises VerifyBusy when saturated."""
+    if not pw_hash:
+        return False
+    fut = _pool.submit(check_password_hash, pw_hash, password)
+    try:
+        ok = fut.result(VERIFY_TIMEOUT)
+    except FutureTimeout:
+        raise VerifyBusy()
+    _pool.count('verified')
+    return ok
+
+
+def rehash_in_background(user_id: str, password: str, save) -> bool:
+    """Queue save(user_id, hash_password(password)) on the pool; False if it is too busy to take it."""
+    def job():
+        save(user_id, hash_password(password))
+        _pool.count('rehashed')
+    try:
+        _pool.submit(job, wait=0)
+    except VerifyBusy:
+        return False  # try again on a later login
+    return True
+
+
+def stats() -> dict:
+    return {
+        'method': PASSWORD_METHOD,
+        'workers': _pool.workers,
+        'max_pending': _pool.max_pending,
+        **_pool.counts(),
+    }
+
+
+def bench_login(method: str = None, seconds: float = 5.0, threads: int = None) -> dict:
+    """Verify one hash from `threads` threads for `seconds`; report logins/s overall and per core."""
+    method = method or PASSWORD_METHOD
+    threads = threads or VERIFY_WORKERS
+    pw_hash = generate_password_hash('correct horse', method=method, salt_length=SALT_LENGTH)
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(i):
+        while time.perf_counter() < deadline:
+            check_password_hash(pw_hash, 'correct horse')
+            counts[i] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    total = sum(counts)
+    cores = min(threads, os.cpu_count() or 1)
+    result = {
+        'method': method,
+        'threads': threads,
+        'logins_per_sec': total / elapsed,
+        'per_core': total / elapsed / cores,
+        'ms_per_login': elapsed / total * 1000 * threads if total else 0.0,
+    }
+    print(f"{method}: {result['logins_per_sec']:.1f} logins/s with {threads} threads "
+          f"({result['per_core']:.1f}/s per core, {result['ms_per_login']:.0f} ms per verify)")
+    return result
@@ -0,0 +1,104 @@
+"""In-memory cache of rendered QR images served by the web app.
+
+Encoded PNG/SVG bytes are kept in a byte-size-capped LRU keyed by format and
+payload hash, so a dashboard hit never touches the disk and each payload is
+rendered at most once per process while it stays hot.
+"""
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Iterable, Optional, Tuple
+import qrcode
+from qr_generator import payload_hash
+from qr_payload import encode_payload
+
+QR_CACHE_MAX_BYTES = int(os.environ.get('QR_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+QR_CACHE_MAX_ITEMS = int(os.environ.get('QR_CACHE_MAX_ITEMS', '50000'))
+
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+class ByteLRU:
+    """Thread-safe LRU of bytes values bounded by total size and item count."""
+
+    def __init__(self, max_bytes: int, max_items: int):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes or len(self._data) > self.max_items:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_cache = ByteLRU(QR_CACHE_MAX_BYTES, QR_CACHE_MAX_ITEMS)
+
+
+def render_qr(payload: str, fmt: str = 'png') -> bytes:
+    buf = BytesIO()
+    if fmt == 'svg':
+        from qrcode.image.svg import SvgPathImage
+        qrcode.make(payload, image_factory=SvgPathImage).save(buf)
+    else:
+        qrcode.make(payload).save(buf)
+    return buf.getvalue()
+
+
+def get_qr(payload: str, fmt: str = 'png') -> Tuple[bytes, str]:
+    """Return (image bytes, etag) for payload, rendering on a cache miss."""
+    etag = f'{fmt}-{payload_hash(payload)}'
+    body = _cache.get(etag)
+    if body is None:
+        body = render_qr(payload, fmt)
+        _cache.put(etag, body)
+    return body, etag
+
+
+def prewarm(users: Iterable[Tuple[str, ...]], fmt: str = 'png') -> int:
+    """Render users (rows starting with the user id) into the cache ahead of time. Returns the count."""
+    n = 0
+    for user in users:
+        get_qr(encode_payload(user[0]), fmt)
+        n += 1
+    return n
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -1,37 +1,82 @@
 import qrcode
+import hashlib
+import json
 import os
-from db import get_user, add_user
+import time
+from concurrent.futures import ProcessPoolExecutor
+from db import list_user_rows
+from qr_payload import encode_payload
+
+QR_DIR = 'qrcodes'
+# uid -> sha1 of the payload last rendered to qrcodes/<uid>.png
+MANIFEST_PATH = os.path.join(QR_DIR, 'manifest.json')
+# Below this many images a process pool costs more than it saves
+POOL_MIN_JOBS = 32
 
 def ensure_qrcode_dir():
-    os.makedirs('qrcodes', exist_ok=True)
+    os.makedirs(QR_DIR, exist_ok=True)
+
+def payload_hash(payload: str) -> str:
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
 
 def generate_qr_for_user(user_id: str, payload: str):
     ensure_qrcode_dir()
     img = qrcode.make(payload)
-    path = os.path.join('qrcodes', f'{user_id}.png')
+    path = os.path.join(QR_DIR, f'{user_id}.png')
     img.save(path)
     return path
 
-def generate_qr_from_db():
-    # Expect users already in DB; we'll fetch using sqlite directly to iterate
-    import sqlite3
-    conn = sqlite3.connect('attendance.db')
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, roll, email FROM users')
-    rows = cur.fetchall()
-    conn.close()
+def _render_job(job):
+    user_id, payload = job
+    return generate_qr_for_user(user_id, payload)
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest: dict):
+    ensure_qrcode_dir()
+    tmp = MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp, MANIFEST_PATH)
+
+def generate_qr_from_db(incremental: bool = True, workers=None):
+    """Render qrcodes/<uid>.png for every user and return the paths written.
+
+    In incremental mode only users whose payload changed since the last run
+    (per the manifest) or whose PNG is missing are rendered. Rendering fans
+    out across a process pool.
+    """
+    started = time.perf_counter()
     ensure_qrcode_dir()
-    created = []
-    for r in rows:
-        user_id = r[0]
-        # payload: simple JSON-like string; scanner will read this whole string.
-        payload = f"{{'id':'{user_id}','name':'{r[1]}','roll':'{r[2]}','email':'{r[3]}'}}"
-        img = qrcode.make(payload)
-        path = os.path.join('qrcodes', f'{user_id}.png')
-        img.save(path)
-        created.append(path)
+    previous = load_manifest() if incremental else {}
+    manifest = {}
+    jobs = []
+    for user_id, *_ in list_user_rows():
+        payload = encode_payload(user_id)
+        digest = payload_hash(payload)
+        manifest[user_id] = digest
+        path = os.path.join(QR_DIR, f'{user_id}.png')
+        if previous.get(user_id) == digest and os.path.exists(path):
+            continue
+        jobs.append((user_id, payload))
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) >= POOL_MIN_JOBS:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            created = list(pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        created = [_render_job(job) for job in jobs]
+    save_manifest(manifest)
+    elapsed = time.perf_counter() - started
+    rate = len(created) / elapsed if elapsed > 0 else 0.0
+    print(f'Rendered {len(created)} QR codes, {len(manifest) - len(created)} unchanged, '
+          f'in {elapsed:.1f}s ({rate:.0f}/s)')
     return created
 
 if __name__ == '__main__':
     created = generate_qr_from_db()
-    print('Generated', len(created), 'QR files in qrcodes/')
\ No newline at end of file
+    print('Generated', len(created), 'QR files in qrcodes/')
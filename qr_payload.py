@@ -0,0 +1,284 @@
+"""Compact, versioned QR payloads and the parser shared by every scanner.
+
+Version 1 payloads look like ``SA1:S001:K3J7Q2ZA``: a prefix carrying the
+format version, the user id, and a 40-bit HMAC-SHA256 tag in base32. Every
+character is in the QR alphanumeric set, so codes stay at a low QR version
+(fewer, larger modules) and decode faster and from further away than the
+old ``{'id':..,'name':..,'roll':..,'email':..}`` strings. Ids containing
+characters outside that set (e.g. lowercase) are base32-encoded under the
+``SA1X:`` prefix.
+
+parse_payload() also accepts the legacy format unless QR_ACCEPT_LEGACY=0,
+so codes printed before the switch keep working.
+
+Version 2 payloads (``SA2:<id>:<window>:<tag>``) are rotating tokens shown
+on the student dashboard: the tag also covers the QR_ROTATE_SECONDS time
+window, so a token is only valid for the current and previous window and
+can be checked with nothing but the key and the clock. check_scan() layers
+a bounded per-process replay cache on top so a token cannot be reused in a
+different session.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional, Tuple
+
+PREFIX = 'SA1:'
+PREFIX_B32 = 'SA1X:'
+MAC_BYTES = 5  # 40-bit tag -> 8 base32 characters
+QR_PAYLOAD_KEY = os.environ.get('QR_PAYLOAD_KEY') or os.environ.get('SECRET_KEY', 'dev-secret-change')
+ACCEPT_LEGACY = os.environ.get('QR_ACCEPT_LEGACY', '1') == '1'
+TOKEN_PREFIX = 'SA2:'
+TOKEN_PREFIX_B32 = 'SA2X:'
+ROTATE_SECONDS = int(os.environ.get('QR_ROTATE_SECONDS', '30'))
+TOKEN_GRACE_WINDOWS = 1  # also accept the previous window (clock skew, slow scans)
+# Static (printed) codes are refused while the dashboard shows rotating tokens,
+# since anyone holding a copy could mark its owner; set QR_ACCEPT_STATIC=1 for printed cards
+ACCEPT_STATIC = os.environ.get('QR_ACCEPT_STATIC', '0' if os.environ.get('QR_ROTATING', '1') == '1' else '1') == '1'
+REPLAY_CACHE_SIZE = int(os.environ.get('QR_REPLAY_CACHE_SIZE', '200000'))
+
+# Keyed once; copying the primed HMAC skips re-hashing the key for every tag
+_HMAC = hmac.new(QR_PAYLOAD_KEY.encode('utf-8'), digestmod=hashlib.sha256)
+# QR alphanumeric charset, minus the ':' separator and the space
+_RAW_ID = re.compile(r'^[0-9A-Z$%*+\-./]+$')
+_LEGACY_TOKEN = "'id':'"
+# A well-formed tag; checked first because compare_digest raises on non-ASCII str
+_TAG = re.compile(r'[A-Z2-7]{8}')
+_WINDOW = re.compile(r'[0-9]{1,12}')
+# Base32 digit pairs for each 10-bit value: a 40-bit tag is four lookups
+_B32 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+_B32_PAIRS = [a + b for a in _B32 for b in _B32]
+
+
+def _tag(digest: bytes) -> str:
+    """base32 of the first MAC_BYTES (5) bytes; same output as base64.b32encode, ~5x faster."""
+    n = int.from_bytes(digest[:MAC_BYTES], 'big')
+    pairs = _B32_PAIRS
+    return pairs[n >> 30] + pairs[(n >> 20) & 1023] + pairs[(n >> 10) & 1023] + pairs[n & 1023]
+
+
+@lru_cache(maxsize=65536)
+def _mac(user_id: str) -> str:
+    h = _HMAC.copy()
+    h.update(user_id.encode('utf-8'))
+    return _tag(h.digest())
+
+
+def _token_mac(user_id: str, window: int) -> str:
+    # Separate domain from _mac so a static tag can never pass as a token tag
+    h = _HMAC.copy()
+    h.update(b'T\0' + user_id.encode('utf-8') + b'\0' + str(window).encode('ascii'))
+    return _tag(h.digest())
+
+
+def _id_field(user_id: str) -> Tuple[bool, str]:
+    """Return (base32-encoded?, text) for placing user_id in a payload."""
+    if _RAW_ID.match(user_id):
+        return False, user_id
+    return True, base64.b32encode(user_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_id(body: str) -> Optional[str]:
+    try:
+        return base64.b32decode(body + '=' * (-len(body) % 8)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_payload(user_id: str) -> str:
+    """Return the compact v1 payload for user_id."""
+    b32, field = _id_field(user_id)
+    return f'{PREFIX_B32 if b32 else PREFIX}{field}:{_mac(user_id)}'
+
+
+def current_window(now: float = None) -> int:
+    return int((time.time() if now is None else now) // ROTATE_SECONDS)
+
+
+def encode_token(user_id: str, now: float = None) -> str:
+    """Return the rotating v2 token for user_id in the current time window."""
+    window = current_window(now)
+    b32, field = _id_field(user_id)
+    return f'{TOKEN_PREFIX_B32 if b32 else TOKEN_PREFIX}{field}:{window}:{_token_mac(user_id, window)}'
+
+
+def is_token(payload: str) -> bool:
+    return payload.startswith(TOKEN_PREFIX) or payload.startswith(TOKEN_PREFIX_B32)
+
+
+def verify_token(payload: str, now: float = None) -> Optional[Tuple[str, int]]:
+    """Return (user_id, window) for a genuine, unexpired token, else None."""
+    if payload.startswith(TOKEN_PREFIX):
+        rest, b32 = payload[len(TOKEN_PREFIX):], False
+    elif payload.startswith(TOKEN_PREFIX_B32):
+        rest, b32 = payload[len(TOKEN_PREFIX_B32):], True
+    else:
+        return None
+    rest, _, tag = rest.rpartition(':')
+    body, _, window = rest.rpartition(':')
+    # str.isdigit() also accepts digits like '²' that int() rejects
+    if not body or not _WINDOW.fullmatch(window) or not _TAG.fullmatch(tag):
+        return None
+    window = int(window)
+    current = current_window(now)
+    if not current - TOKEN_GRACE_WINDOWS <= window <= current:
+        return None
+    user_id = _decode_id(body) if b32 else body
+    if not user_id or not hmac.compare_digest(tag, _token_mac(user_id, window)):
+        return None
+    return user_id, window
+
+
+def legacy_payload(user_id: str, name: str, roll: str, email: str) -> str:
+    """The pre-v1 payload string, kept for benchmarks and re-issuing old codes."""
+    return f"{{'id':'{user_id}','name':'{name}','roll':'{roll}','email':'{email}'}}"
+
+
+def parse_payload(payload: str) -> Optional[str]:
+    """Return the user id in a scanned payload, or None if it is malformed or forged."""
+    if payload.startswith(PREFIX):
+        body, sep, tag = payload[len(PREFIX):].rpartition(':')
+        user_id = body
+    elif payload.startswith(PREFIX_B32):
+        body, sep, tag = payload[len(PREFIX_B32):].rpartition(':')
+        user_id = _decode_id(body)
+    elif is_token(payload):
+        verified = verify_token(payload)
+        return verified[0] if verified else None
+    elif ACCEPT_LEGACY:
+        return _parse_legacy(payload)
+    else:
+        return None
+    if not sep or not user_id or not _TAG.fullmatch(tag) or not hmac.compare_digest(tag, _mac(user_id)):
+        return None
+    return user_id
+
+
+def _parse_legacy(payload: str) -> Optional[str]:
+    start = payload.find(_LEGACY_TOKEN)
+    if start < 0:
+        return None
+    start += len(_LEGACY_TOKEN)
+    end = payload.find("'", start)
+    return payload[start:end] if end >= 0 else None
+
+
+class ReplayCache:
+    """Bounded record of which session each rotating token was first used in.
+
+    Entries expire once their token could no longer verify anyway; a ring
+    (deque) ordered by expiry makes eviction O(1), and capacity caps memory
+    at peak scan rates.
+    """
+
+    def __init__(self, capacity: int = REPLAY_CACHE_SIZE):
+        self.capacity = capacity
+        self._ring = deque()  # (expires_at, key), oldest first
+        self._used = {}  # (user_id, window) -> session_id
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def claim(self, key: Tuple[str, int], session_id: int, now: float = None) -> bool:
+        """Record key as used in session_id. False if it was already used in another session."""
+        now = time.time() if now is None else now
+        with self._lock:
+            ring, used = self._ring, self._used
+            while ring and (ring[0][0] <= now or len(ring) >= self.capacity):
+                used.pop(ring.popleft()[1], None)
+            first = used.get(key)
+            if first is None:
+                used[key] = session_id
+                ring.append(((key[1] + 1 + TOKEN_GRACE_WINDOWS) * ROTATE_SECONDS, key))
+                return True
+            if first != session_id:
+                self.replays += 1
+                return False
+            return True
+
+    def __len__(self) -> int:
+        return len(self._used)
+
+
+_replays = ReplayCache()
+
+
+def check_scan(payload: str, session_id: int) -> Tuple[Optional[str], Optional[str]]:
+    """Validate a scanned payload for session_id. Returns (user_id, None) or (None, error).
+
+    Errors: 'bad_payload' (malformed, forged or expired), 'replayed' (a
+    token already used in another session) and 'static_disabled' (a static
+    code while QR_ACCEPT_STATIC=0). Reusing a token in the same session is
+    allowed; the mark itself is then a no-op.
+    """
+    if is_token(payload):
+        verified = verify_token(payload)
+        if not verified:
+            return None, 'bad_payload'
+        if not _replays.claim(verified, session_id):
+            return None, 'replayed'
+        return verified[0], None
+    if not ACCEPT_STATIC:
+        return None, 'static_disabled'
+    user_id = parse_payload(payload)
+    return (user_id, None) if user_id else (None, 'bad_payload')
+
+
+def replay_stats() -> dict:
+    return {'tracked': len(_replays), 'replays': _replays.replays, 'capacity': _replays.capacity}
+
+
+def bench_payload(count: int = 200, module_px: int = 3) -> dict:
+    """Compare legacy and v1 payloads: QR version, parse cost and OpenCV decode rate.
+
+    Each code is rendered at module_px pixels per module regardless of
+    version (as a printed card of fixed size would be from a fixed
+    distance), so denser legacy codes come out physically larger and
+    decodes are compared like for like per module.
+    """
+    import cv2
+    import numpy as np
+    import qrcode
+
+    samples = [(f'S{i:05d}', f'Student Number {i}', f'23MID{i:05d}', f'student{i}@example.com') for i in range(count)]
+    formats = {
+        'legacy': [legacy_payload(*s) for s in samples],
+        'v1': [encode_payload(s[0]) for s in samples],
+    }
+    detector = cv2.QRCodeDetector()
+    results = {}
+    for label, payloads in formats.items():
+        t0 = time.perf_counter()
+        for p in payloads:
+            parse_payload(p)
+        parse_us = (time.perf_counter() - t0) / len(payloads) * 1e6
+        versions = []
+        decoded = 0
+        decode_time = 0.0
+        for p in payloads:
+            qr = qrcode.QRCode(box_size=module_px, border=4)
+            qr.add_data(p)
+            qr.make(fit=True)
+            versions.append(qr.version)
+            img = np.array(qr.make_image().convert('L'))
+            t0 = time.perf_counter()
+            data, _, _ = detector.detectAndDecode(img)
+            decode_time += time.perf_counter() - t0
+            decoded += parse_payload(data) is not None if data else 0
+        results[label] = {
+            'avg_length': sum(map(len, payloads)) / len(payloads),
+            'avg_version': sum(versions) / len(versions),
+            'parse_us': parse_us,
+            'decoded': decoded,
+            'decode_ms': decode_time / len(payloads) * 1000,
+        }
+        r = results[label]
+        print(f"{label:>6}: {r['avg_length']:.0f} chars, QR version {r['avg_version']:.1f}, "
+              f"parse {r['parse_us']:.2f} us, decoded {decoded}/{len(payloads)} "
+              f"at {module_px}px/module ({r['decode_ms']:.2f} ms/code)")
+    return results
@@ -0,0 +1,249 @@
+"""EXPLAIN QUERY PLAN regression check for the queries issued by db.py.
+
+Builds a synthetic database (50k students and 1M marks by default), runs
+every public db.py helper against it while tracing the SQL it issues, and
+explains each statement. Any plan step that scans a whole table fails the
+check, unless the helper is listed in FULL_SCAN_ALLOWED because returning
+the whole table is its job. A full walk of an index counts too, unless the
+statement has a LIMIT (an ordered page stops early).
+
+Run with: python main.py check_plans [students] [marks]
+
+bench_summary() reuses the synthetic database to time the student
+dashboard's summary queries: python main.py bench_summary [sessions]
+"""
+import inspect
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, Tuple
+import db
+
+# Helpers that return or delete a whole table by design
+FULL_SCAN_ALLOWED = {
+    'list_sessions',
+    'list_subjects',
+    'list_user_rows',
+    'delete_all_sessions',
+    'export_attendance_csv',
+    'iter_attendance_rows',
+}
+
+# Public db.py functions that are not query helpers (schema, seeding, pool plumbing)
+NOT_QUERIES = {
+    'get_conn', 'close_conn', 'transaction', 'pool_stats', 'add_attendance_listener', 'init_db', 'apply_migrations',
+    'schema_version', 'seed_demo_data', 'invalidate_user_cache', 'user_cache_stats',
+    'ensure_attendance_counters', 'rebuild_attendance_counters', 'ensure_attendance_versions', 'bump_attendance_versions',
+    'seed_sample_data', 'ensure_admin_and_defaults', 'ensure_extended_dataset', 'seed_dataset',
+}
+
+# Plan steps that read every row: "SCAN t" or "SCAN t AS x", without an index
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+# ... or through one: "SCAN t USING [COVERING] INDEX i" / "USING INTEGER PRIMARY KEY"
+_INDEX_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)? USING (?:(?:COVERING )?INDEX \w+|INTEGER PRIMARY KEY)')
+_LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+
+
+def build_synthetic_db(path: str, students: int = 50000, marks: int = 1000000,
+                       faculties: int = 50, sessions_per_subject: int = 40, subjects_per_student: int = 5):
+    """Create the real schema at path and fill it with generated rows using set-based SQL."""
+    db.DB_PATH = path
+    db.init_db()
+    conn = db.get_conn()
+    with db.transaction() as cur:
+        cur.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {int(students)})
+            INSERT INTO users (id, name, roll, email, role, password_hash)
+            SELECT printf('P%06d', i), 'Student ' || i, printf('24SYN%06d', i), 'p' || i || '@example.com', 'student', 'x'
+            FROM n
+        ''')
+        cur.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {int(faculties)})
+            INSERT INTO users (id, name, roll, email, role, password_hash)
+            SELECT printf('PF%03d', i), 'Faculty ' || i, '', '', 'faculty', 'x' FROM n
+        ''')
+    total_sessions = faculties * sessions_per_subject
+    with db.transaction() as cur:
+        cur.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {int(total_sessions) - 1})
+            INSERT INTO sessions (name, date, subject, faculty_id)
+            SELECT 'Class ' || (i / {int(faculties)} + 1), date('2024-01-01', '+' || (i / {int(faculties)}) || ' days'),
+                   'Subject ' || (i % {int(faculties)} + 1), printf('PF%03d', i % {int(faculties)} + 1)
+            FROM n
+        ''')
+        cur.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {int(students) * int(subjects_per_student) - 1})
+            INSERT OR IGNORE INTO enrollments (student_id, faculty_id, subject)
+            SELECT printf('P%06d', i / {int(subjects_per_student)} + 1),
+                   printf('PF%03d', (i / {int(subjects_per_student)} + i % {int(subjects_per_student)}) % {int(faculties)} + 1),
+                   'Subject ' || ((i / {int(subjects_per_student)} + i % {int(subjects_per_student)}) % {int(faculties)} + 1)
+            FROM n
+        ''')
+        first_session = conn.execute('SELECT MIN(id) FROM sessions').fetchone()[0]
+        cur.execute(f'''
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < {int(marks) - 1})
+            INSERT OR IGNORE INTO session_attendance (session_id, user_id)
+            SELECT {int(first_session)} + i % {int(total_sessions)},
+                   printf('P%06d', (i / {int(total_sessions)} + 97 * (i % {int(total_sessions)})) % {int(students)} + 1)
+            FROM n
+        ''')
+    conn.execute('ANALYZE')
+
+
+def plan_cases() -> List[Tuple[str, tuple]]:
+    """(helper name, args) pairs exercising every query helper against the synthetic data."""
+    sid = db._fetchone('SELECT MAX(id) FROM sessions')[0]
+    # set_session_attendance only takes students on the session's roster
+    on_roster = [r[0] for r in db.session_attendance_roster(sid)[:4]]
+    return [
+        ('get_user', ('P000042',)),
+        ('get_user_auth', ('P000042',)),
+        ('get_user_by_roll', ('24SYN000042',)),
+        ('list_students', ()),
+        ('list_faculties', ()),
+        ('list_subjects', ()),
+        ('list_faculty_subjects', ('PF007',)),
+        ('count_sessions_for', ('PF007', 'Subject 7')),
+        ('list_sessions', ()),
+        ('list_sessions_for_faculty', ('PF007',)),
+        ('page_sessions', ()),
+        ('page_sessions', (None, ('2024-01-20', 10**9))),
+        ('page_sessions', ('PF007', ('2024-01-20', 10**9))),
+        ('page_sessions', ('PF007', None, 50, 'Class', 'Subject 7')),
+        ('page_students', ()),
+        ('page_students', (('24SYN000042', 'P000042'), 50, 'Student 4')),
+        ('get_session', (sid,)),
+        ('list_students_with_sessions_on', ('2024-01-05',)),
+        ('session_attendance_roster', (sid,)),
+        ('list_session_marks', (sid,)),
+        ('student_subject_summary', ('P000042',)),
+        ('student_attendance_summary', ('P000042',)),
+        ('attendance_version', ('P000042',)),
+        ('report_rows', (['P000042', 'P000043', 'NOPE'],)),
+        ('list_enrolled_students', ('PF007',)),
+        ('list_enrolled_students', ('PF007', 'Subject 7')),
+        ('mark_session_attendance', (sid, 'P000043')),
+        ('mark_session_attendance_many', ([(sid, 'P000044'), (sid, 'P000045')],)),
+        ('unmark_session_attendance', (sid, 'P000043')),
+        ('toggle_session_attendance', (sid, 'P000046')),
+        ('set_session_attendance', (sid, None, on_roster[:2], ['P000044'])),
+        ('set_session_attendance', (sid, on_roster[2:])),
+        ('mark_attendance', ('P000042',)),
+        ('add_user', ('PX1', 'Plan Check', 'PXROLL', '')),
+        ('add_users_from_list', ([('PX2', 'Plan Check', 'PXROLL2', '')],)),
+        ('bulk_add_users', ([('PX4', 'Plan Check', 'PXROLL4', '')],)),
+        ('bulk_upsert_users', ([('PX5', 'Plan Check', 'PXROLL5', '', 'student', None)],)),
+        ('bulk_upsert_enrollments', ([('PX5', 'PF007', 'Subject 7')],)),
+        ('list_user_rows', ()),
+        ('upsert_user_with_auth', ('PX3', 'Plan Check', 'PXROLL3', '', 'student', None)),
+        ('set_user_password', ('PX3', 'x')),
+        ('upsert_enrollment', ('PX3', 'PF007', 'Subject 7')),
+        ('upsert_subject', ('Plan Subject',)),
+        ('delete_subject', ('Plan Subject',)),
+        ('create_session', ('Plan Class', '2030-01-01', 'Subject 7', 'PF007')),
+        ('reassign_session_faculty', (sid, 'PF008')),
+        ('delete_session', (sid,)),
+        ('export_attendance_csv', (os.devnull,)),
+        ('iter_attendance_rows', ('2024-01-01', '2024-12-31')),
+        # Unfiltered session exports read every mark by design; the filtered forms must use indexes
+        ('iter_session_marks', ('2024-01-05', '2024-01-10')),
+        ('iter_session_marks', (None, None, 'PF007', 'Subject 7')),
+        ('delete_all_sessions', ()),
+    ]
+
+
+def _explain(conn, sql: str) -> List[str]:
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+
+
+def check_plans(cases=None) -> Dict[str, List[str]]:
+    """Run each helper with SQL tracing, explain what it issued and return failures per helper."""
+    conn = db.get_conn()
+    traced: List[str] = []
+    failures: Dict[str, List[str]] = {}
+    cases = cases if cases is not None else plan_cases()
+    missing = sorted(
+        name for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if fn.__module__ == db.__name__ and not name.startswith('_')
+        and name not in NOT_QUERIES and name not in {c[0] for c in cases}
+    )
+    if missing:
+        failures['(coverage)'] = [f'no plan case for db.{name}' for name in missing]
+    conn.set_trace_callback(traced.append)
+    try:
+        for name, args in cases:
+            traced.clear()
+            result = getattr(db, name)(*args)
+            if inspect.isgenerator(result):
+                for _ in result:  # streaming helpers only run their SQL when consumed
+                    pass
+            statements = [s for s in traced if s.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')]
+            conn.set_trace_callback(None)
+            for sql in statements:
+                limited = bool(_LIMIT.search(sql))
+                for detail in _explain(conn, sql):
+                    full = _FULL_SCAN.match(detail) or (_INDEX_SCAN.match(detail) and not limited)
+                    if full and name not in FULL_SCAN_ALLOWED:
+                        failures.setdefault(name, []).append(f'{detail}  <-  {" ".join(sql.split())[:160]}')
+            conn.set_trace_callback(traced.append)
+    finally:
+        conn.set_trace_callback(None)
+    return failures
+
+
+def run(students: int = 50000, marks: int = 1000000) -> bool:
+    """Build the synthetic database, check every helper and print a report. Returns True when clean."""
+    old_path = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            t0 = time.perf_counter()
+            build_synthetic_db(os.path.join(tmp, 'plans.db'), students=students, marks=marks)
+            print(f'Built synthetic DB ({students} students, {marks} marks) in {time.perf_counter() - t0:.1f}s')
+            failures = check_plans()
+        finally:
+            db.close_conn()
+            db.DB_PATH = old_path
+    for name, problems in failures.items():
+        for p in problems:
+            print(f'FAIL {name}: {p}')
+    print('Query plans OK' if not failures else f'{len(failures)} helper(s) with full table scans')
+    return not failures
+
+
+def bench_summary(sessions: int = 10000, students: int = 20000, marks: int = 1000000, lookups: int = 2000) -> dict:
+    """Time the student dashboard's summary queries on a synthetic DB with `sessions` sessions.
+
+    Compares the counter-backed student_attendance_summary with the COUNT(*)
+    form it replaced, and shows the constant-cost student_subject_summary.
+    """
+    faculties = 50
+    old_path = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            build_synthetic_db(os.path.join(tmp, 'bench.db'), students=students, marks=marks,
+                               faculties=faculties, sessions_per_subject=max(1, sessions // faculties))
+            conn = db.get_conn()
+            ids = [f'P{i % students + 1:06d}' for i in range(0, lookups * 7919, 7919)]
+
+            def whole_table_counts(uid):
+                total = conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+                attended = conn.execute('SELECT COUNT(*) FROM session_attendance WHERE user_id = ?', (uid,)).fetchone()[0]
+                return attended, total
+
+            results = {}
+            for label, fn in [('count_all_sessions', whole_table_counts),
+                              ('student_attendance_summary', db.student_attendance_summary),
+                              ('student_subject_summary', db.student_subject_summary)]:
+                t0 = time.perf_counter()
+                for uid in ids:
+                    fn(uid)
+                results[label] = (time.perf_counter() - t0) / len(ids) * 1e6
+            n_sessions = db._fetchone('SELECT COUNT(*) FROM sessions')[0]
+        finally:
+            db.close_conn()
+            db.DB_PATH = old_path
+    print(f'{n_sessions} sessions, {students} students, {marks} marks; mean per dashboard lookup:')
+    for label, us in results.items():
+        print(f'  {label:28s} {us:8.1f} us')
+    return results
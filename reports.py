@@ -0,0 +1,225 @@
+"""Student attendance report PDFs: template layout, version-keyed cache, bulk ZIPs.
+
+A report is rendered from plain data (report_data) by render_report, laid
+out according to a REPORT_TEMPLATE dict rather than hand-placed canvas
+calls. Rendered PDFs sit in a byte-capped LRU keyed by the student's
+db.attendance_version() stamp, which the schema's triggers bump whenever a
+mark, enrollment, name or class total behind the report changes, so an
+unchanged report is served without touching reportlab (and the stamp makes
+a cheap ETag for 304s).
+
+bulk_reports() fetches a whole class's figures in batched queries, renders
+the cache misses on a process pool shared by every request (reportlab is
+pure Python, so threads would not help) and stream_zip() packs the results
+into a ZIP that is handed on chunk by chunk. The pool's workers come from a
+forkserver, never forked from a threaded web worker.
+
+    python main.py reports class.zip --faculty F001 --subject Physics
+"""
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import db
+from db import attendance_version, report_rows
+from export import ChunkSink
+from qr_cache import ByteLRU
+
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+REPORT_CACHE_MAX_ITEMS = int(os.environ.get('REPORT_CACHE_MAX_ITEMS', '20000'))
+BULK_MIN_PARALLEL = 32  # below this many renders the pool start-up costs more than it saves
+
+# Page layout: header lines are str.format()ed with the overall figures,
+# table cells with each subject row; x positions are in points.
+REPORT_TEMPLATE = {
+    'title': 'Attendance Report',
+    'title_font': ('Helvetica-Bold', 14),
+    'body_font': ('Helvetica', 10),
+    'head_font': ('Helvetica-Bold', 11),
+    'header': ['Name: {name}   ID: {user_id}', 'Overall: {attended}/{total} ({percent:.1f}%)'],
+    'columns': [
+        ('Subject', 40, '{subject}'),
+        ('Attended/Total', 300, '{attended}/{total}'),
+        ('Percent', 460, '{percent:.1f}%'),
+    ],
+    'top': 50,
+    'bottom': 60,
+    'line': 14,
+}
+
+_cache = ByteLRU(REPORT_CACHE_MAX_BYTES, REPORT_CACHE_MAX_ITEMS)
+
+
+def _percent(attended: int, total: int) -> float:
+    return (attended / total * 100.0) if total > 0 else 0.0
+
+
+def _report_dict(user_id: str, name: str, subjects: List[Tuple[str, int, int]]) -> dict:
+    attended = sum(a for _, a, _ in subjects)
+    total = sum(t for _, _, t in subjects)
+    return {
+        'user_id': user_id,
+        'name': name,
+        'attended': attended,
+        'total': total,
+        'percent': _percent(attended, total),
+        'subjects': [{'subject': s, 'attended': a, 'total': t, 'percent': _percent(a, t)} for s, a, t in subjects],
+    }
+
+
+def report_data(user_id: str) -> Optional[dict]:
+    """Everything a report shows, or None for an unknown user."""
+    row = report_rows([user_id]).get(user_id)
+    return _report_dict(user_id, row[0], row[2]) if row else None
+
+
+def render_report(data: dict, template: dict = REPORT_TEMPLATE) -> bytes:
+    """Lay data out as a PDF; deterministic, so equal data gives equal bytes in any process."""
+    buf = BytesIO()
+    pdf = canvas.Canvas(buf, pagesize=A4, invariant=1)
+    width, height = A4
+    line = template['line']
+
+    def table_head(y):
+        pdf.setFont(*template['head_font'])
+        for label, x, _ in template['columns']:
+            pdf.drawString(x, y, label)
+        pdf.setFont(*template['body_font'])
+        return y - line
+
+    y = height - template['top']
+    pdf.setFont(*template['title_font'])
+    pdf.drawString(40, y, template['title'])
+    pdf.setFont(*template['body_font'])
+    y -= 18
+    for text in template['header']:
+        pdf.drawString(40, y, text.format(**data))
+        y -= 16
+    y = table_head(y - 8)
+    for row in data['subjects']:
+        if y < template['bottom']:
+            pdf.showPage()
+            y = table_head(height - template['top'])
+        for _, x, fmt in template['columns']:
+            pdf.drawString(x, y, fmt.format(**row))
+        y -= line
+    pdf.showPage()
+    pdf.save()
+    return buf.getvalue()
+
+
+def _etag(user_id: str, stamp: str) -> str:
+    return f'report-{user_id}-{stamp}'
+
+
+def report_etag(user_id: str) -> str:
+    """ETag of user_id's current report; one indexed query, no rendering."""
+    return _etag(user_id, attendance_version(user_id))
+
+
+def get_report(user_id: str) -> Tuple[Optional[bytes], str]:
+    """Return (pdf bytes, etag), rendering only when the stamp has moved; (None, etag) for unknown users."""
+    etag = report_etag(user_id)
+    key = (db.DB_PATH, etag)
+    body = _cache.get(key)
+    if body is None:
+        data = report_data(user_id)
+        if data is None:
+            return None, etag
+        body = render_report(data)
+        _cache.put(key, body)
+    return body, etag
+
+
+def report_filename(user_id: str) -> str:
+    return f'{user_id}_attendance_report.pdf'
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key = None  # (pid, workers) the pool was built for
+_pool_lock = threading.Lock()
+
+
+def _render_pool(workers: int) -> ProcessPoolExecutor:
+    """The process pool shared by every bulk run, rebuilt only after a fork or a size change."""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is None or _pool_key != (os.getpid(), workers):
+            if _pool is not None and _pool_key[0] == os.getpid():
+                _pool.shutdown(wait=False)
+            # Forking a web worker that runs threads can copy held locks; forkserver children start clean
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_key = (os.getpid(), workers)
+        return _pool
+
+
+def bulk_reports(user_ids: Iterable[str], workers: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """Yield (filename, pdf) for each known user, in order; cache misses render across processes."""
+    user_ids = list(user_ids)
+    rows = report_rows(user_ids)
+    jobs: List[tuple] = []  # (user_id, cache key, cached body or None, data for a render)
+    for uid in user_ids:
+        row = rows.get(uid)
+        if row is None:
+            continue
+        key = (db.DB_PATH, _etag(uid, row[1]))
+        body = _cache.get(key)
+        jobs.append((uid, key, body, _report_dict(uid, row[0], row[2]) if body is None else None))
+    misses = [j[3] for j in jobs if j[2] is None]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(misses) >= BULK_MIN_PARALLEL:
+        rendered = _render_pool(workers).map(render_report, misses,
+                                             chunksize=max(1, len(misses) // (workers * 4)))
+    else:
+        rendered = map(render_report, misses)
+    try:
+        for uid, key, body, _ in jobs:
+            if body is None:
+                body = next(rendered)
+                _cache.put(key, body)
+            yield report_filename(uid), body
+    finally:
+        # Closing Executor.map's iterator cancels renders an abandoned download no longer needs
+        close = getattr(rendered, 'close', None)
+        if close is not None:
+            close()
+
+
+def stream_zip(entries: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """ZIP (name, bytes) entries on the fly, yielding the archive in chunks."""
+    sink = ChunkSink()
+    # PDF pages are already deflated; storing them is much faster and barely bigger
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zf:
+        for name, body in entries:
+            zf.writestr(name, body)
+            yield sink.take()
+    yield sink.take()
+
+
+def write_zip(out_path: str, user_ids: Iterable[str], workers: Optional[int] = None) -> int:
+    """Write every user's report into out_path; returns the number of reports."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for entry in bulk_reports(user_ids, workers):
+            count += 1
+            yield entry
+
+    with open(out_path, 'wb') as f:
+        for chunk in stream_zip(counted()):
+            f.write(chunk)
+    return count
+
+
+def stats() -> dict:
+    return _cache.stats()
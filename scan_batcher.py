@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+from db import mark_session_attendance_many
+
+# How long the writer waits for more marks before committing a batch
+FLUSH_INTERVAL = float(os.environ.get('SCAN_FLUSH_MS', '5')) / 1000.0
+MAX_BATCH = int(os.environ.get('SCAN_MAX_BATCH', '500'))
+# How long a request waits for its batch to commit
+RESULT_TIMEOUT = 10.0
+
+
+class MarkBatcher:
+    """Write-behind queue that coalesces attendance marks from all scanners.
+
+    Callers submit (session_id, user_id) pairs and get a Future that resolves
+    to the per-student marked flag. A single writer thread drains the queue and
+    commits everything that arrived within FLUSH_INTERVAL as one transaction,
+    so concurrent scanners do not fight over SQLite's write lock.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH,
+                 writer=None):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # None means db.mark_session_attendance_many, looked up at each flush so metrics can wrap it
+        self._writer = writer
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {'submitted': 0, 'batches': 0, 'marked': 0, 'errors': 0, 'largest_batch': 0}
+
+    def submit(self, session_id: int, user_id: str) -> Future:
+        return self.submit_many([(session_id, user_id)])[0]
+
+    def submit_many(self, marks: List[Tuple[int, str]]) -> List[Future]:
+        self._ensure_started()
+        futures = []
+        for session_id, user_id in marks:
+            fut = Future()
+            self._queue.put((session_id, user_id, fut))
+            futures.append(fut)
+        with self._lock:
+            self._stats['submitted'] += len(futures)
+        return futures
+
+    def mark(self, session_id: int, user_id: str) -> bool:
+        """Queue one mark and block until its batch has been committed."""
+        return self.submit(session_id, user_id).result(RESULT_TIMEOUT)
+
+    def mark_many(self, marks: List[Tuple[int, str]]) -> List[bool]:
+        return [f.result(RESULT_TIMEOUT) for f in self.submit_many(marks)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        # (Re)start the writer lazily, also after a fork into a gunicorn worker
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='scan-batcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception as exc:
+                # One bad batch must not kill the writer and strand every later submit
+                with self._lock:
+                    self._stats['errors'] += 1
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+
+    def _flush(self, batch):
+        # Claim the futures first: a caller that timed out may have cancelled its
+        # future, but the mark is still written; only its result is dropped
+        waiting = [fut.set_running_or_notify_cancel() for _, _, fut in batch]
+        try:
+            writer = self._writer or mark_session_attendance_many
+            results = writer([(session_id, user_id) for session_id, user_id, _ in batch])
+        except Exception as exc:
+            with self._lock:
+                self._stats['errors'] += 1
+            for (_, _, fut), wait in zip(batch, waiting):
+                if wait:
+                    fut.set_exception(exc)
+            return
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['marked'] += sum(1 for r in results if r)
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+        for (_, _, fut), wait, marked in zip(batch, waiting, results):
+            if wait:
+                fut.set_result(marked)
+
+
+batcher = MarkBatcher()
@@ -1,59 +1,486 @@
 import cv2
-from db import get_user, mark_attendance
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from db import list_user_rows, mark_attendance, mark_session_attendance_many
+import os
+import queue
+from qr_payload import parse_payload
+import threading
 import time
 
 CAM_INDEX = 0  # change if your webcam is a different index
+DECODE_WORKERS = 2  # decode threads; OpenCV releases the GIL while decoding
+FRAME_QUEUE_SIZE = 4  # frames waiting for a decoder; older frames are dropped
+MARK_QUEUE_SIZE = 1024  # decoded ids waiting for the DB writer
+DEBOUNCE_SECONDS = 5  # don't re-mark the same user more than once in 5 seconds
+DEBOUNCE_CAPACITY = 4096  # most ids remembered at once; the oldest are forgotten early beyond this
+USER_REFRESH_SECONDS = 60.0  # how often the scanner reloads its in-memory copy of the users table
+STATS_INTERVAL = 5.0  # seconds between pipeline stats printouts
+# Decoding strategy: 'single' (one code per frame), 'multi' (all codes, full frame)
+# or 'roi' (all codes, searching only around recently seen codes between full sweeps)
+SCAN_MODE = os.environ.get('SCAN_MODE', 'roi')
+ROI_MARGIN = 0.6  # grow a code's bounding box by this fraction of its size on each side
+ROI_MAX_SIDE = 400  # downscale ROI crops so their longer side is at most this many pixels
+ROI_TTL = 1.0  # seconds a region is tracked after its last successful decode
+FULL_SWEEP_EVERY = 8  # in 'roi' mode, search the whole frame every N frames
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+FILE_SEGMENT_FRAMES = 150  # video frames per scan_file work unit
+FILE_IMAGE_CHUNK = 16  # images per scan_file work unit
 
-def extract_id_from_payload(payload: str):
-    # payload format: we created a string like: {'id':'1','name':'Jagadeesh',...}
-    # We'll do a simple parse to extract id between "'id':'" and "'"
-    try:
-        token = "'id':'"
-        start = payload.index(token) + len(token)
-        end = payload.index("'", start)
-        return payload[start:end]
-    except Exception:
-        return None
+class Debouncer:
+    """Fixed-size, self-expiring record of recently accepted ids.
+
+    Accepted ids go into a ring (deque) in time order plus a dict of their
+    accept time; each call pops entries older than the window off the front,
+    so memory is bounded by the scan rate over one window (and by capacity)
+    rather than by how many distinct ids were ever seen.
+    """
+
+    def __init__(self, window: float = DEBOUNCE_SECONDS, capacity: int = DEBOUNCE_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self._ring = deque()  # (accepted_at, id), oldest first
+        self._accepted = {}  # id -> accepted_at, for ids still in the ring
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, now: float = None) -> bool:
+        """Return True (and remember key) unless key was accepted within the window."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ring, accepted = self._ring, self._accepted
+            while ring and (now - ring[0][0] > self.window or len(ring) >= self.capacity):
+                ts, old = ring.popleft()
+                if accepted.get(old) == ts:
+                    del accepted[old]
+            if key in accepted:
+                return False
+            accepted[key] = now
+            ring.append((now, key))
+            return True
+
+    def __len__(self) -> int:
+        return len(self._accepted)
+
+class UserDirectory:
+    """In-memory copy of the users table, reloaded every refresh_seconds.
+
+    Lookups are dict hits; the table is only read again once the copy is
+    stale, so repeated scans of the same students never query SQLite.
+    """
+
+    def __init__(self, refresh_seconds: float = USER_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._users = {}
+        self._expires = 0.0
+        self.refreshes = 0
+
+    def refresh(self):
+        users = {row[0]: row for row in list_user_rows()}
+        with self._lock:
+            self._users = users
+            self._expires = time.monotonic() + self.refresh_seconds
+            self.refreshes += 1
+
+    def get(self, user_id: str):
+        """Return the (id, name, roll, email, role) row for user_id, or None."""
+        if time.monotonic() >= self._expires:
+            self.refresh()
+        return self._users.get(user_id)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+class FrameDecoder:
+    """Finds and decodes QR codes in frames according to SCAN_MODE.
+
+    In 'roi' mode, codes found on a full-frame sweep leave behind regions of
+    interest; later frames only search cropped, downscaled windows around
+    them, with a full sweep every FULL_SWEEP_EVERY frames (or whenever
+    nothing is being tracked) to pick up new codes. Not thread-safe: use
+    one decoder per worker.
+    """
+
+    def __init__(self, mode: str = None):
+        self.mode = mode or SCAN_MODE
+        self.detector = cv2.QRCodeDetector()
+        self.regions = []  # [(x0, y0, x1, y1, expires_at)]
+        self.frames = 0
+
+    def decode(self, frame, now: float = None) -> list:
+        """Return the distinct non-empty payloads decoded from frame.
+
+        now is the frame's time in seconds, for ROI expiry; live capture uses
+        the monotonic clock, recordings should pass the frame's video time.
+        """
+        self.frames += 1
+        if self.mode == 'single':
+            data, _, _ = self.detector.detectAndDecode(frame)
+            return [data] if data else []
+        now = time.monotonic() if now is None else now
+        self.regions = [r for r in self.regions if r[4] > now]
+        sweep = self.mode == 'multi' or not self.regions or self.frames % FULL_SWEEP_EVERY == 0
+        if sweep:
+            found = self._detect_multi(frame, 0, 0, 1.0)
+        else:
+            found = []
+            for x0, y0, x1, y1, _ in self.regions:
+                crop = frame[y0:y1, x0:x1]
+                scale = min(1.0, ROI_MAX_SIDE / max(crop.shape[0], crop.shape[1]))
+                if scale < 1.0:
+                    crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                found.extend(self._detect_multi(crop, x0, y0, scale))
+        if self.mode == 'roi':
+            self._track(frame.shape, found, now, sweep)
+        payloads = []
+        for text, _ in found:
+            if text not in payloads:
+                payloads.append(text)
+        return payloads
+
+    def _detect_multi(self, img, dx: int, dy: int, scale: float) -> list:
+        """Return [(text, corner points in full-frame coordinates)] for codes decoded in img."""
+        try:
+            ok, texts, points, _ = self.detector.detectAndDecodeMulti(img)
+        except cv2.error:
+            return []
+        if not ok or points is None:
+            return []
+        return [(text, points[i] / scale + (dx, dy)) for i, text in enumerate(texts) if text]
+
+    def _track(self, shape, found, now: float, sweep: bool):
+        height, width = shape[:2]
+        # A successful full sweep replaces the tracked set; otherwise regions age out via ROI_TTL
+        regions = [] if sweep and found else list(self.regions)
+        for _, pts in found:
+            x0, y0 = pts.min(axis=0)
+            x1, y1 = pts.max(axis=0)
+            mx, my = (x1 - x0) * ROI_MARGIN, (y1 - y0) * ROI_MARGIN
+            box = (max(0, int(x0 - mx)), max(0, int(y0 - my)), min(width, int(x1 + mx)), min(height, int(y1 + my)))
+            # Refresh an overlapping region instead of stacking a new one
+            regions = [r for r in regions if not _overlaps(r, box)]
+            regions.append(box + (now + ROI_TTL,))
+        self.regions = regions
+
+def _overlaps(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def bench_scan(video_path: str, modes=('single', 'multi', 'roi')) -> dict:
+    """Decode every frame of a recorded video in each mode and report codes per second."""
+    results = {}
+    for mode in modes:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise FileNotFoundError(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        decoder = FrameDecoder(mode)
+        frames = codes = 0
+        distinct = set()
+        decode_time = 0.0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            t0 = time.perf_counter()
+            payloads = decoder.decode(frame, frames / fps)
+            decode_time += time.perf_counter() - t0
+            frames += 1
+            codes += len(payloads)
+            distinct.update(payloads)
+        cap.release()
+        results[mode] = {
+            'frames': frames,
+            'codes': codes,
+            'distinct': len(distinct),
+            'fps': frames / decode_time if decode_time else 0.0,
+            'codes_per_sec': codes / decode_time if decode_time else 0.0,
+        }
+        print(f"{mode:>6}: {frames} frames, {codes} codes ({len(distinct)} distinct) "
+              f"{results[mode]['fps']:.1f} frames/s, {results[mode]['codes_per_sec']:.1f} codes/s")
+    return results
+
+def _decode_video_segment(job):
+    """Decode frames [start, end) of a video. Returns (frames read, [(timestamp, payload)])."""
+    path, start, end, fps = job
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    # Segments are not contiguous in a worker, so tracking starts afresh with each one,
+    # and regions age on video time: decoding runs faster or slower than the clip plays
+    decoder = FrameDecoder()
+    hits = []
+    frames = 0
+    for index in range(start, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+        hits.extend((index / fps, payload) for payload in decoder.decode(frame, index / fps))
+    cap.release()
+    return frames, hits
+
+def _decode_images(paths):
+    """Decode image files, timestamped by mtime. Returns (images read, [(timestamp, payload)])."""
+    decoder = FrameDecoder('multi')  # photos are unrelated, so there is nothing to track
+    hits = []
+    frames = 0
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        frames += 1
+        mtime = os.path.getmtime(path)
+        hits.extend((mtime, payload) for payload in decoder.decode(frame))
+    return frames, hits
+
+def _file_jobs(path: str):
+    """Split a video file or image directory into (worker function, work units)."""
+    if os.path.isdir(path):
+        images = sorted(
+            (os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)),
+            key=os.path.getmtime,
+        )
+        return _decode_images, [images[i:i + FILE_IMAGE_CHUNK] for i in range(0, len(images), FILE_IMAGE_CHUNK)]
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise FileNotFoundError(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        # Frame count unknown (some streams/containers): decode the whole file as one unit
+        return _decode_video_segment, [(path, 0, 1 << 31, fps)]
+    return _decode_video_segment, [(path, i, min(i + FILE_SEGMENT_FRAMES, total), fps)
+                                   for i in range(0, total, FILE_SEGMENT_FRAMES)]
+
+def debounce_hits(hits) -> list:
+    """Apply the live scanner's debounce to (timestamp, user_id) hits; returns the accepted hits in time order."""
+    debouncer = Debouncer()
+    return [(ts, user_id) for ts, user_id in sorted(hits) if debouncer.allow(user_id, ts)]
+
+def scan_file(path: str, session_id: int, workers: int = None) -> dict:
+    """Decode a recorded video or a folder of photos and mark everyone seen in session_id.
+
+    Work units (video segments or image batches) are decoded across a process
+    pool; hits are debounced on frame timestamps (image mtimes) exactly like
+    the webcam scanner, then written in one transaction.
+    """
+    started = time.perf_counter()
+    worker, jobs = _file_jobs(path)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(worker, jobs))
+    else:
+        results = [worker(job) for job in jobs]
+    frames = sum(r[0] for r in results)
+    hits = []
+    for _, found in results:
+        for ts, payload in found:
+            user_id = parse_payload(payload)
+            if user_id:
+                hits.append((ts, user_id))
+    decode_time = time.perf_counter() - started
+    accepted = debounce_hits(hits)
+    user_ids = list(dict.fromkeys(user_id for _, user_id in accepted))
+    users = UserDirectory()
+    known = [uid for uid in user_ids if users.get(uid)]
+    inserted = mark_session_attendance_many([(session_id, uid) for uid in known])
+    elapsed = time.perf_counter() - started
+    report = {
+        'frames': frames,
+        'codes': len(hits),
+        'accepted': len(accepted),
+        'users': len(known),
+        'unknown': len(user_ids) - len(known),
+        'marked': sum(inserted),
+        'fps': frames / decode_time if decode_time > 0 else 0.0,
+        'seconds': elapsed,
+    }
+    print(f"Decoded {frames} frames in {decode_time:.1f}s ({report['fps']:.1f} frames/s): "
+          f"{len(hits)} codes, {len(accepted)} after debounce, {len(known)} users "
+          f"({report['unknown']} unknown), {report['marked']} newly marked in session {session_id}")
+    return report
+
+class DropOldestQueue:
+    """Bounded queue whose put() never blocks: when full, the oldest item is discarded."""
+
+    def __init__(self, maxsize: int):
+        self._q = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._q.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None):
+        return self._q.get(timeout=timeout)
+
+class StageStats:
+    """Throughput and latency counters for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.count = 0
+        self._window_count = 0
+        self._window_latency = 0.0
+        self._window_max = 0.0
+        self._window_start = time.perf_counter()
+
+    def record(self, latency: float = 0.0):
+        with self._lock:
+            self.count += 1
+            self._window_count += 1
+            self._window_latency += latency
+            self._window_max = max(self._window_max, latency)
+
+    def snapshot(self) -> str:
+        """Return 'name N/s (avg/max ms)' for the window since the last snapshot and reset it."""
+        with self._lock:
+            now = time.perf_counter()
+            elapsed = now - self._window_start
+            rate = self._window_count / elapsed if elapsed > 0 else 0.0
+            avg = (self._window_latency / self._window_count * 1000) if self._window_count else 0.0
+            peak = self._window_max * 1000
+            self._window_count, self._window_latency, self._window_max = 0, 0.0, 0.0
+            self._window_start = now
+        return f'{self.name} {rate:.1f}/s ({avg:.1f}/{peak:.1f} ms)'
+
+class ScannerPipeline:
+    """Capture -> decode workers -> DB writer, connected by bounded drop-oldest queues.
+
+    The capture thread only reads frames, so a slow decode or DB write never
+    stalls the camera; the main thread just displays the latest frame.
+    """
+
+    def __init__(self, cap, decode_workers: int = DECODE_WORKERS):
+        self.cap = cap
+        self.decode_workers = decode_workers
+        self.frames = DropOldestQueue(FRAME_QUEUE_SIZE)
+        self.marks = DropOldestQueue(MARK_QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.capture_stats = StageStats('capture')
+        self.decode_stats = StageStats('decode')
+        self.write_stats = StageStats('db')
+        self._lock = threading.Lock()
+        self._latest_frame = None
+        self._overlay = None  # (text, color, expires_at)
+        self.debouncer = Debouncer()
+        self.users = UserDirectory()
+        self._threads = []
+
+    def start(self):
+        self.users.refresh()  # load before the first frame so early scans don't wait on SQLite
+        targets = [(self._capture_loop, 'capture'), (self._writer_loop, 'db-writer')]
+        targets += [(self._decode_loop, f'decode-{i}') for i in range(self.decode_workers)]
+        for target, name in targets:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def shutdown(self):
+        self.stop.set()
+        for t in self._threads:
+            t.join(timeout=2)
+
+    def latest_frame(self):
+        with self._lock:
+            frame, overlay = self._latest_frame, self._overlay
+        if frame is None:
+            return None
+        frame = frame.copy()
+        if overlay and overlay[2] > time.monotonic():
+            cv2.putText(frame, overlay[0], (50,50), cv2.FONT_HERSHEY_SIMPLEX, 1, overlay[1], 2)
+        return frame
+
+    def stats_line(self) -> str:
+        return ' | '.join([self.capture_stats.snapshot(), self.decode_stats.snapshot(), self.write_stats.snapshot(),
+                           f'dropped frames {self.frames.dropped}, marks {self.marks.dropped}',
+                           f'debounce {len(self.debouncer)} ids, directory {len(self.users)} users'])
+
+    def _show(self, text: str, color):
+        with self._lock:
+            self._overlay = (text, color, time.monotonic() + 2.0)
+
+    def _capture_loop(self):
+        while not self.stop.is_set():
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                self.stop.set()
+                break
+            captured = time.perf_counter()
+            self.capture_stats.record(captured - t0)
+            with self._lock:
+                self._latest_frame = frame
+            self.frames.put((captured, frame))
+
+    def _decode_loop(self):
+        decoder = FrameDecoder()
+        while not self.stop.is_set():
+            try:
+                captured, frame = self.frames.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            payloads = decoder.decode(frame)
+            self.decode_stats.record(time.perf_counter() - captured)
+            for data in payloads:
+                user_id = parse_payload(data)
+                if user_id and self.debouncer.allow(user_id):
+                    self.marks.put((captured, user_id))
+
+    def _writer_loop(self):
+        while not self.stop.is_set():
+            try:
+                captured, user_id = self.marks.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            user = self.users.get(user_id)
+            if user:
+                inserted = mark_attendance(user_id)
+                name = user[1]
+                if inserted:
+                    print(f'Attendance marked for {name} (id={user_id})')
+                else:
+                    print(f'Already marked today: {name} (id={user_id})')
+                self._show(f"{name} -> {'Marked' if inserted else 'Already'}", (0,255,0))
+            else:
+                print('Unknown user id scanned:', user_id)
+                self._show('Unknown user', (0,0,255))
+            # end-to-end latency: frame captured -> attendance committed
+            self.write_stats.record(time.perf_counter() - captured)
 
 def run_scanner():
-    detector = cv2.QRCodeDetector()
     cap = cv2.VideoCapture(CAM_INDEX)
     if not cap.isOpened():
         print('ERROR: Could not open webcam. Try changing CAM_INDEX in scanner.py')
         return
-    last_seen = {}
+    pipeline = ScannerPipeline(cap)
+    pipeline.start()
     print('Scanner running. Press q to quit.')
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        data, points, _ = detector.detectAndDecode(frame)
-        if data:
-            user_id = extract_id_from_payload(data)
-            if user_id:
-                # debounce: don't re-mark the same user more than once in 5 seconds in UI
-                now = time.time()
-                if user_id not in last_seen or now - last_seen[user_id] > 5:
-                    last_seen[user_id] = now
-                    user = get_user(user_id)
-                    if user:
-                        inserted = mark_attendance(user_id)
-                        name = user[1]
-                        if inserted:
-                            print(f'Attendance marked for {name} (id={user_id})')
-                        else:
-                            print(f'Already marked today: {name} (id={user_id})')
-                        # display on frame by drawing text
-                        cv2.putText(frame, f"{name} -> {'Marked' if inserted else 'Already'}", (50,50),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
-                    else:
-                        print('Unknown user id scanned:', user_id)
-                        cv2.putText(frame, 'Unknown user', (50,50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
-        cv2.imshow('QR Scanner - press q to quit', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-    cap.release()
-    cv2.destroyAllWindows()
+    next_stats = time.monotonic() + STATS_INTERVAL
+    try:
+        while not pipeline.stop.is_set():
+            frame = pipeline.latest_frame()
+            if frame is not None:
+                cv2.imshow('QR Scanner - press q to quit', frame)
+            if cv2.waitKey(15) & 0xFF == ord('q'):
+                break
+            if time.monotonic() >= next_stats:
+                print(pipeline.stats_line())
+                next_stats = time.monotonic() + STATS_INTERVAL
+    finally:
+        pipeline.shutdown()
+        cap.release()
+        cv2.destroyAllWindows()
 
 if __name__ == '__main__':
     run_scanner()
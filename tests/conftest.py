@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """A fresh, migrated database for the test; the thread's pooled connection follows DB_PATH."""
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'attendance.db'))
+    db.init_db()
+    yield db
+    db.close_conn()
+
+
+@pytest.fixture
+def client(tmp_db):
+    """Flask test client over tmp_db; log in with login(client, user_id)."""
+    import app
+    app.app.config['TESTING'] = True
+    with app.app.test_client() as c:
+        yield c
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+
+def add_users(*rows):
+    """Insert (id, name, roll, role) rows without passwords."""
+    for user_id, name, roll, role in rows:
+        db.upsert_user_with_auth(user_id, name, roll, '', role, None)
@@ -0,0 +1,16 @@
+from conftest import add_users, login
+
+
+def test_students_only_get_their_own_static_qr(client):
+    add_users(('S001', 'Ann', 'R1', 'student'), ('S002', 'Bob', 'R2', 'student'), ('F001', 'Fay', '', 'faculty'))
+    login(client, 'S001')
+    assert client.get('/qrcodes/S001.png').status_code == 200
+    assert client.get('/qrcodes/S002.png').status_code == 403
+    assert client.get('/qrcodes/F001.svg').status_code == 403
+
+
+def test_admin_may_fetch_any_static_qr(client):
+    add_users(('S002', 'Bob', 'R2', 'student'))
+    login(client, 'jaga')
+    assert client.get('/qrcodes/S002.png').status_code == 200
+    assert client.get('/qrcodes/NOPE.png').status_code == 404
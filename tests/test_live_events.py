@@ -0,0 +1,69 @@
+import threading
+
+import live_events
+from live_events import LiveHub, Subscriber
+
+
+class _HookLock:
+    """A lock that runs hook (once) right after its next release, to force an interleaving."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hook = None
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        hook, self.hook = self.hook, None
+        if hook:
+            hook()
+
+
+def test_unsubscribe_during_subscribe_keeps_new_viewer_on_live_channel(monkeypatch):
+    monkeypatch.setattr(live_events, 'list_session_marks', lambda session_id: [])
+    hub = LiveHub(poll_seconds=3600)
+    hub._lock = _HookLock()
+    first = hub.subscribe(1)
+    hub._lock.hook = lambda: hub.unsubscribe(first)
+    second = hub.subscribe(1, Subscriber(1))
+    hub.publish(1, 'S001', True)
+    assert second.get(timeout=1) == {'type': 'mark', 'user_id': 'S001', 'seq': 1}
+    assert hub.stats()['subscribers'] == 1
+
+
+def test_last_unsubscribe_drops_channel(monkeypatch):
+    monkeypatch.setattr(live_events, 'list_session_marks', lambda session_id: ['S002'])
+    hub = LiveHub(poll_seconds=3600)
+    sub = hub.subscribe(7)
+    assert hub.snapshot(7) == ['S002']
+    hub.unsubscribe(sub)
+    assert hub.stats()['sessions'] == 0
+
+
+def test_subscribe_limit(monkeypatch):
+    monkeypatch.setattr(live_events, 'list_session_marks', lambda session_id: [])
+    hub = LiveHub(poll_seconds=3600)
+    first = hub.subscribe(1, limit=1)
+    assert first is not None
+    assert hub.subscribe(2, limit=1) is None
+    assert hub.subscribe(1, limit=1) is None
+    hub.unsubscribe(first)
+    assert hub.subscribe(2, limit=1) is not None
+
+
+def test_event_streams_past_the_cap_are_told_to_retry(client, tmp_db, monkeypatch):
+    import app
+    from conftest import add_users, login
+    monkeypatch.setattr(app, 'LIVE_MAX_STREAMS', 1)
+    add_users(('F001', 'Fay', '', 'faculty'))
+    sid = tmp_db.create_session('Lab', '2024-01-01', 'Physics', 'F001')
+    login(client, 'F001')
+    live = client.get(f'/faculty/session/{sid}/events', buffered=False)
+    assert b'event: snapshot' in next(live.response)
+    busy = client.get(f'/faculty/session/{sid}/events')
+    assert busy.status_code == 200
+    assert busy.get_data().startswith(b'retry: ') and b'event: busy' in busy.get_data()
+    live.close()
+    assert app.live_hub.stats()['subscribers'] == 0
@@ -0,0 +1,76 @@
+"""metrics.install() rebinds helpers across every loaded module, so each case runs in its own interpreter."""
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = textwrap.dedent('''
+    import json, sys
+    import db
+    db.DB_PATH = sys.argv[1]
+    db.init_db()
+    db.upsert_user_with_auth('S001', 'Ann', 'R1', '', 'student', None)
+    db.upsert_user_with_auth('F001', 'Fay', '', '', 'faculty', None)
+    db.upsert_enrollment('S001', 'F001', 'Physics')
+    sid = db.create_session('Lab', '2024-01-01', 'Physics', 'F001')
+
+    import app, metrics
+    from scan_batcher import batcher
+
+    def get(path, user=None, headers=None):
+        client = app.app.test_client()
+        if user:
+            with client.session_transaction() as sess:
+                sess['user_id'] = user
+        return client.get(path, headers=headers or {})
+
+    out = {
+        'anonymous': get('/metrics').status_code,
+        'student': get('/metrics', 'S001').status_code,
+        'admin': get('/metrics', 'jaga').status_code,
+        'bearer': get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code,
+    }
+    get('/student/subjects', 'S001')
+    out['marked'] = batcher.mark(sid, 'S001')
+    out['in_db'] = db.list_session_marks(sid)
+    out['helpers'] = {k: [s.count, metrics.registry.helper_statements[k]] for k, s in metrics.registry.helpers.items()}
+    out['requests'] = {f'{e} {m}': s.count for (e, m), s in metrics.registry.requests.items()}
+    out['text'] = metrics.registry.render()
+    print(json.dumps(out))
+''')
+
+
+def _run(tmp_path, **env):
+    result = subprocess.run([sys.executable, '-c', SCRIPT, str(tmp_path / 'metrics.db')], cwd=ROOT,
+                            env={**os.environ, 'METRICS_ENABLED': '1', **env},
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_metrics_need_admin_without_a_token(tmp_path):
+    out = _run(tmp_path)
+    assert (out['anonymous'], out['student'], out['admin']) == (403, 403, 200)
+    assert out['bearer'] == 403
+
+
+def test_metrics_token_gates_scrapes(tmp_path):
+    out = _run(tmp_path, METRICS_TOKEN='s3cret')
+    assert out['anonymous'] == 401
+    assert out['admin'] == 401
+    assert out['bearer'] == 200
+
+
+def test_helpers_and_batcher_writes_are_counted(tmp_path):
+    out = _run(tmp_path)
+    # The batcher resolves its writer at flush time, so it goes through the wrapped helper and still writes
+    assert out['marked'] is True and out['in_db'] == ['S001']
+    calls, statements = out['helpers']['mark_session_attendance_many']
+    assert calls == 1 and statements >= 1
+    assert out['helpers']['student_subject_summary'][0] == 1
+    assert out['requests']['/student/subjects GET'] == 1
+    assert 'attendance_db_helper_sql_statements_total{helper="mark_session_attendance_many"}' in out['text']
+    assert 'attendance_request_duration_seconds_count{endpoint="/student/subjects",method="GET"} 1' in out['text']
@@ -0,0 +1,34 @@
+from conftest import add_users
+
+
+def _walk(db, **kwargs):
+    seen, after = [], None
+    while True:
+        rows, after = db.page_students(after, **kwargs)
+        seen += [r[0] for r in rows]
+        if after is None:
+            return seen
+
+
+def test_page_students_covers_null_rolls(tmp_db):
+    add_users(*[(f'N{i:03d}', f'No Roll {i}', None, 'student') for i in range(60)])
+    add_users(*[(f'S{i:03d}', f'Student {i}', f'R{i:03d}', 'student') for i in range(70)])
+    add_users(('F001', 'Fay', '', 'faculty'))
+    seen = _walk(tmp_db, limit=25)
+    assert len(seen) == len(set(seen)) == 130
+    assert seen[:60] == [f'N{i:03d}' for i in range(60)]
+
+
+def test_page_students_search_with_null_rolls(tmp_db):
+    add_users(*[(f'N{i:03d}', f'Match {i}', None, 'student') for i in range(12)])
+    add_users(*[(f'S{i:03d}', f'Match {i}', f'R{i:03d}', 'student') for i in range(12)])
+    assert len(set(_walk(tmp_db, limit=5, search='Match'))) == 24
+
+
+def test_page_students_uses_rollkey_index(tmp_db):
+    plan = tmp_db.get_conn().execute('''
+        EXPLAIN QUERY PLAN SELECT id, name, roll, email FROM users
+        WHERE role = 'student' AND (COALESCE(roll, ''), id) > (?, ?)
+        ORDER BY COALESCE(roll, ''), id LIMIT 51
+    ''', ('R1', 'S1')).fetchall()
+    assert any('idx_users_role_rollkey_id' in row[-1] for row in plan)
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+import passwords
+from passwords import VerifyBusy, _VerifyPool, _default_workers
+
+
+@pytest.mark.parametrize('cpus, workers', [(1, 1), (2, 1), (4, 2), (64, 2)])
+def test_default_verify_workers_leave_cores_for_scans(cpus, workers):
+    assert _default_workers(cpus) == workers
+
+
+def test_saturated_pool_fails_fast(monkeypatch):
+    pool = _VerifyPool(workers=1, max_pending=2)
+    monkeypatch.setattr(passwords, '_pool', pool)
+    release = threading.Event()
+    held = [pool.submit(release.wait, 5) for _ in range(2)]
+    started = time.perf_counter()
+    with pytest.raises(VerifyBusy):
+        passwords.verify_password('pbkdf2:sha256:1$salt$hash', 'pw')
+    assert time.perf_counter() - started < passwords.VERIFY_WAIT + 0.5
+    release.set()
+    for fut in held:
+        fut.result(5)
+    assert pool.rejected == 1
+
+
+def test_counters_are_exact_under_contention():
+    pool = _VerifyPool(workers=1, max_pending=1)
+
+    def bump():
+        for _ in range(20000):
+            pool.count('verified')
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert pool.counts()['verified'] == 160000
@@ -0,0 +1,46 @@
+import qr_payload
+from qr_payload import check_scan, encode_payload, parse_payload
+
+
+def test_static_payload_round_trip():
+    assert parse_payload(encode_payload('S001')) == 'S001'
+    assert parse_payload(encode_payload('s.lower')) == 's.lower'
+
+
+def test_forged_static_tag_is_rejected():
+    payload = encode_payload('S001')
+    assert parse_payload(payload[:-1] + ('A' if payload[-1] != 'A' else 'B')) is None
+
+
+def test_non_ascii_static_tag_is_rejected(monkeypatch):
+    monkeypatch.setattr(qr_payload, 'ACCEPT_STATIC', True)
+    assert parse_payload('SA1:S001:éé') is None
+    assert parse_payload('SA1:S001:ÉÉÉÉÉÉÉÉ') is None
+    assert check_scan('SA1:S001:éé', 1) == (None, 'bad_payload')
+
+
+def test_token_round_trip():
+    from qr_payload import encode_token, verify_token
+    token = encode_token('S001', now=1000.0)
+    assert verify_token(token, now=1000.0)[0] == 'S001'
+
+
+def test_non_ascii_token_window_and_tag_are_rejected():
+    from qr_payload import verify_token
+    assert verify_token('SA2:S001:²:ABCDEFGH') is None
+    assert verify_token('SA2:S001:١٢:ABCDEFGH') is None
+    assert verify_token('SA2:S001:12:éé') is None
+    assert check_scan('SA2:S001:²:ABCD', 1) == (None, 'bad_payload')
+
+
+def test_scan_mark_rejects_unicode_digit_window(client):
+    from conftest import add_users, login
+    add_users(('F001', 'Fay', '', 'faculty'))
+    login(client, 'F001')
+    resp = client.post('/api/scan_mark', json={'payload': 'SA2:S001:²:ABCD', 'session_id': 1})
+    assert resp.status_code == 400
+
+
+def test_static_codes_refused_when_disabled(monkeypatch):
+    monkeypatch.setattr(qr_payload, 'ACCEPT_STATIC', False)
+    assert check_scan(encode_payload('S001'), 1) == (None, 'static_disabled')
@@ -0,0 +1,24 @@
+import pytest
+
+import db
+import query_plans
+
+
+@pytest.fixture
+def synthetic_db(tmp_path, monkeypatch):
+    # Plans only depend on the schema and indexes, not on the row counts
+    monkeypatch.setattr(db, 'DB_PATH', db.DB_PATH)
+    query_plans.build_synthetic_db(str(tmp_path / 'plans.db'), students=500, marks=5000,
+                                   faculties=10, sessions_per_subject=5)
+    yield db
+    db.close_conn()
+
+
+def test_every_helper_has_an_indexed_plan(synthetic_db):
+    assert query_plans.check_plans() == {}
+
+
+def test_index_walk_without_limit_is_reported(synthetic_db):
+    synthetic_db.get_conn().execute('DROP INDEX idx_users_role_id')
+    failures = query_plans.check_plans([('list_faculties', ())])
+    assert 'list_faculties' in failures
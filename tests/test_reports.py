@@ -0,0 +1,39 @@
+import pytest
+
+import reports
+from conftest import add_users
+
+
+@pytest.fixture
+def klass(tmp_db):
+    add_users(('F001', 'Fay', '', 'faculty'),
+              *[(f'S{i:03d}', f'Student {i}', f'R{i:03d}', 'student') for i in range(40)])
+    for i in range(40):
+        tmp_db.upsert_enrollment(f'S{i:03d}', 'F001', 'Physics')
+        if i % 2:
+            tmp_db.upsert_enrollment(f'S{i:03d}', 'F001', 'Chemistry')
+    sessions = [tmp_db.create_session(f'Class {n}', '2024-01-01', 'Physics', 'F001') for n in range(3)]
+    tmp_db.mark_session_attendance_many([(sid, f'S{i:03d}') for sid in sessions[:2] for i in range(0, 40, 3)])
+    return [f'S{i:03d}' for i in range(40)]
+
+
+def test_report_rows_match_single_student_queries(tmp_db, klass):
+    rows = tmp_db.report_rows(klass + ['NOPE'])
+    assert 'NOPE' not in rows
+    for uid in klass:
+        name, stamp, subjects = rows[uid]
+        assert name == tmp_db.get_user(uid)[1]
+        assert stamp == tmp_db.attendance_version(uid)
+        assert subjects == [s[:3] for s in tmp_db.student_subject_summary(uid)]
+        assert (sum(a for _, a, _ in subjects), sum(t for _, _, t in subjects)) == tmp_db.student_attendance_summary(uid)
+
+
+def test_bulk_reports_reuse_one_pool_and_match_single_renders(tmp_db, klass, monkeypatch):
+    monkeypatch.setattr(reports, '_cache', reports.ByteLRU(1 << 20, 0))  # nothing cached: every report renders
+    first = dict(reports.bulk_reports(klass, workers=2))
+    pool = reports._pool
+    assert pool is not None
+    second = dict(reports.bulk_reports(klass, workers=2))
+    assert reports._pool is pool
+    assert first == second
+    assert first[reports.report_filename('S003')] == reports.render_report(reports.report_data('S003'))
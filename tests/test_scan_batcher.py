@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+from scan_batcher import MarkBatcher
+
+
+def test_timed_out_wait_keeps_writer_alive():
+    from asgi import wait_marks
+
+    release = threading.Event()
+
+    def slow_writer(marks):
+        release.wait(5)
+        return [True] * len(marks)
+
+    batcher = MarkBatcher(flush_interval=0, writer=slow_writer)
+
+    async def timed_out():
+        try:
+            await wait_marks(batcher.submit_many([(1, 'S001')]), timeout=0.05)
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    assert asyncio.run(timed_out())
+    release.set()
+    assert batcher.submit(1, 'S002').result(5) is True
+    assert batcher._thread.is_alive()
+
+
+def test_cancelled_future_does_not_kill_writer():
+    release = threading.Event()
+
+    def slow_writer(marks):
+        release.wait(5)
+        return [True] * len(marks)
+
+    batcher = MarkBatcher(flush_interval=0, writer=slow_writer)
+    first = batcher.submit(1, 'S001')
+    first.cancel()
+    release.set()
+    assert batcher.submit(1, 'S002').result(5) is True
+    assert batcher._thread.is_alive()
+
+
+def test_writer_error_fails_batch_only():
+    calls = []
+
+    def flaky_writer(marks):
+        calls.append(marks)
+        if len(calls) == 1:
+            raise RuntimeError('disk full')
+        return [True] * len(marks)
+
+    batcher = MarkBatcher(flush_interval=0, writer=flaky_writer)
+    failed = batcher.submit(1, 'S001')
+    assert isinstance(failed.exception(5), RuntimeError)
+    assert batcher.submit(1, 'S002').result(5) is True
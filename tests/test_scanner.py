@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+qrcode = pytest.importorskip('qrcode')
+
+import scanner  # noqa: E402
+from qr_payload import encode_payload  # noqa: E402
+
+
+def _qr_frame(payload, x):
+    img = qrcode.make(payload, box_size=6, border=4).convert('L')
+    code = cv2.cvtColor(np.array(img, dtype=np.uint8), cv2.COLOR_GRAY2BGR)
+    frame = np.full((360, 640, 3), 255, dtype=np.uint8)
+    frame[20:20 + code.shape[0], x:x + code.shape[1]] = code
+    return frame
+
+
+def test_roi_regions_age_on_the_given_frame_time(monkeypatch):
+    decoder = scanner.FrameDecoder('roi')
+    box = np.array([[10, 10], [50, 10], [50, 50], [10, 50]], dtype=np.float32)
+    monkeypatch.setattr(decoder, '_detect_multi', lambda img, dx, dy, scale: [('SA1:X:Y', box)])
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+    decoder.decode(frame, now=100.0)
+    assert decoder.regions and decoder.regions[0][4] == 100.0 + scanner.ROI_TTL
+    monkeypatch.setattr(decoder, '_detect_multi', lambda img, dx, dy, scale: [])
+    decoder.decode(frame, now=100.0 + scanner.ROI_TTL + 0.1)
+    assert decoder.regions == []
+
+
+def test_video_segments_do_not_share_tracking(tmp_path, monkeypatch):
+    monkeypatch.setattr(scanner, 'SCAN_MODE', 'roi')
+    path = str(tmp_path / 'clip.avi')
+    fps = 10.0
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (640, 360))
+    left, right = encode_payload('S001'), encode_payload('S002')
+    for i in range(20):
+        writer.write(_qr_frame(left, 10) if i < 10 else _qr_frame(right, 440))
+    writer.release()
+
+    made = []
+    real = scanner.FrameDecoder
+    monkeypatch.setattr(scanner, 'FrameDecoder', lambda *a: made.append(real(*a)) or made[-1])
+    _, first = scanner._decode_video_segment((path, 0, 10, fps))
+    _, second = scanner._decode_video_segment((path, 10, 20, fps))
+    assert len(made) == 2
+    assert {p for _, p in first} == {left}
+    # The code on the right is found on the segment's first frame, not after a stale-region delay
+    assert second[0] == (1.0, right)
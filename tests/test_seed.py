@@ -0,0 +1,42 @@
+import pytest
+
+
+def test_seed_demo_runs_once(tmp_db, monkeypatch):
+    import passwords
+    assert tmp_db.seed_demo_data() is True
+    tmp_db.set_user_password('jaga', 'changed-hash')
+
+    def no_hashing(password):
+        raise AssertionError('seed_demo re-hashed passwords on a seeded database')
+
+    monkeypatch.setattr(passwords, 'hash_password', no_hashing)
+    assert tmp_db.seed_demo_data() is False
+    assert tmp_db.get_user_auth('jaga')[5] == 'changed-hash'
+
+
+def test_seed_demo_force_reloads(tmp_db):
+    tmp_db.seed_demo_data()
+    tmp_db.set_user_password('jaga', 'changed-hash')
+    assert tmp_db.seed_demo_data(force=True) is True
+    assert tmp_db.get_user_auth('jaga')[5] != 'changed-hash'
+
+
+@pytest.mark.parametrize('counts', [{'faculties': 0}, {'students': -1}, {'subjects': 0},
+                                    {'sessions_per_subject': 0}, {'marked_sessions': -1}, {'faculties': 2.5}])
+def test_seed_rejects_bad_counts(tmp_db, counts):
+    with pytest.raises(ValueError):
+        tmp_db.seed_demo_data(force=True, **counts)
+
+
+@pytest.mark.parametrize('args', [['--faculties', '0'], ['--students', '-3'], ['--sessions', 'ten'],
+                                  ['--marked', '-1'], ['--students']])
+def test_cli_seed_rejects_bad_counts(tmp_db, args, capsys, monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'seed_demo_data', lambda **kw: pytest.fail('seeded with bad counts'))
+    main.cmd_seed_demo(args)
+    assert capsys.readouterr().out.strip()
+
+
+def test_default_admin_follows_password_policy(tmp_db):
+    import passwords
+    assert not passwords.needs_rehash(tmp_db.get_user_auth('jaga')[5])
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import add_users, login
+
+
+@pytest.fixture
+def roster(tmp_db):
+    add_users(('F001', 'Fay', '', 'faculty'), ('F002', 'Gus', '', 'faculty'),
+              ('S001', 'Ann', 'R1', 'student'), ('S002', 'Bob', 'R2', 'student'),
+              ('S003', 'Cy', 'R3', 'student'))
+    tmp_db.upsert_enrollment('S001', 'F001', 'Physics')
+    tmp_db.upsert_enrollment('S002', 'F001', 'Physics')
+    tmp_db.upsert_enrollment('S003', 'F002', 'Physics')  # same subject, another faculty's class
+    return tmp_db.create_session('Lab 1', '2024-01-01', 'Physics', 'F001')
+
+
+def test_present_set_marks_only_roster_students(tmp_db, roster):
+    assert tmp_db.set_session_attendance(roster, ['S001']) == (['S001'], [])
+    assert tmp_db.set_session_attendance(roster, ['S002']) == (['S002'], ['S001'])
+    assert tmp_db.list_session_marks(roster) == ['S002']
+
+
+@pytest.mark.parametrize('body', [
+    {'present': ['NOPE', 'F002']},
+    {'present': ['S001', 'S003']},
+    {'mark': ['F001']},
+    {'unmark': ['NOPE']},
+])
+def test_foreign_and_unknown_ids_are_refused(client, tmp_db, roster, body):
+    tmp_db.set_session_attendance(roster, ['S001'])
+    login(client, 'F001')
+    resp = client.post(f'/faculty/session/{roster}/attendance', json=body)
+    assert resp.status_code == 400
+    data = resp.get_json()
+    assert data['error'] == 'unknown_ids'
+    sent = set(body.get('present', []) + body.get('mark', []) + body.get('unmark', []))
+    assert set(data['ids']) == sent - {'S001'}
+    assert tmp_db.list_session_marks(roster) == ['S001']
+
+
+def test_bulk_endpoint_applies_roster_diff(client, tmp_db, roster):
+    login(client, 'F001')
+    resp = client.post(f'/faculty/session/{roster}/attendance', json={'mark': ['S001', 'S002'], 'unmark': []})
+    assert resp.get_json() == {'ok': True, 'session_id': roster, 'marked': ['S001', 'S002'], 'unmarked': []}
+    resp = client.post(f'/faculty/session/{roster}/attendance', json={'present': []})
+    assert resp.get_json()['unmarked'] == ['S001', 'S002']